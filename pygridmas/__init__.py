@@ -1,5 +1,22 @@
 from pygridmas.vec2d import Vec2D
-from pygridmas.world import World
+from pygridmas.world import World, PENDING
 from pygridmas.agent import Agent
-from pygridmas.vis import Visualizer
+from pygridmas.population import Population
 import pygridmas.colors as Colors
+from pygridmas.experiment import run_replicas
+from pygridmas.recorder import Recorder, Recording, ReplayWorld
+from pygridmas.export import FrameExporter, render_world
+from pygridmas.partition import PartitionedWorld
+from pygridmas.layers import Layer
+
+
+def __getattr__(name):
+    # The visualizer needs pyglet and a display,
+    # so headless runs only import it when it is used.
+    if name == 'Visualizer':
+        from pygridmas.vis import Visualizer
+        return Visualizer
+    if name == 'RemoteVisualizer':
+        from pygridmas.vis import RemoteVisualizer
+        return RemoteVisualizer
+    raise AttributeError("module 'pygridmas' has no attribute '{}'".format(name))
@@ -1,24 +1,182 @@
 from typing import List, Union
 import math
-import random
 
 from pygridmas.vec2d import Vec2D
 import pygridmas.colors as Colors
 from pygridmas.world import World
+from pygridmas.groups import GroupSet
 
 
-class Agent:
-    idx = None
-    color = Colors.GREY50
-    group_ids = set()
-    group_collision_ids = set()
-    world: World = None
+# slot defaults which subclasses set as class attributes
+DEFAULTS = ('color', 'group_ids', 'group_collision_ids', 'subscriptions', 'step_period')
+
+
+def class_default(name):
+    def get(cls):
+        return cls.defaults[name]
+
+    def set(cls, value):
+        cls.set_default(name, value)
+
+    return property(get, set)
+
+
+class AgentType(type):
+    """
+    Moves the defaults set as class attributes, e.g. color = Colors.RED,
+    to the class' 'defaults', as class attributes would hide the slots and
+    properties of the instances. They stay readable and settable on the
+    class, e.g. MyAgent.color = Colors.BLUE changes the default afterwards.
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        own = {}
+        for key in DEFAULTS:
+            value = namespace.get(key)
+            # properties of subclasses replace the slots instead
+            if key in namespace and not hasattr(type(value), '__get__'):
+                own[key] = namespace.pop(key)
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        cls.own_defaults = set(own)
+        cls.defaults = dict(cls.defaults)
+        for key, value in own.items():
+            cls.defaults[key] = GroupSet(value) if key in ('group_ids', 'group_collision_ids') else value
+        return cls
+
+    def set_default(cls, name, value):
+        if name in ('group_ids', 'group_collision_ids'):
+            value = GroupSet(value)
+        cls.own_defaults.add(name)
+        # subclasses inherit it unless they set their own
+        classes = [cls]
+        while classes:
+            c = classes.pop()
+            c.defaults[name] = value
+            classes += [sub for sub in c.__subclasses__() if name not in sub.own_defaults]
+
+
+for _name in DEFAULTS:
+    setattr(AgentType, _name, class_default(_name))
+
+
+class Agent(metaclass=AgentType):
+    # The base attributes are slots. Subclasses get a __dict__ for their own
+    # attributes as usual, or can declare __slots__ to save memory.
+    __slots__ = ('idx', 'world', '_color', '_group_ids', '_group_collision_ids', 'subscriptions', '_step_period',
+                 '__weakref__')
+    world: World
+    # Defaults of the slots. Subclasses set them as class attributes,
+    # e.g. color = Colors.RED, which are moved here by AgentType.
+    # subscriptions: event types handled in 'receive_event', None for all event types
+    # step_period: the agent is stepped every 'step_period' steps
+    defaults = dict(
+        idx=None, world=None, color=Colors.GREY50,
+        group_ids=GroupSet(), group_collision_ids=GroupSet(), subscriptions=None, step_period=1,
+    )
+
+    # attributes stored in world snapshots, e.g. fields = ('energy',)
+    fields = ()
+
+    def __new__(cls, *args, **kwargs):
+        # the slots start with the defaults, so values assigned in a subclass'
+        # __init__ before calling Agent.__init__ are kept
+        # (written through the slot descriptors, subclasses may replace them with properties)
+        self = object.__new__(cls)
+        defaults = cls.defaults
+        for slot, name in SLOT_DEFAULTS:
+            slot.__set__(self, defaults[name])
+        return self
 
     def __init__(self):
         # since set is a mutable data type, make sure that
         # each agent instance gets a new copy of the sets
-        self.group_ids = set(self.group_ids)
-        self.group_collision_ids = set(self.group_collision_ids)
+        self._group_ids = GroupSet(self._group_ids, self)
+        self._group_collision_ids = GroupSet(self._group_collision_ids)
+        subscriptions = self.subscriptions
+        if subscriptions is not None:
+            self.subscriptions = set(subscriptions)
+
+    @property
+    def color(self):
+        try:
+            return self._color
+        except AttributeError:
+            return self.defaults['color']
+
+    @color.setter
+    def color(self, color):
+        # observers, e.g. renderers, are told about color changes
+        self._color = color
+        if self.world is not None and self.world.observers:
+            self.world.color_changed(self)
+
+    @property
+    def group_ids(self):
+        try:
+            return self._group_ids
+        except AttributeError:
+            return self.defaults['group_ids']
+
+    @group_ids.setter
+    def group_ids(self, group_ids):
+        # a GroupSet reports changes of the groups to the world
+        try:
+            old = self._group_ids
+        except AttributeError:
+            old = GroupSet()
+        new = self._group_ids = GroupSet(group_ids, self)
+        world = self.world
+        if world is not None and new.mask != old.mask:
+            if world.observers:
+                world.group_changed(self, new.difference(old), set(old).difference(new), old.mask)
+            else:
+                world.group_changed(self, (), (), old.mask)
+
+    @property
+    def group_collision_ids(self):
+        try:
+            return self._group_collision_ids
+        except AttributeError:
+            return self.defaults['group_collision_ids']
+
+    @group_collision_ids.setter
+    def group_collision_ids(self, group_ids):
+        # a copy, with the bitmask tested against the cells' group masks
+        self._group_collision_ids = GroupSet(group_ids)
+
+    @property
+    def step_period(self):
+        try:
+            return self._step_period
+        except AttributeError:
+            return self.defaults['step_period']
+
+    @step_period.setter
+    def step_period(self, step_period):
+        # the world's scheduler keeps the agents not stepped every step
+        self._step_period = step_period
+        if self.world is not None:
+            self.world.scheduler.set_period(self.idx, step_period)
+
+    def __setstate__(self, state):
+        # pickle and copy restore the slots, the GroupSet of the group ids
+        # reports its changes to the agent, which it does not pickle
+        d, slots = state if isinstance(state, tuple) else (state, None)
+        if d:
+            self.__dict__.update(d)
+        for name, value in (slots or {}).items():
+            setattr(self, name, value)
+        group_ids = slots and slots.get('_group_ids')
+        if group_ids is not None:
+            group_ids.agent = self
+
+    def __getattr__(self, name):
+        # only called for slots which were never set,
+        # e.g. if a subclass' __init__ does not call Agent.__init__
+        try:
+            return type(self).defaults[name]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name)) from None
 
     # handlers to be implemented in agents
     def initialize(self):
@@ -30,12 +188,16 @@ class Agent:
     def receive_event(self, event_type, data):
         pass
 
+    def move_resolved(self, moved):
+        # in synchronous worlds, whether the move recorded in the step was applied
+        pass
+
     def cleanup(self):
         pass
 
     # util functions
     def pos(self) -> Vec2D:
-        return self.world.agent_pos[self.idx]
+        return self.world.positions[self.idx]
 
     def move_to(self, pos) -> bool:
         return self.world.move_agent(self.idx, pos)
@@ -54,23 +216,51 @@ class Agent:
         c_is_max = cabs > sabs
         if c_is_max: mi, ma = ma, mi
         min_p = mi / ma if ma > 0 else 0
-        move_min = random.random() < min_p
+        move_min = self.world.rng.random() < min_p
         dx, dy = -1 if c < 0 else 1, -1 if s < 0 else 1
         if not move_min:
             if c_is_max:
                 dy = 0
             else:
                 dx = 0
-        return self.move_rel(Vec2D(dx, dy))
+        return self.move_rel(Vec2D.grid_dir(dx, dy))
 
     def move_towards(self, pos: Vec2D):
-        dir = self.vec_to(pos)
-        return self.move_in_dir(dir)
+        x, y = self.pos()
+        dx, dy = self.world.shortest_way_xy(x, y, pos.x, pos.y)
+        if dx == dy == 0:
+            return self.move_rel(Vec2D.grid_dir(0, 0))
+        return self.move_in_dir(math.atan2(dy, dx))
+
+    def navigate(self, targets=None, group_id=None, diagonal=1):
+        """
+        A move towards the nearest of 'targets' or agent of 'group_id' along
+        a flow field shared with the other agents heading there. The field
+        leads around the agents of the collision groups which are not the
+        agent's own groups. Returns False at a target, if the targets are
+        unreachable, or if all moves closer to them are blocked.
+        """
+        obstacles = self.group_collision_ids.difference(self.group_ids)
+        field = self.world.get_navigation().field(targets, group_id, obstacles, diagonal)
+        return self.move_along(field)
+
+    def move_along(self, field):
+        x, y = self.pos()
+        move = field.move_at(x, y)
+        if move.x == 0 and move.y == 0:
+            return False
+        if self.move_rel(move):
+            return True
+        # blocked, e.g. by agents following the same field
+        for move in field.detours(x, y):
+            if self.move_rel(move):
+                return True
+        return False
 
     def move_away_from(self, pos: Vec2D):
         dir = self.world.shortest_way(pos, self.pos())
         if dir.is_zero_vec():
-            return self.move_in_dir(Vec2D.random_grid_dir())
+            return self.move_in_dir(Vec2D.random_grid_dir(self.world.rng))
         else:
             return self.move_in_dir(dir)
 
@@ -81,15 +271,66 @@ class Agent:
             agents.remove(self)
         return agents
 
-    def emit_event(self, rng, event_type, data=None, group_id=None):
-        agents = self.box_scan(rng, group_id, sort=False)
-        self.world.emit_event(agents, event_type, data)
+    def first_match(self, rng, predicate):
+        return self.world.first_match(self.pos(), rng, lambda agent: agent is not self and predicate(agent))
+
+    def nearest(self, rng, group_id=None, metric='chebyshev'):
+        return self.world.nearest(self.pos(), rng, group_id, metric, predicate=lambda agent: agent is not self)
+
+    def k_nearest(self, k, metric='chebyshev', rng=None, group_id=None):
+        return self.world.k_nearest(self.pos(), k, metric, rng, group_id, predicate=lambda agent: agent is not self)
+
+    def count_in_box(self, rng, group_id=None):
+        # like len(self.box_scan(rng, group_id)), but from the count grids, see World.count_in_box
+        n = self.world.count_in_box(self.pos(), rng=rng, group_id=group_id)
+        if group_id is None or group_id in self.group_ids:
+            n -= 1
+        return n
+
+    def emit_event(self, rng, event_type, data=None, group_id=None, coalesce=False):
+        # the receivers within range are found at the end of the step
+        self.world.events.emit_at(self.pos(), rng, event_type, data, group_id, sender=self, coalesce=coalesce)
+
+    def broadcast(self, group_id, event_type, data=None):
+        # to all agents of a group, wherever they are
+        self.world.broadcast(group_id, event_type, data, sender=self)
+
+    def send_event(self, idx, event_type, data=None):
+        self.world.send_event(idx, event_type, data)
+
+    def subscribe(self, *event_types):
+        # an agent receives all event types until it subscribes to specific ones
+        if self.world is not None and self.subscriptions is None:
+            self.world.events.remove(self)
+        if self.subscriptions is None:
+            self.subscriptions = set()
+        self.subscriptions.update(event_types)
+        if self.world is not None:
+            self.world.events.add(self, event_types)
+
+    def unsubscribe(self, *event_types):
+        if self.subscriptions is None:
+            return
+        self.subscriptions.difference_update(event_types)
+        if self.world is not None:
+            self.world.events.remove(self, event_types)
+
+    def sleep(self, n_steps=None, wake_on_event=True):
+        # skip the next 'n_steps' steps (all if None), or until an event is received
+        self.world.sleep_agent(self.idx, n_steps, wake_on_event)
+
+    def wake(self):
+        self.world.wake_agent(self.idx)
+
+    def is_awake(self):
+        return self.world.scheduler.is_awake(self.idx)
 
     def activate(self):
-        self.world.active_agents[self.idx] = self
+        self.wake()
 
     def deactivate(self):
-        self.world.active_agents.pop(self.idx, None)
+        # unlike sleep, only 'activate' wakes the agent up again
+        self.sleep(wake_on_event=False)
 
     def vec_to(self, pos: Vec2D):
         return self.world.shortest_way(self.pos(), pos)
@@ -99,3 +340,6 @@ class Agent:
 
     def inf_dist(self, pos: Vec2D):
         return self.vec_to(pos).inf_magnitude()
+
+
+SLOT_DEFAULTS = tuple((Agent.__dict__[slot], slot.lstrip('_')) for slot in Agent.__slots__ if slot != '__weakref__')
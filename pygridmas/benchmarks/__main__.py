@@ -0,0 +1,49 @@
+"""
+Headless benchmarks of the example scenarios.
+
+    $ python -m pygridmas.benchmarks --sweep --output results.json
+    $ python -m pygridmas.benchmarks --sweep --baseline results.json
+
+Exits with status 1 if a case is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+
+from pygridmas.benchmarks.suite import run_suite, compare
+from pygridmas.benchmarks.workloads import WORKLOADS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pygridmas.benchmarks')
+    parser.add_argument('workloads', nargs='*',
+                        help='workloads to run, all by default: ' + ', '.join(WORKLOADS))
+    parser.add_argument('--sweep', action='store_true', help='also vary each parameter in turn')
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case, the fastest is kept')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--baseline', help='compare against the results in this json file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slow down relative to the baseline')
+    args = parser.parse_args(argv)
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error("unknown workload '{}'".format(name))
+
+    results = run_suite(args.workloads, args.sweep, args.steps, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print()
+        print('\n'.join(lines))
+        if regressions:
+            print('{} regression(s)'.format(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Runs the workloads and compares results against a baseline.
+Each case runs in a fresh process, so the peak memory is its own.
+"""
+import io
+import json
+import multiprocessing
+import platform
+import sys
+import time
+
+from pygridmas import World
+from pygridmas.benchmarks.workloads import WORKLOADS
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def run_case(name, params, steps):
+    """builds a workload and steps it, returns a result dict"""
+    workload = WORKLOADS[name][0]
+    rss = peak_rss_mb()
+    t = time.perf_counter()
+    world = workload(**params)
+    build = time.perf_counter() - t
+    n = len(world.agents)
+    # sleeping agents and agents with a step period > 1 are not stepped every step
+    agent_steps = 0
+    t = time.perf_counter()
+    for _ in range(steps):
+        world.step()
+        agent_steps += world.n_stepped
+    dt = time.perf_counter() - t
+    # before the copies of the world made to time fork and restore
+    mem = peak_rss_mb() - rss
+    t = time.perf_counter()
+    world.fork()
+    fork = time.perf_counter() - t
+    f = io.BytesIO()
+    world.snapshot(f)
+    f.seek(0)
+    t = time.perf_counter()
+    World.restore(f)
+    restore = time.perf_counter() - t
+    t = time.perf_counter()
+    world.end()
+    end = time.perf_counter() - t
+    return dict(
+        workload=name, params=params, steps=steps, agents=n,
+        build_s=build, end_s=end, fork_s=fork, restore_s=restore,
+        steps_per_s=steps / dt, agent_steps_per_s=agent_steps / dt, peak_mem_mb=mem,
+    )
+
+
+def cases(names=None, sweep=False):
+    """(name, params) of the default parameters and, with 'sweep', each swept value of one parameter at a time"""
+    for name in names or WORKLOADS:
+        _, defaults, swept = WORKLOADS[name]
+        yield name, dict(defaults)
+        if sweep:
+            for param, values in swept.items():
+                for value in values:
+                    yield name, dict(defaults, **{param: value})
+
+
+def run_suite(names=None, sweep=False, steps=100, repeat=1, log=print):
+    """Runs the cases, each 'repeat' times in a fresh process, keeping the fastest run."""
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for name, params in cases(names, sweep):
+        best = None
+        for _ in range(repeat):
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run_case, (name, params, steps))
+            if best is None or result['steps_per_s'] > best['steps_per_s']:
+                best = result
+        if log is not None:
+            log(format_result(best))
+        results.append(best)
+    return dict(
+        meta=dict(python=platform.python_version(), platform=platform.platform(),
+                  time=time.strftime('%Y-%m-%dT%H:%M:%S'), steps=steps, repeat=repeat),
+        results=results,
+    )
+
+
+def case_key(result):
+    return result['workload'], json.dumps(result['params'], sort_keys=True)
+
+
+def format_params(params):
+    return ' '.join('{}={}'.format(k, v) for k, v in params.items())
+
+
+def format_result(result):
+    return '{:10s} {:48s} {:9.1f} steps/s {:11.0f} agent steps/s {:7.1f} MB {:6.3f} s restore'.format(
+        result['workload'], format_params(result['params']), result['steps_per_s'],
+        result['agent_steps_per_s'], result['peak_mem_mb'], result['restore_s'])
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Lines comparing the steps per second of the cases found in both result sets,
+    and the number of cases more than 'tolerance' slower than the baseline.
+    """
+    base = {case_key(result): result for result in baseline['results']}
+    lines, regressions = [], 0
+    for result in results['results']:
+        old = base.get(case_key(result))
+        if old is None:
+            continue
+        ratio = result['steps_per_s'] / old['steps_per_s']
+        slower = ratio < 1 - tolerance
+        regressions += slower
+        lines.append('{:10s} {:48s} {:9.1f} -> {:9.1f} steps/s ({:+.0%}){}'.format(
+            result['workload'], format_params(result['params']), old['steps_per_s'],
+            result['steps_per_s'], ratio - 1, '  REGRESSION' if slower else ''))
+    return lines, regressions
@@ -0,0 +1,88 @@
+"""
+Microbenchmark of the Vec2D allocations per agent step.
+Exits with an error if an agent step allocates more than its bound.
+
+    $ python -m pygridmas.benchmarks.vec2d_alloc
+"""
+import sys
+import time
+
+from pygridmas import World, Agent, Vec2D
+
+
+class Walker(Agent):
+    group_ids = {0}
+    group_collision_ids = {0}
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+
+
+class Seeker(Agent):
+    target = Vec2D(10, 10)
+
+    def step(self):
+        self.move_towards(self.target)
+
+
+class DictVec2D:
+    # the layout of Vec2D before it became a slotted tuple
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+
+# upper bounds on the Vec2D allocations per agent step. Before the integer
+# move fast paths, the random walker allocated 2.01 and the seeker 2.34
+MAX_ALLOCATIONS = {
+    Walker: 1.0,
+    Seeker: 1.0,
+}
+
+
+def count_allocations(world, steps):
+    count = [0]
+    new = Vec2D.__new__
+
+    def counting_new(cls, x=0, y=0):
+        count[0] += 1
+        return new(cls, x, y)
+
+    Vec2D.__new__ = counting_new
+    try:
+        for _ in range(steps):
+            world.step()
+    finally:
+        Vec2D.__new__ = new
+    return count[0]
+
+
+def run(agent_class, n=1000, steps=100, size=100):
+    world = World(size, size, torus_enabled=True, seed=0)
+    for _ in range(n):
+        world.add_agent(agent_class())
+    allocations = count_allocations(world, steps)
+    start = time.perf_counter()
+    for _ in range(steps):
+        world.step()
+    dt = time.perf_counter() - start
+    return allocations / (n * steps), dt / (n * steps) * 1e6
+
+
+def main():
+    v, d = Vec2D(1, 2), DictVec2D(1, 2)
+    print('bytes per vector: Vec2D {}, dict based {}'.format(
+        sys.getsizeof(v), sys.getsizeof(d) + sys.getsizeof(d.__dict__)))
+    exceeded = []
+    for agent_class, bound in MAX_ALLOCATIONS.items():
+        allocations, us = run(agent_class)
+        print('{:8s} Vec2D allocations per agent step: {:.2f} (max {:.2f}), us per agent step: {:.2f}'.format(
+            agent_class.__name__, allocations, bound, us))
+        if allocations > bound:
+            exceeded.append(agent_class.__name__)
+    if exceeded:
+        sys.exit('more Vec2D allocations than allowed: ' + ', '.join(exceeded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+The scenarios of the examples as headless, parameterized worlds.
+Each workload is a function of keyword parameters returning a World,
+listed in WORKLOADS with its default parameters and the values swept.
+"""
+import colorsys
+import math
+
+from pygridmas import World, Agent, Vec2D, Colors
+
+
+class Canvas(Agent):
+    # examples/brush.py
+    color = Colors.BLACK
+    subscriptions = {"PAINT"}
+    brush_radius = 5
+
+    def initialize(self):
+        self.deactivate()
+
+    def receive_event(self, event_type, data):
+        dir = -self.vec_to(data)
+        dist = dir.magnitude()
+        hue = (dir.angle() + self.world.time * 0.1) % (math.pi * 2) / (2 * math.pi)
+        if dist < self.brush_radius:
+            self.color = colorsys.hsv_to_rgb(hue, 1, 1)
+        if dist < self.brush_radius * 0.5:
+            self.color = Colors.WHITE
+
+
+class Brush(Agent):
+    color = Colors.WHITE
+    brush_radius = 5
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+        self.emit_event(self.brush_radius, "PAINT", self.pos())
+
+
+def brush(size=100, torus=True, scan_range=5, n=1):
+    """a canvas agent per cell, painted by 'n' brushes with events"""
+    world = World(size, size, torus_enabled=torus, seed=0)
+    Canvas.brush_radius = Brush.brush_radius = scan_range
+    world.add_agents([Canvas() for _ in range(size * size)], 'fill')
+    for _ in range(n):
+        world.add_agent(Brush())
+    return world
+
+
+class Painter(Agent):
+    # examples/paint.py
+    color = Colors.WHITE
+    brush_radius = 5
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+        self.world.layers['paint'].paint_disk(self.pos(), self.brush_radius, Colors.WHITE)
+
+
+def paint(size=100, torus=True, scan_range=5, n=1):
+    """brush with a color layer instead of the canvas agents"""
+    world = World(size, size, torus_enabled=torus, seed=0)
+    world.add_layer('paint', channels=3, decay=0.005)
+    Painter.brush_radius = scan_range
+    for _ in range(n):
+        world.add_agent(Painter())
+    return world
+
+
+class Wall(Agent):
+    # examples/collision.py
+    color = Colors.WHITE
+    group_ids = {0}
+
+
+class Mover(Agent):
+    color = Colors.BLUE
+    group_ids = {1}
+    group_collision_ids = {0, 1}
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+
+
+def collision(size=100, torus=True, n=200):
+    """'n' movers colliding with each other and with walls, starting in one cell"""
+    world = World(size, size, torus_enabled=torus, seed=0)
+    x1, x2 = round(size * 0.3), round(size * 0.7)
+    y1, y2 = round(size * 0.6), round(size * 0.8)
+    for x in (x1, x2):
+        for y in range(y1 + 1):
+            world.add_agent(Wall(), Vec2D(x, y))
+        for y in range(y2, size):
+            world.add_agent(Wall(), Vec2D(x, y))
+    for y in (y1, y2):
+        for x in range(x1 + 1, x2):
+            world.add_agent(Wall(), Vec2D(x, y))
+    for _ in range(n):
+        world.add_agent(Mover(), Vec2D(size // 2, size // 4))
+    return world
+
+
+class Navigator(Mover):
+    # examples/navigation.py
+    target = None
+
+    def step(self):
+        self.navigate(self.target)
+
+
+def navigation(size=100, torus=True, n=500):
+    """'n' movers following a shared flow field around the walls of 'collision'"""
+    world = collision(size, torus, 0)
+    Navigator.target = Vec2D(size // 2, round(size * 0.7))
+    for _ in range(n):
+        world.add_agent(Navigator(), Vec2D(size // 2, size // 4))
+    return world
+
+
+class Prey(Agent):
+    color = Colors.RED
+    group_ids = {2}
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+
+
+class Chaser(Agent):
+    color = Colors.BLUE
+    group_ids = {3}
+
+    def step(self):
+        self.navigate(group_id=2)
+
+
+def chase(size=100, torus=True, n=200, prey=10, capacity=16):
+    """
+    'n' agents following the flow field to 'prey' moving agents, added in
+    between them, so the targets move many times per step.
+    'capacity' 0 disables the field cache.
+    """
+    world = World(size, size, torus_enabled=torus, seed=0)
+    world.get_navigation(capacity)
+    for i in range(n):
+        if i % max(n // prey, 1) == 0:
+            world.add_agent(Prey())
+        world.add_agent(Chaser())
+    return world
+
+
+class Repulser(Agent):
+    # examples/repulser.py, starting at the target
+    color = Colors.YELLOW
+    scan_range = 10
+    sort = False
+
+    def step(self):
+        near_agents = self.box_scan(self.scan_range, sort=self.sort)
+        if near_agents:
+            self.color = Colors.RED
+            if self.world.rng.random() < 0.2:
+                self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+            else:
+                other_agent = self.world.rng.choice(near_agents)
+                self.move_away_from(other_agent.pos())
+        else:
+            self.color = Colors.BLUE
+
+
+def repulser(size=200, torus=True, n=258, scan_range=10, sort=False):
+    """'n' agents scanning their surroundings and moving away from each other"""
+    world = World(size, size, torus_enabled=torus, seed=0)
+    Repulser.scan_range, Repulser.sort = scan_range, sort
+    for _ in range(n):
+        world.add_agent(Repulser(), world.random_pos())
+    return world
+
+
+class RandomlyDyingAgent(Agent):
+    # examples/log.py
+    def step(self):
+        if self.world.rng.random() < 0.01:
+            self.world.remove_agent(self.idx)
+
+
+def dying(size=100, torus=False, n=10000):
+    """'n' agents without behavior, removed at random"""
+    world = World(size, size, torus_enabled=torus, seed=0)
+    world.add_agents([RandomlyDyingAgent() for _ in range(n)])
+    return world
+
+
+# name -> (workload, default parameters, swept parameters)
+WORKLOADS = {
+    'brush': (brush, dict(size=100, torus=True, scan_range=5, n=1),
+              dict(size=[50, 200], torus=[False], scan_range=[2, 10], n=[10])),
+    'paint': (paint, dict(size=100, torus=True, scan_range=5, n=1),
+              dict(size=[50, 200], torus=[False], scan_range=[2, 10], n=[10])),
+    'collision': (collision, dict(size=100, torus=True, n=200),
+                  dict(size=[400], torus=[False], n=[1000, 5000])),
+    'navigation': (navigation, dict(size=100, torus=True, n=500),
+                   dict(size=[400], torus=[False], n=[5000])),
+    'chase': (chase, dict(size=100, torus=True, n=200, prey=10, capacity=16),
+              dict(size=[200], n=[1000], prey=[1, 50], capacity=[0])),
+    'repulser': (repulser, dict(size=200, torus=True, n=258, scan_range=10, sort=False),
+                 dict(size=[100, 400], torus=[False], n=[1000, 4000], scan_range=[2, 20], sort=[True])),
+    'dying': (dying, dict(size=100, torus=False, n=10000),
+              dict(n=[100000])),
+}
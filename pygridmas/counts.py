@@ -0,0 +1,190 @@
+import numpy as np
+
+from pygridmas.observer import WorldObserver
+
+
+def spans(lo, hi, n, torus):
+    """half-open index ranges covering [lo, hi) on an axis of length n, each index once"""
+    if not torus:
+        return [(max(lo, 0), min(hi, n))]
+    if hi - lo >= n:
+        return [(0, n)]
+    a = lo % n
+    b = a + hi - lo
+    if b <= n:
+        return [(a, b)]
+    return [(a, n), (0, b - n)]
+
+
+class GroupCounts(WorldObserver):
+    """
+    Per-group h x w occupancy count grids, kept up to date as agents are
+    added, moved and removed. Population members are counted from the
+    populations' own cell index. Range counts are answered from summed-area
+    tables. A change only marks the group's table stale: until it is rebuilt,
+    counts sum the box from the grid, and the table is rebuilt once the
+    cells summed since the last rebuild add up to its cost (w * h).
+    With agents moving between counts, a count thus costs about its box area.
+    The group id None counts all agents.
+    A group is tracked from the first time it is queried, or by 'track'.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.grids = {}
+        self.sats = {}
+        # group id -> cells summed from the grid since its table was rebuilt
+        self.scanned = {}
+
+    def track(self, group_id):
+        if group_id in self.grids:
+            return self.grids[group_id]
+        world = self.world
+        grid = np.zeros((world.h, world.w), dtype=np.int32)
+        for _, agent, pos in world.agents.placed():
+            if group_id is None or group_id in agent.group_ids:
+                grid[pos.y, pos.x] += 1
+        self.grids[group_id] = grid
+        return grid
+
+    def untrack(self, group_id):
+        self.grids.pop(group_id, None)
+        self.sats.pop(group_id, None)
+        self.scanned.pop(group_id, None)
+
+    def update(self, agent, pos, d):
+        grids = self.grids
+        for group_id in agent.group_ids:
+            grid = grids.get(group_id)
+            if grid is not None:
+                grid[pos.y, pos.x] += d
+                self.sats.pop(group_id, None)
+        grid = grids.get(None)
+        if grid is not None:
+            grid[pos.y, pos.x] += d
+            self.sats.pop(None, None)
+
+    def on_add(self, agent, pos):
+        if pos is not None:
+            self.update(agent, pos, 1)
+
+    def on_remove(self, agent, pos):
+        if pos is not None:
+            self.update(agent, pos, -1)
+
+    def on_move(self, agent, old_pos, new_pos):
+        self.update(agent, old_pos, -1)
+        self.update(agent, new_pos, 1)
+
+    def on_group_change(self, agent, pos, added, removed):
+        if pos is None:
+            return
+        for group_ids, d in ((added, 1), (removed, -1)):
+            for group_id in group_ids:
+                grid = self.grids.get(group_id)
+                if grid is not None:
+                    grid[pos.y, pos.x] += d
+                    self.sats.pop(group_id, None)
+
+    def population_changed(self, population):
+        self.sats.pop(None, None)
+        for group_id in population.group_ids:
+            self.sats.pop(group_id, None)
+
+    def sat(self, group_id):
+        # sat[y, x] is the number of agents in [0, x) x [0, y)
+        sat = self.sats.get(group_id)
+        if sat is None:
+            # the grids hold the regular agents, populations are added here
+            grid = self.track(group_id)
+            for population in self.world.populations:
+                if group_id is None or group_id in population.group_ids:
+                    grid = grid + population.count_grid()
+            h, w = grid.shape
+            sat = np.zeros((h + 1, w + 1), dtype=np.int64)
+            np.cumsum(np.cumsum(grid, axis=0), axis=1, out=sat[1:, 1:])
+            self.sats[group_id] = sat
+            self.scanned[group_id] = 0
+        return sat
+
+    def box_sum(self, group_id, x_spans, y_spans):
+        """the number of agents of the group in the spans, summed from the grid"""
+        world = self.world
+        grid = self.track(group_id)
+        n = 0
+        for ylo, yhi in y_spans:
+            for xlo, xhi in x_spans:
+                if ylo < yhi and xlo < xhi:
+                    n += int(grid[ylo:yhi, xlo:xhi].sum())
+        for population in world.populations:
+            if group_id is None or group_id in population.group_ids:
+                cells, _ = population.index()
+                for ylo, yhi in y_spans:
+                    for xlo, xhi in x_spans:
+                        if ylo < yhi and xlo < xhi:
+                            rows = np.arange(ylo, yhi) * world.w
+                            lo = np.searchsorted(cells, rows + xlo, 'left')
+                            hi = np.searchsorted(cells, rows + xhi, 'left')
+                            n += int((hi - lo).sum())
+        return n
+
+    def count(self, x, y, rng, group_id=None):
+        """number of agents of the group in the box of range 'rng' around (x, y)"""
+        world = self.world
+        w, h = world.w, world.h
+        sat = self.sats.get(group_id)
+        if sat is None:
+            torus = world.torus_enabled
+            x_spans = spans(x - rng, x + rng + 1, w, torus)
+            y_spans = spans(y - rng, y + rng + 1, h, torus)
+            area = sum(max(b - a, 0) for a, b in x_spans) * sum(max(b - a, 0) for a, b in y_spans)
+            scanned = self.scanned.get(group_id, 0) + area
+            if scanned < w * h:
+                self.scanned[group_id] = scanned
+                return self.box_sum(group_id, x_spans, y_spans)
+            sat = self.sat(group_id)
+        xlo, xhi = x - rng, x + rng + 1
+        ylo, yhi = y - rng, y + rng + 1
+        if world.torus_enabled:
+            if rng * 2 + 1 > w:
+                xlo, xhi = 0, w
+            if rng * 2 + 1 > h:
+                ylo, yhi = 0, h
+        else:
+            xlo, xhi = max(xlo, 0), min(xhi, w)
+            ylo, yhi = max(ylo, 0), min(yhi, h)
+        total = int(sat[h, w])
+
+        def f(xx, yy):
+            qx, rx = divmod(xx, w)
+            qy, ry = divmod(yy, h)
+            return qx * qy * total + qx * int(sat[ry, w]) + qy * int(sat[h, rx]) + int(sat[ry, rx])
+
+        return f(xhi, yhi) - f(xlo, yhi) - f(xhi, ylo) + f(xlo, ylo)
+
+    def count_many(self, x, y, rng, group_id=None):
+        """vectorized 'count' for arrays of box centers, always from the summed-area table"""
+        world = self.world
+        w, h = world.w, world.h
+        sat = self.sat(group_id)
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        xlo, xhi = x - rng, x + rng + 1
+        ylo, yhi = y - rng, y + rng + 1
+        if world.torus_enabled:
+            # boxes larger than the world cover each cell once
+            if rng * 2 + 1 > w:
+                xlo, xhi = np.zeros_like(x), np.full_like(x, w)
+            if rng * 2 + 1 > h:
+                ylo, yhi = np.zeros_like(y), np.full_like(y, h)
+        else:
+            xlo, xhi = np.clip(xlo, 0, w), np.clip(xhi, 0, w)
+            ylo, yhi = np.clip(ylo, 0, h), np.clip(yhi, 0, h)
+
+        def f(xx, yy):
+            # prefix count on the periodic tiling of the world
+            qx, rx = np.divmod(xx, w)
+            qy, ry = np.divmod(yy, h)
+            return qx * qy * sat[h, w] + qx * sat[ry, w] + qy * sat[h, rx] + sat[ry, rx]
+
+        return f(xhi, yhi) - f(xlo, yhi) - f(xhi, ylo) + f(xlo, ylo)
@@ -0,0 +1,215 @@
+import numpy as np
+
+
+class EventBus:
+    """
+    Queues the events emitted during a step and delivers them at the end of
+    the step. The receivers of all spatial emissions of an event type are
+    resolved together, against the agents subscribed to that type only.
+    Agents subscribe through 'Agent.subscriptions' (None: all event types).
+    Receiving an event wakes up agents sleeping with 'wake_on_event'.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.queue = []
+        # event type -> {agent: None} (an insertion ordered set)
+        self.subscribers = {}
+        # agents receiving all event types
+        self.all_types = {}
+
+    def add(self, agent, event_types=None):
+        if event_types is None:
+            self.all_types[agent] = None
+        else:
+            for event_type in event_types:
+                self.subscribers.setdefault(event_type, {})[agent] = None
+
+    def add_many(self, agents):
+        subscribers = self.subscribers
+        subscriptions = [agent.subscriptions for agent in agents]
+        self.all_types.update(dict.fromkeys(
+            [agent for agent, event_types in zip(agents, subscriptions) if event_types is None]))
+        for agent, event_types in zip(agents, subscriptions):
+            if event_types:
+                for event_type in event_types:
+                    subscribers.setdefault(event_type, {})[agent] = None
+
+    def remove_many(self, agents):
+        # the agents are registered for their subscriptions, see Agent.subscribe
+        all_types, subscribers = self.all_types, self.subscribers
+        for agent in agents:
+            event_types = agent.subscriptions
+            if event_types is None:
+                all_types.pop(agent, None)
+            else:
+                for event_type in event_types:
+                    subscribers.get(event_type, {}).pop(agent, None)
+        for event_type in [event_type for event_type, agents in subscribers.items() if not agents]:
+            del subscribers[event_type]
+
+    def clear(self):
+        self.subscribers.clear()
+        self.all_types.clear()
+
+    def remove(self, agent, event_types=None):
+        if event_types is None:
+            self.all_types.pop(agent, None)
+            event_types = list(self.subscribers.keys())
+        for event_type in event_types:
+            subscribers = self.subscribers.get(event_type)
+            if subscribers is not None:
+                subscribers.pop(agent, None)
+                if not subscribers:
+                    del self.subscribers[event_type]
+
+    def subscribes(self, receiver, event_type):
+        subscriptions = receiver.subscriptions
+        return subscriptions is None or event_type in subscriptions
+
+    def emit(self, agents, event_type, data=None):
+        """emits an event to the given agents"""
+        if self.world.profiler is not None:
+            self.world.profiler.emitted()
+        self.queue.append((agents, None, event_type, data, False))
+
+    def emit_at(self, pos, rng, event_type, data=None, group_id=None, sender=None, coalesce=False):
+        """
+        Emits an event to the subscribed agents (of a group if given) within 'rng'.
+        With 'coalesce', an agent receiving an identical event (type and data)
+        more than once in a step gets it only once.
+        """
+        if self.world.profiler is not None:
+            self.world.profiler.emitted()
+        self.queue.append((None, (pos.x, pos.y, rng, group_id, sender), event_type, data, coalesce))
+
+    def flush(self):
+        queue, self.queue = self.queue, []
+        if not queue:
+            return
+        by_type = {}
+        for i, (_, spatial, event_type, _, _) in enumerate(queue):
+            if spatial is not None:
+                by_type.setdefault(event_type, []).append(i)
+        receivers = {}
+        for event_type, emissions in by_type.items():
+            self.resolve(event_type, [queue[i][1] for i in emissions], [receivers.setdefault(i, ([], [])) for i in emissions])
+
+        world = self.world
+        scheduler = world.scheduler
+        profiler = world.profiler
+        # sleeping agents waiting for an event
+        on_event = scheduler.on_event
+        seen = set()
+        for i, (agents, _, event_type, data, coalesce) in enumerate(queue):
+            members = []
+            if agents is None:
+                agents, members = receivers[i]
+            if coalesce:
+                agents, members = self.coalesced(seen, agents, members, event_type, data)
+            for agent in agents:
+                if agent.world is world:
+                    if on_event and agent.idx in on_event:
+                        scheduler.wake(agent.idx)
+                    agent.receive_event(event_type, data)
+                    if profiler is not None:
+                        profiler.delivered(agent)
+            for population, idx in members:
+                if population.world is world:
+                    idx = idx[population.alive[idx]]
+                    if len(idx):
+                        population.receive_events(idx, event_type, data)
+                        if profiler is not None:
+                            profiler.delivered(population, len(idx))
+
+    @staticmethod
+    def coalesced(seen, agents, members, event_type, data):
+        try:
+            hash(data)
+        except TypeError:
+            return agents, members
+        _agents = []
+        for agent in agents:
+            key = (id(agent), event_type, data)
+            if key not in seen:
+                seen.add(key)
+                _agents.append(agent)
+        _members = []
+        for population, idx in members:
+            keep = []
+            for i in idx.tolist():
+                key = (id(population), i, event_type, data)
+                if key not in seen:
+                    seen.add(key)
+                    keep.append(i)
+            _members.append((population, np.array(keep, dtype=np.int64)))
+        return _agents, _members
+
+    def resolve(self, event_type, emissions, receivers):
+        world = self.world
+        subscribers = self.subscribers.get(event_type, {})
+        n = len(subscribers) + len(self.all_types)
+        if n:
+            cells = sum((rng * 2 + 1) ** 2 for _, _, rng, _, _ in emissions)
+            # the candidate test is vectorized, but costs n per emission
+            if n * len(emissions) < cells * 32:
+                candidates = list(self.all_types) + [a for a in subscribers if a not in self.all_types]
+                self.resolve_by_candidates(candidates, emissions, receivers)
+            else:
+                self.resolve_by_grid(subscribers, emissions, receivers)
+        for population in world.populations:
+            if not self.subscribes(population, event_type):
+                continue
+            for (x, y, rng, group_id, sender), (_, members) in zip(emissions, receivers):
+                if group_id is not None and group_id not in population.group_ids:
+                    continue
+                idx = population.in_box(x, y, rng)
+                if getattr(sender, 'population', None) is population:
+                    idx = idx[idx != sender.i]
+                if len(idx):
+                    members.append((population, idx))
+
+    def resolve_by_candidates(self, candidates, emissions, receivers):
+        # few subscribers: test all of them against all emissions at once
+        world = self.world
+        positions = world.positions
+        candidates = [agent for agent in candidates if positions[agent.idx] is not None]
+        if not candidates:
+            return
+        xy = np.array([positions[agent.idx] for agent in candidates], dtype=np.int64)
+        e = np.array([(x, y, rng) for x, y, rng, _, _ in emissions], dtype=np.int64)
+        chunk = max(1, (1 << 22) // len(candidates))
+        for lo in range(0, len(e), chunk):
+            dx = np.abs(xy[None, :, 0] - e[lo:lo + chunk, None, 0])
+            dy = np.abs(xy[None, :, 1] - e[lo:lo + chunk, None, 1])
+            if world.torus_enabled:
+                dx = np.minimum(dx, world.w - dx)
+                dy = np.minimum(dy, world.h - dy)
+            r = e[lo:lo + chunk, None, 2]
+            in_range = (dx <= r) & (dy <= r)
+            for k, row in enumerate(in_range):
+                _, _, _, group_id, sender = emissions[lo + k]
+                agents = receivers[lo + k][0]
+                for j in np.flatnonzero(row).tolist():
+                    agent = candidates[j]
+                    if agent is not sender and (group_id is None or group_id in agent.group_ids):
+                        agents.append(agent)
+
+    def resolve_by_grid(self, subscribers, emissions, receivers):
+        # many subscribers: scan the boxes of the emissions
+        world = self.world
+        storage = world.storage
+        get = storage.get
+        all_types = self.all_types
+        for (x, y, rng, group_id, sender), (agents, _) in zip(emissions, receivers):
+            if world.torus_enabled:
+                rects = storage.torus_ranges(x, y, rng)
+            else:
+                rects = [((max(y - rng, 0), min(y + rng, world.h - 1)), (max(x - rng, 0), min(x + rng, world.w - 1)))]
+            for (ylo, yhi), (xlo, xhi) in rects:
+                for cy in range(ylo, yhi + 1):
+                    for cx in range(xlo, xhi + 1):
+                        for agent in get(cx, cy):
+                            if agent in subscribers or agent in all_types:
+                                if agent is not sender and (group_id is None or group_id in agent.group_ids):
+                                    agents.append(agent)
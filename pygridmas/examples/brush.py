@@ -9,6 +9,8 @@ world = World(w=size, h=size, torus_enabled=True)
 
 class Canvas(Agent):
     color = Colors.BLACK
+    # only PAINT events are delivered to the canvas
+    subscriptions = {"PAINT"}
 
     def initialize(self):
         # If there are many agents with no step method,
@@ -33,9 +35,8 @@ class Canvas(Agent):
                 self.color = Colors.WHITE
 
 
-for x in range(size):
-    for y in range(size):
-        world.add_agent(Canvas(), Vec2D(x, y))
+# a canvas agent in every cell, added at once
+world.add_agents([Canvas() for _ in range(size * size)], 'fill')
 
 
 class Brush(Agent):
@@ -44,7 +45,7 @@ class Brush(Agent):
     reached_target = False
 
     def step(self):
-        self.move_rel(Vec2D.random_grid_dir())
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
         self.emit_event(brush_radius, "PAINT", self.pos())
 
 
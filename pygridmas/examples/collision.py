@@ -15,7 +15,7 @@ class Mover(Agent):
     group_collision_ids = {0, 1}  # Not able to enter wall tiles or other Mover tiles
 
     def step(self):
-        self.move_rel(Vec2D.random_grid_dir())
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
 
 
 # Create walls
@@ -1,53 +1,33 @@
-from pygridmas import Agent, World
+from pygridmas import Agent, World, run_replicas
 import matplotlib.pyplot as plt
-import random
-import numpy as np
-
-
-class AgentCountLogger:
-    count = 0
-
-    def bind(logger, agent_class):
-        class CountLoggingAgentClass(agent_class):
-            def initialize(self):
-                super().initialize()
-                logger.count += 1
-
-            def cleanup(self):
-                super().cleanup()
-                logger.count -= 1
-
-        return CountLoggingAgentClass
 
 
 class RandomlyDyingAgent(Agent):
     def step(self):
-        if random.random() < 0.01:
+        if self.world.rng.random() < 0.01:
             self.world.remove_agent(self.idx)
 
 
-def draw_sample(T):
-    count_logger = AgentCountLogger()
-    RandomlyDyingAgentLog = count_logger.bind(RandomlyDyingAgent)
-
-    world = World(100, 100, max_steps=T)
+# The world factory and the metrics are sent to worker processes,
+# so they are defined at module level.
+def make_world(seed):
+    world = World(100, 100, seed=seed)
+    # counts of the agents are kept up to date as they are added and removed
+    world.get_statistics()
     for _ in range(100):
-        world.add_agent(RandomlyDyingAgentLog())
+        world.add_agent(RandomlyDyingAgent())
+    return world
 
-    agent_counts = []
-    while not world.ended:
-        agent_counts.append(count_logger.count)
-        world.step()
 
-    return agent_counts
+def agent_count(world):
+    return world.get_statistics().n
 
 
 def main():
     T = 500
     n = 100
-    data = np.empty((n, T))
-    for i in range(n):
-        data[i] = draw_sample(T)
+    # one replica per seed, run in parallel on all cores
+    data = run_replicas(make_world, seeds=range(n), metrics={'agents': agent_count}, n_steps=T)['agents']
     mean = data.mean(axis=0)
     std = data.std(axis=0)
 
@@ -0,0 +1,44 @@
+from pygridmas import World, Agent, Vec2D, Colors, Visualizer
+
+size = 100
+world = World(w=size, h=size, torus_enabled=True)
+# the walls of examples/collision.py, the movers head into the corridor
+target = Vec2D(size // 2, round(size * 0.7))
+
+
+class Wall(Agent):
+    color = Colors.WHITE
+    group_ids = {0}
+
+
+class Mover(Agent):
+    color = Colors.BLUE
+    group_ids = {1}
+    group_collision_ids = {0, 1}
+
+    def step(self):
+        # All movers share one flow field around the walls, computed once.
+        # Other movers are not obstacles of the field, a blocked mover tries
+        # its other moves towards the target.
+        if not self.navigate(target):
+            self.color = Colors.GREEN
+
+
+x1, x2 = round(size * 0.3), round(size * 0.7)
+y1, y2 = round(size * 0.6), round(size * 0.8)
+
+for x in (x1, x2):
+    for y in range(y1 + 1):
+        world.add_agent(Wall(), Vec2D(x, y))
+    for y in range(y2, size):
+        world.add_agent(Wall(), Vec2D(x, y))
+
+for y in (y1, y2):
+    for x in range(x1 + 1, x2):
+        world.add_agent(Wall(), Vec2D(x, y))
+
+for _ in range(500):
+    world.add_agent(Mover(), Vec2D(size // 2, size // 4))
+
+vis = Visualizer(world, scale=3, target_speed=50)
+vis.start()
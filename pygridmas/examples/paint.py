@@ -0,0 +1,32 @@
+from pygridmas import World, Agent, Vec2D, Colors, Visualizer
+import colorsys
+import numpy as np
+
+brush_radius = 5
+size = 100
+world = World(w=size, h=size, torus_enabled=True)
+# examples/brush.py without a canvas agent per cell: the paint is a color layer,
+# slowly fading to black
+paint = world.add_layer('paint', channels=3, decay=0.005)
+
+
+def brush_colors(dx, dy):
+    # the hue of the direction from the brush, turning with time
+    hue = (np.arctan2(dy, dx) + world.time * 0.1) % (np.pi * 2) / (np.pi * 2)
+    colors = np.array([colorsys.hsv_to_rgb(h, 1, 1) for h in hue])
+    colors[dx * dx + dy * dy < (brush_radius * 0.5) ** 2] = Colors.WHITE
+    return colors
+
+
+class Brush(Agent):
+    color = Colors.WHITE
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+        paint.paint_disk(self.pos(), brush_radius, brush_colors)
+
+
+world.add_agent(Brush(), Vec2D(size // 2, size // 2))
+
+vis = Visualizer(world, scale=3, target_speed=100, layer='paint')
+vis.start()
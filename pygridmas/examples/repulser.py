@@ -1,5 +1,4 @@
 from pygridmas import World, Agent, Vec2D, Colors, Visualizer
-import random
 import math
 
 size = 200
@@ -28,10 +27,10 @@ class Repulser(Agent):
             near_agents = self.box_scan(10, sort=False)
             if near_agents:
                 self.color = Colors.RED
-                if random.random() < 0.2:
-                    self.move_rel(Vec2D.random_grid_dir())
+                if self.world.rng.random() < 0.2:
+                    self.move_rel(Vec2D.random_grid_dir(self.world.rng))
                 else:
-                    other_agent = random.choice(near_agents)
+                    other_agent = self.world.rng.choice(near_agents)
                     self.move_away_from(other_agent.pos())
             else:
                 self.color = Colors.BLUE
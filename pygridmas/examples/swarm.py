@@ -0,0 +1,43 @@
+from pygridmas import World, Agent, Population, Vec2D, Colors, Visualizer
+import numpy as np
+
+size = 500
+world = World(w=size, h=size, torus_enabled=True)
+
+
+class Walkers(Population):
+    # The walkers are stored as arrays and stepped all at once,
+    # which allows simulating many more agents than with one Agent per walker.
+    color = Colors.BLUE
+    group_ids = {1}
+
+    def initialize(self):
+        # user state is just more arrays of length n
+        self.age = np.zeros(self.n, dtype=np.int64)
+
+    def step_all(self):
+        alive = self.alive_idx()
+        self.age[alive] += 1
+        self.move_rel(self.world.rng.generator.integers(-1, 2, (len(alive), 2)), alive)
+        # color walkers by the number of other walkers nearby
+        crowd = self.count_in_box(2, group_id=1, which=alive)
+        self.colors[alive] = Colors.BLUE
+        self.colors[alive[crowd > 3]] = Colors.RED
+
+
+class Watcher(Agent):
+    # Regular agents see population members in their scans
+    color = Colors.YELLOW
+
+    def step(self):
+        self.move_rel(Vec2D.random_grid_dir(self.world.rng))
+        near = self.nearest(3, group_id=1)
+        self.color = Colors.YELLOW if near is None else Colors.WHITE
+
+
+world.add_population(Walkers(100000))
+for _ in range(100):
+    world.add_agent(Watcher())
+
+vis = Visualizer(world, scale=2, target_speed=30)
+vis.start()
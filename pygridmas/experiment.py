@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import random
+
+import numpy as np
+
+
+def seed_rngs(seed):
+    # independent, reproducible streams per replica, whichever worker runs it
+    seq = np.random.SeedSequence(seed)
+    random.seed(int(seq.generate_state(1, dtype=np.uint64)[0]))
+    np.random.seed(seq.spawn(1)[0].generate_state(4))
+
+
+def run_replica(world_factory, seed, metrics, n_steps):
+    """
+    Runs a single replica and returns a dict of metric name -> array of length n_steps.
+    The metrics are recorded before each step. After the world has ended they are NaN.
+    """
+    seed_rngs(seed)
+    world = world_factory(seed)
+    results = {name: np.full(n_steps, np.nan) for name in metrics}
+    for t in range(n_steps):
+        if world.ended:
+            break
+        for name, metric in metrics.items():
+            results[name][t] = metric(world)
+        world.step()
+    world.end()
+    return results
+
+
+def run_replica_job(job):
+    i, world_factory, seed, metrics, n_steps = job
+    return i, run_replica(world_factory, seed, metrics, n_steps)
+
+
+def run_replicas(world_factory, seeds, metrics, n_steps, processes=None, chunksize=1):
+    """
+    Runs headless replicas of a world, one per seed, across a process pool.
+
+    'world_factory(seed)' creates a world and 'metrics' is a dict of
+    name -> function(world) -> float. Both are sent to the worker processes,
+    so they must be picklable (e.g. functions defined at module level).
+    The python and numpy global rngs are seeded from the seed before the
+    world is created.
+
+    Returns a dict of metric name -> array of shape (len(seeds), n_steps).
+    """
+    seeds = list(seeds)
+    results = {name: np.empty((len(seeds), n_steps)) for name in metrics}
+    jobs = ((i, world_factory, seed, metrics, n_steps) for i, seed in enumerate(seeds))
+    if processes is None:
+        processes = min(os.cpu_count() or 1, len(seeds))
+    if processes <= 1:
+        collect(results, map(run_replica_job, jobs))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            collect(results, pool.imap_unordered(run_replica_job, jobs, chunksize))
+    return results
+
+
+def collect(results, replicas):
+    # replicas arrive in any order and are written into their row
+    for i, replica in replicas:
+        for name, values in replica.items():
+            results[name][i] = values
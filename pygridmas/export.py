@@ -0,0 +1,260 @@
+"""
+Images of worlds without a window or OpenGL context: frames rendered by a
+Raster, written as PNG files or streamed into an animated GIF.
+The encoders only need numpy and zlib.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from pygridmas.observer import WorldObserver
+from pygridmas.raster import Raster
+
+
+def render_world(world, scale=3, performance=False, layer=None):
+    """
+    An RGB image of the world as the Visualizer draws it, with 'scale' x 'scale'
+    pixels per cell and row 0 at the top. In performance mode a cell has the
+    color of its last agent, otherwise its agents are laid out within the cell.
+    Empty cells show the world's layer named 'layer', if given.
+    """
+    raster = Raster(world, 1 if performance else scale, layer=layer)
+    try:
+        return to_frame(raster.update(), scale if performance else 1)
+    finally:
+        raster.close()
+
+
+def to_frame(image, repeat=1):
+    # the visualizer draws y = 0 at the bottom
+    image = image[::-1]
+    if repeat > 1:
+        image = image.repeat(repeat, axis=0).repeat(repeat, axis=1)
+    return np.ascontiguousarray(image)
+
+
+def png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+def write_png(path, image, level=6):
+    """writes an RGB uint8 image of shape (h, w, 3)"""
+    h, w, _ = image.shape
+    # every row starts with filter type 0 (none)
+    rows = np.zeros((h, w * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(h, w * 3)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)))
+        f.write(png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)))
+        f.write(png_chunk(b'IEND', b''))
+
+
+def quantize(image):
+    """
+    (palette, indices) of an RGB image. The colors are kept exactly if there
+    are at most 256 of them, otherwise they are reduced to 3-3-2 bits.
+    """
+    rgb = image.reshape(-1, 3).astype(np.uint32)
+    packed = rgb[:, 0] << 16 | rgb[:, 1] << 8 | rgb[:, 2]
+    # the colors are looked up per run of equal pixels, there are far fewer runs than pixels
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(packed)) + 1))
+    colors, indices = np.unique(packed[starts], return_inverse=True)
+    indices = np.repeat(indices, np.diff(np.append(starts, len(packed))))
+    if len(colors) > 256:
+        indices = (rgb[:, 0] >> 5) << 5 | (rgb[:, 1] >> 5) << 2 | rgb[:, 2] >> 6
+        levels = np.arange(256, dtype=np.uint32)
+        colors = ((levels >> 5) * 255 // 7) << 16 | ((levels >> 2 & 7) * 255 // 7) << 8 | (levels & 3) * 255 // 3
+    palette = np.stack((colors >> 16, colors >> 8 & 255, colors & 255), axis=1).astype(np.uint8)
+    return palette, indices.astype(np.uint8)
+
+
+def pack_codes(codes, sizes):
+    """the codes packed least significant bit first, each with its size in bits"""
+    codes, sizes = np.array(codes, dtype=np.int64), np.array(sizes, dtype=np.int64)
+    starts = np.cumsum(sizes) - sizes
+    shift = np.arange(sizes.sum()) - np.repeat(starts, sizes)
+    bits = (np.repeat(codes, sizes) >> shift & 1).astype(np.uint8)
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+def lzw_encode(indices, min_code_size):
+    """
+    GIF flavoured, variable code size LZW of an array of color indices.
+    The indices are encoded run by run: every code stands for a run of one
+    color, the longest run of the color in the table that fits, and a code
+    followed by the same color adds the run one longer to the table.
+    A run of n pixels thus costs about sqrt(2 n) codes the first time, and a
+    single code once a run as long is in the table, so the loop is per code
+    rather than per pixel. Any decoder reads the codes as usual, the files are
+    somewhat larger than with a table of mixed colors.
+    """
+    clear = 1 << min_code_size
+    end = clear + 1
+    indices = np.asarray(indices).ravel()
+    starts = np.flatnonzero(np.diff(indices)) + 1
+    colors = indices[np.concatenate(([0], starts))].tolist() if len(indices) else []
+    lengths = np.diff(np.concatenate(([0], starts, [len(indices)]))).tolist()
+    codes, sizes = [clear], [min_code_size + 1]
+    code_size = min_code_size + 1
+    next_code = end + 1
+    # color -> the codes of its runs, runs[c][k - 1] stands for k pixels of color c
+    runs = {}
+    n_runs = len(colors)
+    for r in range(n_runs):
+        c, n = colors[r], lengths[r]
+        known = runs.get(c)
+        if known is None:
+            known = runs[c] = [c]
+        while n:
+            k = len(known)
+            if k > n:
+                k = n
+            codes.append(known[k - 1])
+            sizes.append(code_size)
+            n -= k
+            if not n and r + 1 == n_runs:
+                break
+            # the decoder adds this code followed by the next color to its table
+            if next_code < 4096:
+                if n and k == len(known):
+                    known.append(next_code)
+                next_code += 1
+                if next_code > 1 << code_size:
+                    code_size += 1
+            else:
+                # the table is full, start over
+                codes.append(clear)
+                sizes.append(code_size)
+                code_size = min_code_size + 1
+                next_code = end + 1
+                runs.clear()
+                known = runs[c] = [c]
+    if len(codes) > 1 and next_code < 4096 and next_code + 1 > 1 << code_size:
+        # the decoder adds an entry for the last code as well
+        code_size += 1
+    codes.append(end)
+    sizes.append(code_size)
+    return pack_codes(codes, sizes)
+
+
+class GifWriter:
+    """
+    Streams frames into an animated GIF, each frame is written as it is added.
+    'delay' is the time per frame in seconds, loop = 0 loops forever.
+    """
+
+    def __init__(self, path, delay=0.05, loop=0):
+        self.f = open(path, 'wb')
+        self.delay = max(1, round(delay * 100))
+        self.loop = loop
+        self.size = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write_header(self, w, h):
+        self.size = w, h
+        f = self.f
+        f.write(b'GIF89a' + struct.pack('<HHBBB', w, h, 0, 0, 0))
+        f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+
+    def write(self, image, scale=1):
+        """
+        writes an RGB uint8 image of shape (h, w, 3), with 'scale' x 'scale' pixels
+        per image pixel. Scaling the color indices is cheaper than quantizing a scaled image.
+        """
+        palette, indices = quantize(image)
+        h, w, _ = image.shape
+        if scale > 1:
+            indices = indices.reshape(h, w).repeat(scale, axis=0).repeat(scale, axis=1)
+            h, w = h * scale, w * scale
+        if self.size is None:
+            self.write_header(w, h)
+        elif self.size != (w, h):
+            raise ValueError('all frames must have the size {}'.format(self.size))
+        # the color table has 2 ** (bits + 1) entries
+        bits = max(1, int(len(palette) - 1).bit_length()) - 1
+        table = np.zeros((2 << bits, 3), dtype=np.uint8)
+        table[:len(palette)] = palette
+        min_code_size = max(2, bits + 1)
+        data = lzw_encode(indices, min_code_size)
+        f = self.f
+        f.write(b'\x21\xf9\x04' + struct.pack('<BHBB', 0, self.delay, 0, 0))
+        f.write(b'\x2c' + struct.pack('<HHHHB', 0, 0, w, h, 0x80 | bits))
+        f.write(table.tobytes())
+        f.write(bytes([min_code_size]))
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            f.write(bytes([len(block)]) + block)
+        f.write(b'\x00')
+
+    def close(self):
+        if not self.f.closed:
+            self.f.write(b'\x3b')
+            self.f.close()
+
+
+class FrameExporter(WorldObserver):
+    """
+    Writes an image of the world every 'every' steps, starting with the current
+    state: to an animated GIF if 'path' ends with '.gif', otherwise as
+    numbered PNG files in the directory 'path'. Frames are rendered like
+    'render_world' and not kept in memory.
+    The export is completed by 'close', which is called when the world ends.
+    """
+
+    def __init__(self, world, path, every=1, scale=3, performance=False, delay=0.05, layer=None):
+        self.world = world
+        self.path = path
+        self.every = every
+        self.scale = scale
+        self.performance = performance
+        self.raster = Raster(world, 1 if performance else scale, layer=layer)
+        if path.lower().endswith('.gif'):
+            self.gif = GifWriter(path, delay)
+        else:
+            self.gif = None
+            os.makedirs(path, exist_ok=True)
+        self.n = 0
+        self.closed = False
+        world.add_observer(self)
+        self.write()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def on_step(self):
+        if self.world.time % self.every == 0:
+            self.write()
+
+    def on_end(self):
+        self.close()
+
+    def write(self):
+        scale = self.scale if self.performance else 1
+        if self.gif is not None:
+            # performance mode frames are quantized at cell resolution
+            self.gif.write(to_frame(self.raster.update()), scale)
+        else:
+            write_png(os.path.join(self.path, 'frame_{:06d}.png'.format(self.world.time)), to_frame(self.raster.update(), scale))
+        self.n += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.gif is not None:
+            self.gif.close()
+        self.raster.close()
+        if self in self.world.observers:
+            self.world.remove_observer(self)
@@ -0,0 +1,228 @@
+from collections import Counter
+
+from pygridmas.observer import WorldObserver
+
+# group id -> bit of the group masks, assigned on first use and shared by the
+# worlds of a process. Masks are not pickled, they are recomputed from the ids.
+# Bits are never released, so the masks grow with every distinct group id used
+# in the process: group ids are meant to be a small, fixed set of categories,
+# per agent labels such as team numbers of transient teams belong in attributes.
+group_bits = {}
+
+
+def group_bit(group_id):
+    bit = group_bits.get(group_id)
+    if bit is None:
+        bit = group_bits[group_id] = 1 << len(group_bits)
+    return bit
+
+
+def group_mask(group_ids):
+    mask = 0
+    for group_id in group_ids:
+        mask |= group_bit(group_id)
+    return mask
+
+
+def mask_groups(mask):
+    """the group ids of the bits of 'mask'"""
+    return [group_id for group_id, bit in group_bits.items() if mask & bit]
+
+
+class GroupSet(set):
+    """
+    The group ids of an agent, or the group ids it collides with,
+    and their bitmask 'mask'. Changes of an agent's group ids are reported
+    to its world, which keeps the group masks of the cells.
+    """
+    __slots__ = ('agent', 'mask')
+
+    def __init__(self, group_ids=(), agent=None, mask=None):
+        # 'mask' of the group ids, if known, e.g. when copying many sets
+        super().__init__(group_ids)
+        self.agent = agent
+        self.mask = group_mask(self) if mask is None else mask
+
+    def changed(self, old_mask, added=(), removed=()):
+        agent = self.agent
+        world = agent.world if agent is not None else None
+        if world is not None and self.mask != old_mask:
+            world.group_changed(agent, added, removed, old_mask)
+
+    def mutate(self, op, *args):
+        old_mask = self.mask
+        agent = self.agent
+        if agent is None or agent.world is None or not agent.world.observers:
+            op(self, *args)
+            self.mask = group_mask(self)
+            self.changed(old_mask)
+            return
+        before = set(self)
+        op(self, *args)
+        self.mask = group_mask(self)
+        self.changed(old_mask, self - before, before - self)
+
+    def add(self, group_id):
+        if group_id not in self:
+            set.add(self, group_id)
+            old_mask = self.mask
+            self.mask |= group_bit(group_id)
+            self.changed(old_mask, (group_id,), ())
+
+    def discard(self, group_id):
+        if group_id in self:
+            self.remove(group_id)
+
+    def remove(self, group_id):
+        set.remove(self, group_id)
+        old_mask = self.mask
+        self.mask &= ~group_bit(group_id)
+        self.changed(old_mask, (), (group_id,))
+
+    def pop(self):
+        group_id = set.pop(self)
+        old_mask = self.mask
+        self.mask &= ~group_bit(group_id)
+        self.changed(old_mask, (), (group_id,))
+        return group_id
+
+    def clear(self):
+        self.mutate(set.clear)
+
+    def update(self, *others):
+        self.mutate(set.update, *others)
+
+    def difference_update(self, *others):
+        self.mutate(set.difference_update, *others)
+
+    def intersection_update(self, *others):
+        self.mutate(set.intersection_update, *others)
+
+    def symmetric_difference_update(self, other):
+        self.mutate(set.symmetric_difference_update, other)
+
+    def __ior__(self, other):
+        self.mutate(set.__ior__, other)
+        return self
+
+    def __iand__(self, other):
+        self.mutate(set.__iand__, other)
+        return self
+
+    def __isub__(self, other):
+        self.mutate(set.__isub__, other)
+        return self
+
+    def __ixor__(self, other):
+        self.mutate(set.__ixor__, other)
+        return self
+
+    def __reduce__(self):
+        # without the agent, Agent.__setstate__ links it again
+        return GroupSet, (list(self),)
+
+
+class CellMasks:
+    """
+    Per cell, the OR of the group masks of its agents, so a collision check
+    is a single dict lookup and integer and, however crowded the cell.
+    The number of agents per distinct mask in a cell updates it on removal.
+    Agents without groups are not counted.
+    """
+
+    def __init__(self):
+        self.masks = {}
+        self.counts = {}
+
+    def get(self, x, y):
+        return self.masks.get((x, y), 0)
+
+    def add(self, x, y, mask, n=1):
+        if not mask:
+            return
+        key = x, y
+        counts = self.counts.get(key)
+        if counts is None:
+            self.counts[key] = {mask: n}
+            self.masks[key] = mask
+        else:
+            counts[mask] = counts.get(mask, 0) + n
+            self.masks[key] |= mask
+
+    def add_many(self, xs, ys, masks):
+        # counted per distinct cell and mask first
+        for ((x, y), mask), n in Counter(zip(zip(xs, ys), masks)).items():
+            self.add(x, y, mask, n)
+
+    def remove(self, x, y, mask):
+        if not mask:
+            return
+        key = x, y
+        counts = self.counts[key]
+        n = counts[mask] - 1
+        if n:
+            counts[mask] = n
+            return
+        del counts[mask]
+        if not counts:
+            del self.counts[key]
+            del self.masks[key]
+            return
+        cell_mask = 0
+        for mask in counts:
+            cell_mask |= mask
+        self.masks[key] = cell_mask
+
+    def clear(self):
+        self.masks.clear()
+        self.counts.clear()
+
+    def __getstate__(self):
+        # the bits are assigned per process
+        return {key: [(mask_groups(mask), n) for mask, n in counts.items()] for key, counts in self.counts.items()}
+
+    def __setstate__(self, state):
+        self.masks, self.counts = {}, {}
+        for (x, y), counts in state.items():
+            for group_ids, n in counts:
+                self.add(x, y, group_mask(group_ids), n)
+
+
+class GroupIndex(WorldObserver):
+    """
+    group id -> {idx: agent} of the agents of a world, kept up to date
+    as agents are added, removed and change their groups.
+    Population members are not indexed.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.groups = {}
+        for idx, agent in world.agents.items():
+            for group_id in agent.group_ids:
+                self.groups.setdefault(group_id, {})[idx] = agent
+
+    def members(self, group_id):
+        return self.groups.get(group_id, {})
+
+    def add(self, agent, group_ids):
+        for group_id in group_ids:
+            self.groups.setdefault(group_id, {})[agent.idx] = agent
+
+    def remove(self, agent, group_ids):
+        for group_id in group_ids:
+            members = self.groups.get(group_id)
+            if members is not None:
+                members.pop(agent.idx, None)
+                if not members:
+                    del self.groups[group_id]
+
+    def on_add(self, agent, pos):
+        self.add(agent, agent.group_ids)
+
+    def on_remove(self, agent, pos):
+        self.remove(agent, agent.group_ids)
+
+    def on_group_change(self, agent, pos, added, removed):
+        self.add(agent, added)
+        self.remove(agent, removed)
@@ -0,0 +1,125 @@
+"""
+Named numpy layers of per-cell state on a world, e.g. pheromone trails,
+paint or resources, instead of a passive agent per cell.
+"""
+import copy
+import functools
+
+import numpy as np
+
+from pygridmas.colors import BLACK, WHITE
+from pygridmas.raster import to_rgb
+
+
+@functools.lru_cache(maxsize=64)
+def disk_offsets(r):
+    """(dx, dy) arrays of the offsets closer than 'r' to a cell"""
+    n = int(np.ceil(r))
+    dy, dx = np.mgrid[-n:n + 1, -n:n + 1]
+    inside = dx * dx + dy * dy < r * r
+    dx, dy = dx[inside], dy[inside]
+    dx.flags.writeable = dy.flags.writeable = False
+    return dx, dy
+
+
+class Layer:
+    """
+    A h x w array of floats ('data', indexed [y, x]), or of colors with 'channels' = 3,
+    indexed by positions: 'layer[pos]', 'layer[pos] += 1'.
+    Each world step the layer diffuses 'diffusion' of its values to the four
+    neighbour cells and then loses 'decay' of them.
+    Scalar layers are drawn from the color 'low' at 'vmin' to 'high' at 'vmax'.
+    """
+
+    def __init__(self, name, w, h, torus=False, channels=None, dtype=np.float64, fill=0, decay=0.0, diffusion=0.0,
+                 low=BLACK, high=WHITE, vmin=0.0, vmax=1.0):
+        self.name = name
+        self.w, self.h = w, h
+        self.torus = torus
+        shape = (h, w) if channels is None else (h, w, channels)
+        self.data = np.full(shape, fill, dtype=dtype)
+        self.decay_rate = decay
+        self.diffusion_rate = diffusion
+        self.low, self.high = low, high
+        self.vmin, self.vmax = vmin, vmax
+
+    def __getitem__(self, pos):
+        return self.data[pos[1], pos[0]]
+
+    def __setitem__(self, pos, value):
+        self.data[pos[1], pos[0]] = value
+
+    def step(self):
+        if self.diffusion_rate:
+            self.diffuse(self.diffusion_rate)
+        if self.decay_rate:
+            self.decay(self.decay_rate)
+
+    def decay(self, rate):
+        self.data *= 1 - rate
+
+    def diffuse(self, rate):
+        """moves 'rate' of each cell's value evenly to its four neighbours"""
+        k = rate / 4
+        # without torus, the share of a missing neighbour stays in the cell
+        self.convolve([[0, k, 0], [k, 1 - rate, k], [0, k, 0]], None if self.torus else 'edge')
+
+    def convolve(self, kernel, boundary=None):
+        """
+        Replaces each cell by the sum of its neighbourhood weighted by the centered
+        'kernel', where kernel[i, j] weighs the cell at offset (j - kw // 2, i - kh // 2).
+        Cells outside the world wrap around on a torus, and are 0 otherwise,
+        unless 'boundary' is a np.pad mode.
+        """
+        kernel = np.asarray(kernel, dtype=np.float64)
+        kh, kw = kernel.shape
+        data = self.data
+        if boundary is None:
+            boundary = 'wrap' if self.torus else 'constant'
+        pad = ((kh // 2, kh - 1 - kh // 2), (kw // 2, kw - 1 - kw // 2)) + ((0, 0),) * (data.ndim - 2)
+        padded = np.pad(data, pad, mode=boundary)
+        out = np.zeros(data.shape)
+        for (i, j), k in np.ndenumerate(kernel):
+            if k:
+                out += k * padded[i:i + self.h, j:j + self.w]
+        data[...] = out
+
+    def disk(self, center, r):
+        """
+        (xs, ys, dx, dy) of the cells closer than 'r' to 'center', and their offsets,
+        wrapped around on a torus and clipped to the world otherwise
+        """
+        dx, dy = disk_offsets(r)
+        xs, ys = center[0] + dx, center[1] + dy
+        if self.torus:
+            return xs % self.w, ys % self.h, dx, dy
+        inside = (xs >= 0) & (xs < self.w) & (ys >= 0) & (ys < self.h)
+        return xs[inside], ys[inside], dx[inside], dy[inside]
+
+    def paint_disk(self, center, r, value):
+        """
+        Sets the cells closer than 'r' to 'center' to 'value',
+        or to 'value(dx, dy)' of their offsets if it is callable.
+        """
+        xs, ys, dx, dy = self.disk(center, r)
+        self.data[ys, xs] = value(dx, dy) if callable(value) else value
+
+    def add_disk(self, center, r, value):
+        """as 'paint_disk', adding 'value' to the cells"""
+        xs, ys, dx, dy = self.disk(center, r)
+        # on a torus smaller than the disk, a cell can occur more than once
+        np.add.at(self.data, (ys, xs), value(dx, dy) if callable(value) else value)
+
+    def image(self):
+        """the h x w x 3 uint8 image of the layer"""
+        data = self.data
+        if data.ndim == 3:
+            return to_rgb(data)
+        t = np.clip((data - self.vmin) / (self.vmax - self.vmin), 0, 1)[..., None]
+        low = np.asarray(self.low, dtype=np.float64)
+        return to_rgb(low + t * (np.asarray(self.high, dtype=np.float64) - low))
+
+    def copy(self):
+        clone = copy.copy(self)
+        clone.data = self.data.copy()
+        return clone
@@ -0,0 +1,278 @@
+"""
+Distance and flow fields towards targets, shared by all agents heading to the
+same targets, see World.get_navigation.
+"""
+import heapq
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from pygridmas.vec2d import GRID_DIRS
+from pygridmas.observer import WorldObserver
+from pygridmas.groups import group_bit, group_mask
+
+# the neighbour cells, straight ones first so they win ties
+DIRS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1))
+
+
+def shifted(a, dx, dy, torus, fill):
+    """b[y, x] = a[y + dy, x + dx], wrapped around on a torus, 'fill' outside the world otherwise"""
+    if torus:
+        return np.roll(a, (-dy, -dx), axis=(0, 1))
+    h, w = a.shape
+    b = np.full_like(a, fill)
+    b[max(-dy, 0):h - max(dy, 0), max(-dx, 0):w - max(dx, 0)] = a[max(dy, 0):h + min(dy, 0), max(dx, 0):w + min(dx, 0)]
+    return b
+
+
+def bfs(passable, targets, torus):
+    """
+    the number of moves from each cell to the nearest target, breadth first.
+    The cells are numbered on the grid padded by a border of one cell,
+    closed, or standing for the cell on the opposite side on a torus, so each
+    wave front expands to its neighbours by adding offsets to its cell indices.
+    The cost is about the number of reachable cells, plus a few numpy calls per wave.
+    """
+    h, w = passable.shape
+    pw = w + 2
+    open_ = np.zeros((h + 2, pw), dtype=bool)
+    open_[1:-1, 1:-1] = passable
+    open_ = open_.ravel()
+    cell = np.arange((h + 2) * pw).reshape(h + 2, pw)
+    if torus:
+        # the border cells stand for the cells on the opposite side
+        cell[0], cell[-1] = cell[-2], cell[1]
+        cell[:, 0], cell[:, -1] = cell[:, -2], cell[:, 1]
+    cell = cell.ravel()
+    offsets = np.array([dy * pw + dx for dx, dy in DIRS])
+    distance = np.full(open_.shape, np.inf)
+    front = np.flatnonzero(np.pad(targets, 1))
+    distance[front] = 0
+    open_[front] = False
+    # the position of a cell among the candidates, to keep one of its duplicates without sorting
+    at = np.zeros(open_.shape, dtype=np.intp)
+    d = 0
+    while len(front):
+        d += 1
+        candidates = (front[:, None] + offsets).ravel()
+        if torus:
+            candidates = cell[candidates]
+        candidates = candidates[open_[candidates]]
+        order = np.arange(len(candidates))
+        at[candidates] = order
+        front = candidates[at[candidates] == order]
+        open_[front] = False
+        distance[front] = d
+    return distance.reshape(h + 2, pw)[1:-1, 1:-1].copy()
+
+
+def dijkstra(passable, targets, torus, diagonal):
+    """the cost from each cell to the nearest target, with diagonal moves costing 'diagonal'"""
+    h, w = passable.shape
+    open_ = passable.ravel().tolist()
+    heap = [(0.0, i) for i in np.flatnonzero(targets).tolist()]
+    dist = [math.inf] * (h * w)
+    for _, i in heap:
+        dist[i] = 0.0
+    steps = [(dx, dy, diagonal if dx and dy else 1) for dx, dy in DIRS]
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > dist[i]:
+            continue
+        y, x = divmod(i, w)
+        for dx, dy, cost in steps:
+            nx, ny = x + dx, y + dy
+            if torus:
+                nx, ny = nx % w, ny % h
+            elif not (0 <= nx < w and 0 <= ny < h):
+                continue
+            j = ny * w + nx
+            nd = d + cost
+            if nd < dist[j] and open_[j]:
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+    return np.array(dist).reshape(h, w)
+
+
+class FlowField:
+    """
+    'distance' (h x w) from each cell to the nearest target, inf if unreachable,
+    and 'move_at(x, y)', the unit grid move (a Vec2D) towards the nearest
+    target, the zero vector at the targets and where they are unreachable.
+    The moves are kept as indices into GRID_DIRS in 'move' (h x w).
+    """
+
+    def __init__(self, distance, torus, diagonal=1):
+        self.distance = distance
+        self.h, self.w = distance.shape
+        self.torus = torus
+        self.diagonal = diagonal
+        best = np.full(distance.shape, np.inf)
+        move = np.full(distance.shape, 4, dtype=np.int8)
+        for dx, dy in DIRS:
+            cost = diagonal if dx and dy else 1
+            d = shifted(distance, dx, dy, torus, np.inf) + cost
+            closer = d < best
+            best = np.where(closer, d, best)
+            move[closer] = (dy + 1) * 3 + dx + 1
+        # no move at the targets and where they are unreachable
+        move[(distance == 0) | np.isinf(distance)] = 4
+        self.move = move
+
+    def move_at(self, x, y):
+        return GRID_DIRS[self.move[y, x]]
+
+    def detours(self, x, y):
+        """the other moves to a neighbour closer to the targets, the best first"""
+        distance, w, h = self.distance, self.w, self.h
+        d0 = distance[y, x]
+        best = self.move_at(x, y)
+        moves = []
+        for dx, dy in DIRS:
+            nx, ny = x + dx, y + dy
+            if self.torus:
+                nx, ny = nx % w, ny % h
+            elif not (0 <= nx < w and 0 <= ny < h):
+                continue
+            d = distance[ny, nx]
+            if d < d0 and (dx, dy) != (best.x, best.y):
+                moves.append((d + (self.diagonal if dx and dy else 1), GRID_DIRS[(dy + 1) * 3 + dx + 1]))
+        moves.sort(key=lambda m: m[0])
+        return [move for _, move in moves]
+
+
+class Navigation(WorldObserver):
+    """
+    Flow fields towards target cells or the cells of a group's agents,
+    around the cells of obstacle groups. Distances count moves (breadth first),
+    or are weighted with 'diagonal' for diagonal moves (Dijkstra).
+    The last 'capacity' fields are cached, so the agents heading to the same
+    targets share one field. A field goes stale when an agent of its target
+    or obstacle groups is added, moved or removed, or changes its groups.
+    A stale field is computed again on the first request in a later step,
+    so it is computed at most once per step however often its targets move.
+    Agents of groups which are not obstacles, e.g. the other agents
+    following the field, do not invalidate it.
+    """
+
+    def __init__(self, world, capacity=16):
+        self.world = world
+        self.capacity = capacity
+        self.fields = OrderedDict()
+        # the groups of the cached fields, and the world time they were computed at
+        self.masks = {}
+        self.times = {}
+        self.stale = set()
+        # the groups of the fields which are not stale
+        self.watched = 0
+
+    def field(self, targets=None, group_id=None, obstacles=(), diagonal=1):
+        """
+        The flow field towards 'targets', a position or a list of positions,
+        and the cells of the agents of 'group_id', around the cells of the
+        agents of the 'obstacles' group ids.
+        """
+        world = self.world
+        if targets is None:
+            cells = ()
+        elif len(targets) == 2 and isinstance(targets[0], (int, np.integer)):
+            cells = ((int(targets[0]), int(targets[1])),)
+        else:
+            cells = tuple((int(x), int(y)) for x, y in targets)
+        mask = getattr(obstacles, 'mask', None)
+        if mask is None:
+            mask = group_mask(obstacles)
+        key = cells, group_id, mask, diagonal
+        field = self.fields.get(key)
+        if field is not None and (key not in self.stale or self.times[key] == world.time):
+            self.fields.move_to_end(key)
+            return field
+
+        target = np.zeros((world.h, world.w), dtype=bool)
+        for x, y in cells:
+            if world.torus_enabled:
+                x, y = x % world.w, y % world.h
+            elif not (0 <= x < world.w and 0 <= y < world.h):
+                raise ValueError('target ({}, {}) outside of the world'.format(x, y))
+            target[y, x] = True
+        watched = mask
+        if group_id is not None:
+            watched |= group_bit(group_id)
+            target |= self.group_cells(group_bit(group_id))
+        passable = ~self.group_cells(mask) if mask else np.ones((world.h, world.w), dtype=bool)
+        if diagonal == 1:
+            distance = bfs(passable, target, world.torus_enabled)
+        else:
+            distance = dijkstra(passable, target, world.torus_enabled, diagonal)
+        field = self.fields[key] = FlowField(distance, world.torus_enabled, diagonal)
+        self.fields.move_to_end(key)
+        self.masks[key] = watched
+        self.times[key] = world.time
+        self.stale.discard(key)
+        self.watched |= watched
+        if len(self.fields) > self.capacity:
+            self.drop(next(iter(self.fields)))
+        return field
+
+    def group_cells(self, mask):
+        """the cells of the agents and population members of the groups in 'mask'"""
+        world = self.world
+        cells = np.zeros((world.h, world.w), dtype=bool)
+        xs, ys = [], []
+        for (x, y), cell_mask in world.group_masks.masks.items():
+            if cell_mask & mask:
+                xs.append(x)
+                ys.append(y)
+        cells[ys, xs] = True
+        for population in world.populations:
+            if group_mask(population.group_ids) & mask:
+                xy = population.xy[population.alive_idx()]
+                cells[xy[:, 1], xy[:, 0]] = True
+        return cells
+
+    def drop(self, key):
+        del self.fields[key]
+        del self.masks[key]
+        del self.times[key]
+        self.stale.discard(key)
+        self.update_watched()
+
+    def update_watched(self):
+        watched = 0
+        for key, mask in self.masks.items():
+            if key not in self.stale:
+                watched |= mask
+        self.watched = watched
+
+    def changed(self, mask):
+        if mask & self.watched:
+            for key, field_mask in self.masks.items():
+                if field_mask & mask:
+                    self.stale.add(key)
+            self.update_watched()
+
+    def invalidate(self):
+        self.fields.clear()
+        self.masks.clear()
+        self.times.clear()
+        self.stale.clear()
+        self.watched = 0
+
+    def on_add(self, agent, pos):
+        if pos is not None:
+            self.changed(agent.group_ids.mask)
+
+    def on_remove(self, agent, pos):
+        if pos is not None:
+            self.changed(agent.group_ids.mask)
+
+    def on_move(self, agent, old_pos, new_pos):
+        self.changed(agent.group_ids.mask)
+
+    def on_group_change(self, agent, pos, added, removed):
+        if pos is not None:
+            self.changed(group_mask(added) | group_mask(removed))
+
+    def population_changed(self, population):
+        self.changed(group_mask(population.group_ids))
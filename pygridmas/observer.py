@@ -0,0 +1,29 @@
+class WorldObserver:
+    """
+    Base class for objects keeping incremental state about a world.
+    Register with 'world.add_observer(observer)', or with
+    'world.add_step_observer(observer)' if only 'on_step' and 'on_end' are used.
+    'pos' is None for agents added without a position.
+    """
+
+    def on_add(self, agent, pos):
+        pass
+
+    def on_remove(self, agent, pos):
+        pass
+
+    def on_move(self, agent, old_pos, new_pos):
+        pass
+
+    def on_group_change(self, agent, pos, added, removed):
+        pass
+
+    def on_color(self, agent, pos):
+        pass
+
+    def on_step(self):
+        # after each step, 'world.time' is the time of the next step
+        pass
+
+    def on_end(self):
+        pass
@@ -0,0 +1,402 @@
+"""
+A world split into tiles, each stepped by its own worker process.
+
+Every worker keeps a full size sparse World with the agents of its tile,
+plus read-only Ghost copies of the agents of other tiles within 'halo'
+cells of the tile (torus aware). Box scans, collision checks and events
+near the border of a tile see the ghosts, so 'halo' must be at least the
+range of the scans and events and the distance of the moves of the agents.
+Events received by a ghost are forwarded to the original agent, and agents
+leaving their tile migrate to the worker of the tile they moved into.
+
+The exchange happens after each step, so within a step the agents see
+the ghosts as they were at the start of the step: two agents of different
+tiles may move onto the same border cell in the same step.
+Agents are sent to the workers with pickle, so agent classes must be
+importable (defined at module level), and attributes referring to
+other agents become copies.
+"""
+import multiprocessing
+import pickle
+
+import numpy as np
+
+from pygridmas.vec2d import Vec2D
+from pygridmas.world import World
+from pygridmas.agent import Agent
+from pygridmas.observer import WorldObserver
+
+
+class Ghost(Agent):
+    """
+    Stands in for an agent of another tile. It has the original's position,
+    color, group ids, subscriptions and 'fields', and 'kind', the name of
+    its class. Events it receives are forwarded to the original.
+    """
+
+    def __init__(self, gid, owner, kind, outbox):
+        super().__init__()
+        self.gid = gid
+        self.owner = owner
+        self.kind = kind
+        self.outbox = outbox
+
+    def initialize(self):
+        self.deactivate()
+
+    def receive_event(self, event_type, data):
+        self.outbox.append((self.owner, self.gid, event_type, data))
+
+
+def tile_bounds(size, n):
+    """the first cell of each of 'n' tiles along an axis of 'size' cells, and the end"""
+    return [i * size // n for i in range(n + 1)]
+
+
+def axis_distance(v, lo, hi, size, torus):
+    # distances of the coordinates 'v' to the cells lo..hi
+    d = np.maximum(np.maximum(lo - v, v - hi), 0)
+    if torus:
+        d = np.minimum(d, np.maximum(np.maximum(lo - v - size, v + size - hi), 0))
+        d = np.minimum(d, np.maximum(np.maximum(lo - v + size, v - size - hi), 0))
+    return d
+
+
+class Tile(WorldObserver):
+    """the part of a PartitionedWorld in a worker process"""
+
+    def __init__(self, i, w, h, tiles, torus_enabled, halo, seed):
+        self.i = i
+        self.halo = halo
+        self.torus_enabled = torus_enabled
+        nx, ny = tiles
+        xs, ys = tile_bounds(w, nx), tile_bounds(h, ny)
+        # (x0, x1, y0, y1) of the cells of each tile
+        self.rects = np.array([(xs[tx], xs[tx + 1] - 1, ys[ty], ys[ty + 1] - 1)
+                               for ty in range(ny) for tx in range(nx)], dtype=np.int64)
+        self.tile_x = np.repeat(np.arange(nx), np.diff(xs)).tolist()
+        self.tile_y = (np.repeat(np.arange(ny), np.diff(ys)) * nx).tolist()
+        self.world = World(w, h, torus_enabled, storage='sparse', seed=seed)
+        # global ids of the agents of the tile, gids are unique per origin
+        self.gid_of = {}
+        self.idx_of = {}
+        self.n_tiles = nx * ny
+        self.next_gid = i
+        self.incoming = None
+        self.ghosts = {}
+        self.outbox = []
+        self.world.add_observer(self)
+
+    def tile_of(self, pos):
+        return self.tile_x[pos.x] + self.tile_y[pos.y]
+
+    def on_add(self, agent, pos):
+        if isinstance(agent, Ghost):
+            return
+        gid = self.incoming
+        if gid is None:
+            # added by an agent of this tile
+            gid = self.next_gid
+            self.next_gid += self.n_tiles + 1
+        self.gid_of[agent.idx] = gid
+        self.idx_of[gid] = agent.idx
+
+    def on_remove(self, agent, pos):
+        gid = self.gid_of.pop(agent.idx, None)
+        if gid is not None:
+            del self.idx_of[gid]
+
+    def add(self, agents):
+        for gid, agent, pos in agents:
+            self.incoming = gid
+            self.world.add_agent(agent, pos)
+        self.incoming = None
+
+    def step(self):
+        self.world.step()
+        # the ghosts share the outbox
+        outbox = list(self.outbox)
+        self.outbox.clear()
+        return outbox
+
+    def deliver(self, events):
+        # forwarded events, like EventBus.flush delivers them
+        world = self.world
+        scheduler = world.scheduler
+        for gid, event_type, data in events:
+            idx = self.idx_of.get(gid)
+            if idx is None:
+                continue
+            agent = world.agents[idx]
+            if not world.events.subscribes(agent, event_type):
+                continue
+            if idx in scheduler.on_event:
+                scheduler.wake(idx)
+            agent.receive_event(event_type, data)
+
+    def emigrate(self):
+        """detaches the agents outside of the tile, returns tile -> [(gid, agent, pos, sleep state)]"""
+        world = self.world
+        scheduler = world.scheduler
+        migrants = {}
+        for gid, idx in list(self.idx_of.items()):
+            pos = world.positions[idx]
+            if pos is None:
+                continue
+            tile = self.tile_of(pos)
+            if tile == self.i:
+                continue
+            state = (scheduler.is_awake(idx), scheduler.wake_times.get(idx), idx in scheduler.on_event)
+            agent = world.agents[idx]
+            world.detach_agent(idx)
+            migrants.setdefault(tile, []).append((gid, agent, pos, state))
+        return migrants
+
+    def immigrate(self, migrants):
+        world = self.world
+        for gid, agent, pos, (awake, wake_time, on_event) in migrants:
+            self.incoming = gid
+            world.attach_agent(agent, pos)
+            if not awake:
+                world.scheduler.sleep(agent.idx, wake_time, on_event)
+        self.incoming = None
+
+    def export_ghosts(self):
+        """tile -> [ghost records] of the agents within the halo of other tiles"""
+        world = self.world
+        placed = [(gid, idx, world.positions[idx]) for gid, idx in self.idx_of.items()
+                  if world.positions[idx] is not None]
+        exports = {}
+        if not placed:
+            return exports
+        xy = np.array([pos for _, _, pos in placed], dtype=np.int64)
+        for tile, (x0, x1, y0, y1) in enumerate(self.rects.tolist()):
+            if tile == self.i:
+                continue
+            near = (axis_distance(xy[:, 0], x0, x1, world.w, self.torus_enabled) <= self.halo) & \
+                   (axis_distance(xy[:, 1], y0, y1, world.h, self.torus_enabled) <= self.halo)
+            records = []
+            for j in np.flatnonzero(near).tolist():
+                gid, idx, pos = placed[j]
+                agent = world.agents[idx]
+                fields = {name: getattr(agent, name) for name in type(agent).fields}
+                records.append((gid, type(agent).__name__, pos, agent.color, tuple(agent.group_ids),
+                                agent.subscriptions, fields))
+            if records:
+                exports[tile] = records
+        return exports
+
+    def install_ghosts(self, records):
+        """replaces the ghosts with the records (owner, record) from the other tiles"""
+        world = self.world
+        old, self.ghosts = self.ghosts, {}
+        for owner, (gid, kind, pos, color, group_ids, subscriptions, fields) in records:
+            ghost = old.pop(gid, None)
+            if ghost is None or ghost.subscriptions != subscriptions:
+                if ghost is not None:
+                    world.detach_agent(ghost.idx)
+                ghost = Ghost(gid, owner, kind, self.outbox)
+                ghost.subscriptions = subscriptions
+                ghost.group_ids = group_ids
+                ghost.color = color
+                world.add_agent(ghost, pos)
+            else:
+                ghost.owner = owner
+                world.move_agent_xy(ghost.idx, pos.x, pos.y)
+                ghost.color = color
+                if set(group_ids) != ghost.group_ids:
+                    ghost.group_ids = group_ids
+            ghost.__dict__.update(fields)
+            self.ghosts[gid] = ghost
+        for ghost in old.values():
+            world.detach_agent(ghost.idx)
+
+    def gather(self):
+        """the pickled list of (gid, agent, pos) of the tile, the agents without their world"""
+        world = self.world
+        agents = [(gid, world.agents[idx], world.positions[idx]) for gid, idx in self.idx_of.items()]
+        for _, agent, _ in agents:
+            agent.world = None
+        try:
+            return pickle.dumps(agents, pickle.HIGHEST_PROTOCOL)
+        finally:
+            for _, agent, _ in agents:
+                agent.world = world
+
+    def end(self):
+        for ghost in list(self.ghosts.values()):
+            self.world.detach_agent(ghost.idx)
+        self.ghosts = {}
+        self.world.end()
+
+
+def run_tile(conn, *args):
+    """the worker of a tile, serving the requests of a PartitionedWorld"""
+    tile = Tile(*args)
+    try:
+        while True:
+            command, *args = conn.recv()
+            if command == 'add':
+                tile.add(*args)
+            elif command == 'step':
+                conn.send(tile.step())
+            elif command == 'deliver':
+                tile.deliver(*args)
+                conn.send(tile.emigrate())
+            elif command == 'immigrate':
+                tile.immigrate(*args)
+                conn.send(tile.export_ghosts())
+            elif command == 'ghosts':
+                tile.install_ghosts(*args)
+            elif command == 'gather':
+                conn.send(tile.gather())
+            elif command == 'count':
+                conn.send(len(tile.idx_of))
+            elif command == 'end':
+                tile.end()
+                conn.send(None)
+                break
+    finally:
+        conn.close()
+
+
+class PartitionedWorld:
+    """
+    A w x h world split into tiles = (nx, ny) tiles, stepped in parallel by
+    a worker process per tile. Agent code runs unchanged, 'agent.world' is
+    the worker's world. See the module docstring for the halo and ghosts.
+    'add_agent' returns the global id of the agent, 'gather' copies
+    all agents into a single World, e.g. to inspect or visualize it.
+    """
+
+    def __init__(self, w, h, tiles=None, torus_enabled=False, halo=1, max_steps=None, seed=None):
+        if tiles is None:
+            n = multiprocessing.cpu_count()
+            nx = max(1, int(np.sqrt(n * w / h)))
+            tiles = nx, max(1, n // nx)
+        self.w, self.h = w, h
+        self.tiles = tiles
+        self.torus_enabled = torus_enabled
+        self.halo = halo
+        self.max_steps = max_steps
+        self.time = 0
+        self.ended = False
+        nx, ny = tiles
+        self.n_tiles = nx * ny
+        self.rng = np.random.default_rng(seed)
+        seeds = np.random.SeedSequence(seed).spawn(self.n_tiles)
+        xs, ys = tile_bounds(w, nx), tile_bounds(h, ny)
+        self.tile_x = np.repeat(np.arange(nx), np.diff(xs)).tolist()
+        self.tile_y = (np.repeat(np.arange(ny), np.diff(ys)) * nx).tolist()
+        # agents added by the PartitionedWorld have gids of the origin n_tiles
+        self.next_gid = self.n_tiles
+        self.pending = {}
+        self.conns = []
+        self.processes = []
+        for i in range(self.n_tiles):
+            conn, child = multiprocessing.Pipe()
+            seed_i = int(seeds[i].generate_state(1, dtype=np.uint64)[0])
+            process = multiprocessing.Process(
+                target=run_tile, daemon=True,
+                args=(child, i, w, h, tiles, torus_enabled, halo, seed_i),
+            )
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.end()
+
+    def tile_of(self, pos):
+        return self.tile_x[pos.x] + self.tile_y[pos.y]
+
+    def add_agent(self, agent, pos: Vec2D = None):
+        """adds the agent before the next step, in the worker of its tile"""
+        if pos is None:
+            pos = Vec2D(int(self.rng.integers(self.w)), int(self.rng.integers(self.h)))
+        gid = self.next_gid
+        self.next_gid += self.n_tiles + 1
+        self.pending.setdefault(self.tile_of(pos), []).append((gid, agent, pos))
+        return gid
+
+    def send_pending(self):
+        if not self.pending:
+            return
+        for tile, agents in self.pending.items():
+            self.conns[tile].send(('add', agents))
+        self.pending = {}
+        # exchange the ghosts of the new agents
+        self.exchange({})
+
+    def exchange(self, events):
+        conns = self.conns
+        for tile, conn in enumerate(conns):
+            conn.send(('deliver', events.get(tile, [])))
+        migrants = self.route(conn.recv() for conn in conns)
+        for tile, conn in enumerate(conns):
+            conn.send(('immigrate', migrants.get(tile, [])))
+        ghosts = {}
+        for owner, conn in enumerate(conns):
+            for tile, records in conn.recv().items():
+                ghosts.setdefault(tile, []).extend((owner, record) for record in records)
+        for tile, conn in enumerate(conns):
+            conn.send(('ghosts', ghosts.get(tile, [])))
+
+    @staticmethod
+    def route(replies):
+        # tile -> items from dicts of tile -> items
+        routed = {}
+        for reply in replies:
+            for tile, items in reply.items():
+                routed.setdefault(tile, []).extend(items)
+        return routed
+
+    def step(self):
+        if self.ended:
+            return
+        self.send_pending()
+        for conn in self.conns:
+            conn.send(('step',))
+        events = {}
+        for conn in self.conns:
+            for owner, gid, event_type, data in conn.recv():
+                events.setdefault(owner, []).append((gid, event_type, data))
+        self.exchange(events)
+        self.time += 1
+        if self.max_steps is not None and self.time >= self.max_steps:
+            self.end()
+
+    def count(self):
+        """the number of agents, excluding ghosts"""
+        self.send_pending()
+        for conn in self.conns:
+            conn.send(('count',))
+        return sum(conn.recv() for conn in self.conns)
+
+    def gather(self):
+        """a World with copies of all agents, by global id order, without calling their handlers"""
+        self.send_pending()
+        for conn in self.conns:
+            conn.send(('gather',))
+        agents = [item for conn in self.conns for item in pickle.loads(conn.recv())]
+        agents.sort(key=lambda item: item[0])
+        world = World(self.w, self.h, self.torus_enabled)
+        world.time = self.time
+        for _, agent, pos in agents:
+            world.attach_agent(agent, pos)
+        return world
+
+    def end(self):
+        if self.ended:
+            return
+        self.ended = True
+        for conn in self.conns:
+            conn.send(('end',))
+        for conn, process in zip(self.conns, self.processes):
+            conn.recv()
+            conn.close()
+            process.join()
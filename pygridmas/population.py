@@ -0,0 +1,255 @@
+import numpy as np
+
+from pygridmas.vec2d import Vec2D
+from pygridmas.storage import ring_offsets
+from pygridmas.agent import Agent
+from pygridmas.groups import GroupSet
+import pygridmas.colors as Colors
+
+
+class Member(Agent):
+    """
+    Agent view of a single population member,
+    as returned by box scans. The state lives in the population arrays.
+    """
+
+    def __init__(self, population, i):
+        self.population = population
+        self.i = i
+        self.world = population.world
+
+    @property
+    def group_ids(self):
+        return self.population.group_ids
+
+    @property
+    def group_collision_ids(self):
+        return self.population.group_collision_ids
+
+    @property
+    def subscriptions(self):
+        return self.population.subscriptions
+
+    @property
+    def color(self):
+        return tuple(self.population.colors[self.i])
+
+    @color.setter
+    def color(self, color):
+        self.population.colors[self.i] = color
+
+    def pos(self) -> Vec2D:
+        x, y = self.population.xy[self.i]
+        return Vec2D(int(x), int(y))
+
+    def move_to(self, pos) -> bool:
+        return bool(self.population.move_to([(pos.x, pos.y)], [self.i])[0])
+
+    def move_rel(self, rel_pos) -> bool:
+        return self.move_to(self.pos() + rel_pos)
+
+    def receive_event(self, event_type, data):
+        self.population.receive_event(self.i, event_type, data)
+
+
+class Population:
+    """
+    A homogeneous group of n agents stored as arrays:
+    'xy' (n x 2) positions, 'colors' (n x 3) and 'alive' (n).
+    User state is added as further arrays of length n, e.g. in 'initialize'.
+    Instead of a step per agent, 'step_all' is called once per world step.
+    """
+    color = Colors.GREY50
+    group_ids = set()
+    group_collision_ids = set()
+    # event types handled by the members, None for all event types
+    subscriptions = None
+    # arrays stored in world snapshots
+    fields = ()
+    world = None
+
+    def __init__(self, n):
+        self.n = n
+        self.group_ids = GroupSet(self.group_ids)
+        self.group_collision_ids = GroupSet(self.group_collision_ids)
+        self.xy = np.zeros((n, 2), dtype=np.int64)
+        self.colors = np.empty((n, 3))
+        self.colors[:] = self.color
+        self.alive = np.ones(n, dtype=bool)
+        self.members = [None] * n
+        self._index = None
+
+    # handlers to be implemented in populations
+    def initialize(self):
+        pass
+
+    def step_all(self):
+        pass
+
+    def receive_event(self, i, event_type, data):
+        pass
+
+    def receive_events(self, idx, event_type, data):
+        # an event received by the members 'idx', can be vectorized
+        for i in idx.tolist():
+            self.receive_event(i, event_type, data)
+
+    def cleanup(self):
+        pass
+
+    # util functions
+    def member(self, i) -> Member:
+        member = self.members[i]
+        if member is None:
+            member = self.members[i] = Member(self, i)
+        return member
+
+    def alive_idx(self):
+        return np.flatnonzero(self.alive)
+
+    def remove(self, which):
+        self.alive[which] = False
+        for i in np.arange(self.n)[which]:
+            member = self.members[i]
+            if member is not None:
+                member.world = None
+        self.changed()
+
+    def changed(self):
+        # to be called after writing to 'xy' or 'alive' directly
+        self._index = None
+        if self.world is not None and self.world.group_counts is not None:
+            self.world.group_counts.population_changed(self)
+        if self.world is not None and self.world.navigation is not None:
+            self.world.navigation.population_changed(self)
+
+    def cells(self, xy=None):
+        xy = self.xy if xy is None else xy
+        return xy[..., 1] * self.world.w + xy[..., 0]
+
+    def index(self):
+        """(sorted cell ids, member indices in that order) of the living members"""
+        if self._index is None:
+            alive = self.alive_idx()
+            cells = self.cells(self.xy[alive])
+            order = np.argsort(cells, kind='stable')
+            self._index = cells[order], alive[order]
+        return self._index
+
+    def count_at(self, x, y):
+        cells, _ = self.index()
+        c = y * self.world.w + x
+        return int(np.searchsorted(cells, c, 'right') - np.searchsorted(cells, c, 'left'))
+
+    def in_box(self, cx, cy, rng):
+        """indices of the living members within 'rng' of (cx, cy)"""
+        cells, order = self.index()
+        lo, hi = self.world.box_row_cells(cx, cy, rng)
+        lo = np.searchsorted(cells, lo, 'left')
+        hi = np.searchsorted(cells, hi, 'right')
+        rows = np.flatnonzero(hi > lo)
+        if len(rows) == 0:
+            return order[:0]
+        return np.concatenate([order[lo[r]:hi[r]] for r in rows])
+
+    def in_ring(self, cx, cy, d, bounds):
+        """
+        (indices, offsets) of the living members on ring 'd' around (cx, cy),
+        in ring order, see 'ring_offsets'.
+        """
+        world = self.world
+        offsets = np.array(list(ring_offsets(d, bounds)), dtype=np.int64).reshape(-1, 2)
+        ring = ((cy + offsets[:, 1]) % world.h) * world.w + (cx + offsets[:, 0]) % world.w
+        cells, order = self.index()
+        lo = np.searchsorted(cells, ring, 'left')
+        n = np.searchsorted(cells, ring, 'right') - lo
+        hit = np.flatnonzero(n)
+        if len(hit) == 0:
+            return order[:0], offsets[:0]
+        idx = np.concatenate([order[lo[r]:lo[r] + n[r]] for r in hit])
+        return idx, np.repeat(offsets[hit], n[hit], axis=0)
+
+    def count_grid(self):
+        world = self.world
+        cells, _ = self.index()
+        return np.bincount(cells, minlength=world.w * world.h).reshape(world.h, world.w)
+
+    def count_in_box(self, rng, group_id=None, which=None):
+        """
+        Number of agents of a group (all if None) within 'rng' of each member,
+        excluding the member itself.
+        """
+        if which is None:
+            which = self.alive_idx()
+        xy = self.xy[which]
+        counts = self.world.get_group_counts().count_many(xy[:, 0], xy[:, 1], rng, group_id)
+        if group_id is None or group_id in self.group_ids:
+            counts -= 1
+        return counts
+
+    def move_rel(self, dxy, which=None):
+        if which is None:
+            which = self.alive_idx()
+        return self.move_to(self.xy[which] + dxy, which)
+
+    def move_to(self, xy, which=None):
+        """
+        Moves the members 'which' (all living if None) to the positions 'xy'
+        simultaneously, respecting the world boundaries and collisions.
+        Returns a boolean array telling which of the members moved.
+        """
+        world = self.world
+        if which is None:
+            which = self.alive_idx()
+        which = np.asarray(which, dtype=np.int64)
+        target = np.array(xy, dtype=np.int64).reshape(-1, 2)
+        moved = np.zeros(len(which), dtype=bool)
+        if world.torus_enabled:
+            target %= (world.w, world.h)
+            ok = self.alive[which].copy()
+        else:
+            ok = self.alive[which] & (target >= 0).all(axis=1) & (target < (world.w, world.h)).all(axis=1)
+        ok &= (target != self.xy[which]).any(axis=1)
+        if self.group_collision_ids:
+            ok[ok] = ~self.blocked(target[ok], which[ok])
+        moved[ok] = True
+        if ok.any():
+            self.xy[which[ok]] = target[ok]
+            self.changed()
+        return moved
+
+    def blocked(self, target, which):
+        world = self.world
+        coll = self.group_collision_ids
+        counts = world.get_group_counts()
+        # regular agents and other populations
+        blocked = np.zeros(len(target), dtype=bool)
+        for group_id in coll:
+            grid = counts.track(group_id)
+            blocked |= grid[target[:, 1], target[:, 0]] > 0
+        cells = self.cells(target)
+        for pop in world.populations:
+            if pop is not self and pop.group_ids & coll:
+                blocked |= np.isin(cells, pop.index()[0])
+        if not self.group_ids & coll:
+            return blocked
+        # members of this population: all moves happen at once, so a member
+        # may enter a cell that is left in the same move. Of several members
+        # entering the same cell, the first one in 'which' wins.
+        moving = np.flatnonzero(~blocked)
+        order = np.argsort(cells[moving], kind='stable')
+        sorted_cells = cells[moving][order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_cells[1:] != sorted_cells[:-1]
+        blocked[moving[order[~first]]] = True
+        # cells occupied after the move by members that do not move
+        occupied = np.zeros(world.w * world.h, dtype=bool)
+        staying = self.alive.copy()
+        staying[which[~blocked]] = False
+        occupied[self.cells(self.xy[staying])] = True
+        rejected = ~blocked
+        while rejected.any():
+            rejected = ~blocked & occupied[cells]
+            blocked |= rejected
+            occupied[self.cells(self.xy[which[rejected]])] = True
+        return blocked
@@ -0,0 +1,129 @@
+import time
+
+from pygridmas.storage import offset_bounds
+
+
+class ClassProfile:
+    """the costs of the agents of a class, see Profiler"""
+    __slots__ = ('steps', 'step_time', 'scans', 'scanned_cells', 'emitted', 'delivered', 'failed_moves')
+
+    def __init__(self):
+        self.steps = 0
+        self.step_time = 0.0
+        self.scans = 0
+        self.scanned_cells = 0
+        self.emitted = 0
+        self.delivered = 0
+        self.failed_moves = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def box_cells(bounds, rng):
+    # the number of cells within 'rng' of the center, inside the offset bounds
+    xlo, xhi, ylo, yhi = bounds
+    return max(min(rng, xhi) - max(-rng, xlo) + 1, 0) * max(min(rng, yhi) - max(-rng, ylo) + 1, 0)
+
+
+class Profiler:
+    """
+    Costs of a world per agent class, enabled by 'world.enable_profiling()':
+    the number and time of steps, box scans and the cells they cover,
+    events emitted and delivered, and moves that failed on the world's border
+    or a collision. Scans and emissions are counted for the class of the
+    agent being stepped, or for 'world' outside of agent steps (e.g. in
+    population steps). 'sections' holds the time of the world's other work.
+    Without a profiler, the world only tests 'world.profiler is None'.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.reset()
+
+    def reset(self):
+        self.classes = {}
+        self.world_profile = ClassProfile()
+        self.current = self.world_profile
+        self.sections = {'populations': 0.0, 'events': 0.0, 'layers': 0.0}
+        self.steps = 0
+        self.time = 0.0
+
+    def get(self, cls):
+        profile = self.classes.get(cls)
+        if profile is None:
+            profile = self.classes[cls] = ClassProfile()
+        return profile
+
+    def step_agent(self, agent):
+        profile = self.current = self.get(type(agent))
+        t = time.perf_counter()
+        try:
+            agent.step()
+        finally:
+            profile.step_time += time.perf_counter() - t
+            profile.steps += 1
+            self.current = self.world_profile
+
+    def section(self, name, fn):
+        t = time.perf_counter()
+        try:
+            fn()
+        finally:
+            self.sections[name] += time.perf_counter() - t
+
+    def scan(self, cx, cy, rng):
+        world = self.world
+        profile = self.current
+        profile.scans += 1
+        profile.scanned_cells += box_cells(offset_bounds(cx, cy, world.w, world.h, world.torus_enabled), rng)
+
+    def ring(self, bounds, d, new_scan):
+        # a lazy scan reaching ring d
+        profile = self.current
+        profile.scans += new_scan
+        profile.scanned_cells += box_cells(bounds, d) - (box_cells(bounds, d - 1) if d else 0)
+
+    def emitted(self):
+        self.current.emitted += 1
+
+    def delivered(self, receiver, n=1):
+        self.get(type(receiver)).delivered += n
+
+    def failed_move(self, agent):
+        self.get(type(agent)).failed_moves += 1
+
+    def results(self):
+        """dict of class name (or 'world') -> dict of the counters"""
+        results = {cls.__name__: profile.as_dict() for cls, profile in self.classes.items()}
+        results['world'] = self.world_profile.as_dict()
+        return results
+
+    def report(self):
+        """a table of the costs per class, the most expensive first"""
+        lines = ['{} steps in {:.3f} s ({:.1f} steps/s)'.format(
+            self.steps, self.time, self.steps / self.time if self.time else 0.0)]
+        header = ('class', 'steps', 'time s', 'us/step', 'scans', 'cells/scan', 'emitted', 'delivered', 'failed moves')
+        rows = []
+        profiles = sorted(self.classes.items(), key=lambda item: -item[1].step_time)
+        for name, p in [(cls.__name__, p) for cls, p in profiles] + [('world', self.world_profile)]:
+            rows.append((
+                name, p.steps, '{:.3f}'.format(p.step_time),
+                '{:.1f}'.format(p.step_time / p.steps * 1e6) if p.steps else '-',
+                p.scans, '{:.1f}'.format(p.scanned_cells / p.scans) if p.scans else '-',
+                p.emitted, p.delivered, p.failed_moves,
+            ))
+        widths = [max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))]
+        for row in [header] + rows:
+            lines.append('  '.join(str(v).rjust(w) if i else str(v).ljust(w) for i, (v, w) in enumerate(zip(row, widths))))
+        lines.append(', '.join('{}: {:.3f} s'.format(name, t) for name, t in self.sections.items()))
+        return '\n'.join(lines)
+
+    def summary(self, n=3):
+        """a short line of the share of the step time of the most expensive classes"""
+        total = sum(p.step_time for p in self.classes.values()) + sum(self.sections.values())
+        if not total:
+            return ''
+        parts = [(cls.__name__, p.step_time) for cls, p in self.classes.items()] + list(self.sections.items())
+        parts.sort(key=lambda part: -part[1])
+        return ', '.join('{} {:.0%}'.format(name, t / total) for name, t in parts[:n])
@@ -0,0 +1,125 @@
+import math
+
+import numpy as np
+
+from pygridmas.observer import WorldObserver
+
+
+class Raster(WorldObserver):
+    """
+    An RGB image of a world with 'sub' x 'sub' pixels per cell, row 0 at y = 0.
+    Only the cells marked dirty by adding, moving and removing agents or
+    changing their colors are repainted by 'update'.
+    With sub = 1 a cell shows the color of its last agent, otherwise its
+    agents are laid out in a grid within the cell.
+    Population members are drawn over the agents, a full cell each.
+    The cells without agents show the world's layer named 'layer', if given.
+    """
+
+    def __init__(self, world, sub=1, background=(0, 0, 0), layer=None):
+        self.world = world
+        self.sub = sub
+        self.background = to_rgb(background)
+        self.image = np.empty((world.h * sub, world.w * sub, 3), dtype=np.uint8)
+        self.image[:] = self.background
+        self.layer = layer
+        # the cells showing agents
+        self.covered = np.zeros((world.h, world.w), dtype=bool)
+        self.dirty = set()
+        for x, y, _ in world.storage.occupied():
+            self.dirty.add((x, y))
+        world.add_observer(self)
+
+    def close(self):
+        self.world.remove_observer(self)
+
+    def mark(self, x, y):
+        self.dirty.add((x, y))
+
+    def on_add(self, agent, pos):
+        if pos is not None:
+            self.dirty.add((pos.x, pos.y))
+
+    def on_remove(self, agent, pos):
+        if pos is not None:
+            self.dirty.add((pos.x, pos.y))
+
+    def on_move(self, agent, old_pos, new_pos):
+        self.dirty.add((old_pos.x, old_pos.y))
+        self.dirty.add((new_pos.x, new_pos.y))
+
+    def on_color(self, agent, pos):
+        if pos is not None:
+            self.dirty.add((pos.x, pos.y))
+
+    def update(self):
+        """repaints the dirty cells and returns the image, including the population members"""
+        dirty, self.dirty = self.dirty, set()
+        if dirty:
+            if self.sub == 1:
+                self.paint_cells(dirty)
+            else:
+                for x, y in dirty:
+                    self.paint_cell(x, y)
+        populations = self.world.populations
+        layer = None if self.layer is None else self.world.layers.get(self.layer)
+        if not populations and layer is None:
+            return self.image
+        s = self.sub
+        if layer is None:
+            image = self.image.copy()
+        else:
+            background = layer.image()
+            covered = self.covered
+            if s > 1:
+                background = background.repeat(s, axis=0).repeat(s, axis=1)
+                covered = covered.repeat(s, axis=0).repeat(s, axis=1)
+            image = np.where(covered[..., None], self.image, background)
+        if not populations:
+            return image
+        for population in populations:
+            alive = population.alive_idx()
+            xy = population.xy[alive] * s
+            colors = to_rgb(population.colors[alive])
+            for dy in range(s):
+                for dx in range(s):
+                    image[xy[:, 1] + dy, xy[:, 0] + dx] = colors
+        return image
+
+    def paint_cells(self, cells):
+        get = self.world.storage.get
+        xs, ys, colors = [], [], []
+        empty_xs, empty_ys = [], []
+        for x, y in cells:
+            agents = get(x, y)
+            if agents:
+                xs.append(x)
+                ys.append(y)
+                colors.append(agents[-1].color)
+            else:
+                empty_xs.append(x)
+                empty_ys.append(y)
+        if xs:
+            self.image[ys, xs] = to_rgb(colors)
+        self.image[empty_ys, empty_xs] = self.background
+        self.covered[ys, xs] = True
+        self.covered[empty_ys, empty_xs] = False
+
+    def paint_cell(self, x, y):
+        s = self.sub
+        block = self.image[y * s:(y + 1) * s, x * s:(x + 1) * s]
+        block[:] = self.background
+        agents = self.world.storage.get(x, y)
+        self.covered[y, x] = bool(agents)
+        if not agents:
+            return
+        n = math.ceil(math.sqrt(len(agents)))
+        edges = [round(i * s / n) for i in range(n + 1)]
+        for i, agent in enumerate(agents):
+            row, col = divmod(i, n)
+            block[edges[row]:edges[row + 1], edges[col]:edges[col + 1]] = to_rgb(agent.color)
+
+
+def to_rgb(colors):
+    """float colors in [0, 1] to uint8"""
+    return np.clip(np.rint(np.asarray(colors, dtype=np.float64) * 255), 0, 255).astype(np.uint8)
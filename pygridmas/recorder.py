@@ -0,0 +1,235 @@
+"""
+Trajectories of worlds, recorded to a directory of chunked .npy files:
+per chunk, the rows of all recorded steps ('id', 'xy', 'color' and a column
+per field) and the row offsets of the steps. Population members have the id -1.
+The chunks are memory mapped when read, so recordings can be larger than memory.
+"""
+import json
+import os
+
+import numpy as np
+
+from pygridmas.vec2d import Vec2D
+from pygridmas.observer import WorldObserver
+from pygridmas.world import World
+
+
+class Recorder(WorldObserver):
+    """
+    Records the positions, colors and 'fields' (numeric agent attributes,
+    NaN if missing) of the placed agents after every 'every' steps,
+    starting with the current state.
+    At most about 'chunk_rows' rows are kept in memory before they are written.
+    The recording is completed by 'close', which is called when the world ends.
+    """
+
+    def __init__(self, world: World, path, fields=(), every=1, chunk_rows=1 << 20):
+        self.world = world
+        self.path = path
+        self.fields = tuple(fields)
+        self.every = every
+        self.chunk_rows = chunk_rows
+        self.chunks = []
+        self.buffer = []
+        self.buffered_rows = 0
+        self.closed = False
+        os.makedirs(path, exist_ok=True)
+        # only told about steps, so adding, moving and removing agents stays fast
+        world.add_step_observer(self)
+        self.record()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def on_step(self):
+        if self.world.time % self.every == 0:
+            self.record()
+
+    def on_end(self):
+        self.close()
+
+    def record(self):
+        world = self.world
+        ids, xy, colors, fields = [], [], [], []
+        for idx, agent, pos in world.agents.placed():
+            ids.append(idx)
+            xy.append(pos)
+            colors.append(agent.color)
+            fields.append([getattr(agent, name, np.nan) for name in self.fields])
+        step = dict(
+            id=np.array(ids, dtype=np.int64),
+            xy=np.array(xy, dtype=np.int32).reshape(-1, 2),
+            color=np.array(colors, dtype=np.float32).reshape(-1, 3),
+            fields=np.array(fields, dtype=np.float64).reshape(len(ids), len(self.fields)),
+        )
+        for population in world.populations:
+            alive = population.alive_idx()
+            step['id'] = np.concatenate((step['id'], np.full(len(alive), -1, dtype=np.int64)))
+            step['xy'] = np.concatenate((step['xy'], population.xy[alive].astype(np.int32)))
+            step['color'] = np.concatenate((step['color'], population.colors[alive].astype(np.float32)))
+            step['fields'] = np.concatenate((step['fields'], np.full((len(alive), len(self.fields)), np.nan)))
+        self.buffer.append((world.time, step))
+        self.buffered_rows += len(step['id'])
+        if self.buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        prefix = os.path.join(self.path, 'chunk_{:05d}_'.format(len(self.chunks)))
+        steps = [step for _, step in self.buffer]
+        offsets = np.cumsum([0] + [len(step['id']) for step in steps])
+        np.save(prefix + 'time.npy', np.array([time for time, _ in self.buffer], dtype=np.int64))
+        np.save(prefix + 'offsets.npy', offsets)
+        for column in ('id', 'xy', 'color'):
+            np.save(prefix + column + '.npy', np.concatenate([step[column] for step in steps]))
+        fields = np.concatenate([step['fields'] for step in steps])
+        for i, name in enumerate(self.fields):
+            np.save(prefix + 'field_{}.npy'.format(name), fields[:, i])
+        self.chunks.append(len(self.buffer))
+        self.buffer = []
+        self.buffered_rows = 0
+        self.write_meta()
+
+    def write_meta(self):
+        world = self.world
+        meta = dict(w=world.w, h=world.h, torus_enabled=world.torus_enabled,
+                    fields=self.fields, every=self.every, chunks=self.chunks)
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self.write_meta()
+        if self in self.world.step_observers:
+            self.world.remove_step_observer(self)
+
+
+class Recording:
+    """
+    A recording written by a Recorder. 'frame(i)' returns the i-th recorded step
+    as a dict of arrays ('time', 'id', 'xy', 'color' and the fields),
+    read from memory mapped chunks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.w, self.h = meta['w'], meta['h']
+        self.torus_enabled = meta['torus_enabled']
+        self.fields = tuple(meta['fields'])
+        self.every = meta['every']
+        # index of the first frame of each chunk
+        self.starts = np.cumsum([0] + meta['chunks'])
+        self.loaded = {}
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def chunk(self, c):
+        chunk = self.loaded.get(c)
+        if chunk is None:
+            prefix = os.path.join(self.path, 'chunk_{:05d}_'.format(c))
+            columns = ['time', 'offsets', 'id', 'xy', 'color'] + ['field_' + name for name in self.fields]
+            chunk = {column: np.load(prefix + column + '.npy', mmap_mode='r') for column in columns}
+            # only a few chunks are kept open
+            if len(self.loaded) >= 4:
+                self.loaded.pop(next(iter(self.loaded)))
+            self.loaded[c] = chunk
+        return chunk
+
+    def frame(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        c = int(np.searchsorted(self.starts, i, 'right')) - 1
+        chunk = self.chunk(c)
+        i -= self.starts[c]
+        lo, hi = chunk['offsets'][i], chunk['offsets'][i + 1]
+        frame = dict(time=int(chunk['time'][i]))
+        for column in ('id', 'xy', 'color'):
+            frame[column] = chunk[column][lo:hi]
+        for name in self.fields:
+            frame[name] = chunk['field_' + name][lo:hi]
+        return frame
+
+    def __iter__(self):
+        return (self.frame(i) for i in range(len(self)))
+
+
+class RecordedAgent:
+    __slots__ = ('idx', 'color')
+
+    def __init__(self, idx, color):
+        self.idx = idx
+        self.color = color
+
+
+class ReplayWorld:
+    """
+    Plays a recording back in a Visualizer, e.g. Visualizer(ReplayWorld(path)).
+    'step' advances one recorded frame and 'seek' jumps to any frame.
+    Observers see the changes between frames as agents removed and added.
+    """
+
+    def __init__(self, recording):
+        if not isinstance(recording, Recording):
+            recording = Recording(recording)
+        self.recording = recording
+        self.w, self.h = recording.w, recording.h
+        self.populations = []
+        self.observers = []
+        self.storage = self
+        self.ended = False
+        self.cells = {}
+        self.i = 0
+        self.time = 0
+        self.seek(0)
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def seek(self, i):
+        self.i = min(max(i, 0), len(self.recording) - 1)
+        frame = self.recording.frame(self.i)
+        self.time = frame['time']
+        old, cells = self.cells, {}
+        for idx, (x, y), color in zip(frame['id'].tolist(), frame['xy'].tolist(), frame['color'].tolist()):
+            cells.setdefault((x, y), []).append(RecordedAgent(idx, tuple(color)))
+        self.cells = cells
+        if not self.observers:
+            return
+        for cell in old.keys() | cells.keys():
+            before, after = old.get(cell, ()), cells.get(cell, ())
+            if [a.color for a in before] == [a.color for a in after]:
+                continue
+            pos = Vec2D(*cell)
+            for observer in self.observers:
+                for agent in before:
+                    observer.on_remove(agent, pos)
+                for agent in after:
+                    observer.on_add(agent, pos)
+
+    def step(self):
+        # stays at the last frame
+        if self.i + 1 < len(self.recording):
+            self.seek(self.i + 1)
+
+    def end(self):
+        self.ended = True
+
+    def get(self, x, y):
+        return self.cells.get((x, y), ())
+
+    def occupied(self):
+        for (x, y), agents in self.cells.items():
+            yield x, y, agents
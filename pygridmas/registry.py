@@ -0,0 +1,161 @@
+class AgentRegistry:
+    """
+    The agents of a world, stored in dense array-indexed slots with their
+    positions (None if not placed).
+    Indices of removed agents are reused from a free list, except while the
+    registry is being iterated, so that the iteration is stable.
+    Behaves like a dict of idx -> agent.
+    """
+
+    def __init__(self):
+        self.slots = []
+        self.positions = []
+        self.free = []
+        self.n = 0
+        self.n_placed = 0
+        self.iterating = 0
+
+    def add(self, agent, pos=None):
+        if self.free and not self.iterating:
+            idx = self.free.pop()
+            self.slots[idx] = agent
+            self.positions[idx] = pos
+        else:
+            idx = len(self.slots)
+            self.slots.append(agent)
+            self.positions.append(pos)
+        self.n += 1
+        if pos is not None:
+            self.n_placed += 1
+        return idx
+
+    def add_many(self, agents, positions):
+        """adds the agents at the positions (None if not placed), returns their idx"""
+        n = len(agents)
+        reused = [] if self.iterating else self.free[max(len(self.free) - n, 0):][::-1]
+        if reused:
+            del self.free[-len(reused):]
+            for idx, agent, pos in zip(reused, agents, positions):
+                self.slots[idx] = agent
+                self.positions[idx] = pos
+        start = len(self.slots)
+        self.slots += agents[len(reused):]
+        self.positions += positions[len(reused):]
+        self.n += n
+        self.n_placed += n - sum(1 for pos in positions if pos is None)
+        return reused + list(range(start, len(self.slots)))
+
+    def grow(self, n):
+        """grows the slots to at least n, the new slots are free"""
+        slots = self.slots
+        if n > len(slots):
+            self.free += range(len(slots), n)
+            slots += [None] * (n - len(slots))
+            self.positions += [None] * (n - len(self.positions))
+
+    def put_many(self, ids, agents, positions):
+        """puts the agents at the positions into the free slots 'ids', growing the slots as needed"""
+        slots = self.slots
+        for idx in ids:
+            if idx < len(slots) and slots[idx] is not None:
+                raise ValueError('slot {} is taken'.format(idx))
+        self.grow(max(ids, default=-1) + 1)
+        taken = set(ids)
+        self.free[:] = [idx for idx in self.free if idx not in taken]
+        for idx, agent, pos in zip(ids, agents, positions):
+            slots[idx] = agent
+            self.positions[idx] = pos
+        self.n += len(ids)
+        self.n_placed += len(ids) - sum(1 for pos in positions if pos is None)
+
+    def remove(self, idx):
+        agent = self[idx]
+        pos = self.positions[idx]
+        self.slots[idx] = None
+        self.positions[idx] = None
+        self.free.append(idx)
+        self.n -= 1
+        if pos is not None:
+            self.n_placed -= 1
+        return agent, pos
+
+    def clear(self):
+        self.slots.clear()
+        self.positions.clear()
+        self.free.clear()
+        self.n = self.n_placed = 0
+
+    def placed(self):
+        """yields (idx, agent, pos) for the agents with a position"""
+        for idx, pos in enumerate(self.positions):
+            if pos is not None:
+                yield idx, self.slots[idx], pos
+
+    # dict interface
+    def __getitem__(self, idx):
+        agent = self.slots[idx] if 0 <= idx < len(self.slots) else None
+        if agent is None:
+            raise KeyError(idx)
+        return agent
+
+    def get(self, idx, default=None):
+        try:
+            return self[idx]
+        except KeyError:
+            return default
+
+    def __contains__(self, idx):
+        return 0 <= idx < len(self.slots) and self.slots[idx] is not None
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return (idx for idx, agent in enumerate(self.slots) if agent is not None)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [agent for agent in self.slots if agent is not None]
+
+    def items(self):
+        return [(idx, agent) for idx, agent in enumerate(self.slots) if agent is not None]
+
+
+class PositionView:
+    """dict like view of idx -> position of the placed agents"""
+
+    def __init__(self, registry: AgentRegistry):
+        self.registry = registry
+
+    def __getitem__(self, idx):
+        pos = self.registry.positions[idx] if idx in self.registry else None
+        if pos is None:
+            raise KeyError(idx)
+        return pos
+
+    def get(self, idx, default=None):
+        try:
+            return self[idx]
+        except KeyError:
+            return default
+
+    def __contains__(self, idx):
+        return idx in self.registry and self.registry.positions[idx] is not None
+
+    def __len__(self):
+        return self.registry.n_placed
+
+    def __iter__(self):
+        return (idx for idx, _, _ in self.registry.placed())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [pos for _, _, pos in self.registry.placed()]
+
+    def items(self):
+        return [(idx, pos) for idx, _, pos in self.registry.placed()]
+
@@ -0,0 +1,137 @@
+"""
+Running a world in a worker process, for the RemoteVisualizer.
+The worker publishes frames rendered by a Raster into a SharedFrame and
+takes commands from the window over a Pipe. Nothing here needs pyglet.
+"""
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from pygridmas.raster import Raster
+
+# header fields
+SEQ, BUFFER, SUB, TIME, ENDED, SPEED, PAUSED = range(7)
+HEADER = 8
+
+
+class SharedFrame:
+    """
+    Double buffered RGB frames of up to (h * max_sub, w * max_sub) pixels in
+    shared memory, after a header with the frame's sequence number, buffer,
+    pixels per cell, world time, ended flag, steps per second and paused flag.
+    Created by the window, attached to by the worker with the name.
+    """
+
+    def __init__(self, w, h, max_sub, name=None):
+        self.w, self.h, self.max_sub = w, h, max_sub
+        n = w * h * max_sub * max_sub * 3
+        if name is None:
+            self.shm = SharedMemory(create=True, size=HEADER * 8 + 2 * n)
+        else:
+            # the worker shares the window's resource tracker, the window unlinks it
+            self.shm = SharedMemory(name=name)
+        self.header = np.ndarray(HEADER, dtype=np.float64, buffer=self.shm.buf)
+        self.buffers = [np.ndarray(n, dtype=np.uint8, buffer=self.shm.buf, offset=HEADER * 8 + i * n) for i in range(2)]
+        if name is None:
+            self.header[:] = 0
+            self.header[SUB] = 1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, image, time, ended, speed, paused):
+        """publishes a frame, or only the header if 'image' is None"""
+        header = self.header
+        if image is not None:
+            buffer = 1 - int(header[BUFFER])
+            self.buffers[buffer][:image.size] = image.ravel()
+            header[SUB] = image.shape[1] // self.w
+            header[BUFFER] = buffer
+        header[TIME], header[ENDED], header[SPEED], header[PAUSED] = time, ended, speed, paused
+        header[SEQ] += 1
+
+    def read_header(self):
+        return self.header.copy()
+
+    def read(self):
+        """(image, header) of the latest frame"""
+        for _ in range(4):
+            header = self.header.copy()
+            sub = int(header[SUB])
+            n = self.w * self.h * sub * sub * 3
+            image = self.buffers[int(header[BUFFER])][:n].copy()
+            # the writer has not started to overwrite this buffer in the meantime
+            if self.header[SEQ] - header[SEQ] < 1:
+                break
+        return image.reshape(self.h * sub, self.w * sub, 3), header
+
+    def close(self):
+        # the arrays must not outlive the buffer
+        del self.header, self.buffers
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def run_simulation(world, frame_name, conn, max_sub, target_speed=None, paused=False,
+                   performance=True, render=True, target_fps=30, layer=None):
+    """
+    Steps 'world' as fast as possible (or at 'target_speed' steps per second)
+    and publishes a frame about 'target_fps' times per second. Commands received on 'conn':
+    ('pause', bool), ('step',), ('speed', steps per second or None),
+    ('performance', bool), ('render', bool) and ('end',).
+    """
+    frame = SharedFrame(world.w, world.h, max_sub, frame_name)
+    raster = Raster(world, 1 if performance else max_sub, layer=layer)
+    dt_frame = 1 / target_fps
+    last_publish = time.time()
+    next_step = last_publish
+    speed, steps = 0.0, 0
+    try:
+        while True:
+            step_once = False
+            while conn.poll():
+                command, *args = conn.recv()
+                if command == 'pause':
+                    paused = args[0]
+                elif command == 'step':
+                    step_once = True
+                elif command == 'speed':
+                    target_speed = args[0]
+                    next_step = time.time()
+                elif command == 'performance':
+                    raster.close()
+                    raster = Raster(world, 1 if args[0] else max_sub, layer=layer)
+                elif command == 'render':
+                    render = args[0]
+                elif command == 'end':
+                    world.end()
+            if world.ended:
+                frame.write(raster.update(), world.time, True, 0, paused)
+                break
+
+            now = time.time()
+            if step_once or not (paused or target_speed is not None and now < next_step):
+                world.step()
+                steps += 1
+                if target_speed is not None:
+                    # do not catch up more than a second
+                    next_step = max(next_step + 1 / target_speed, now - 1)
+            elif paused:
+                conn.poll(dt_frame)
+            else:
+                time.sleep(min(next_step - now, dt_frame))
+
+            now = time.time()
+            if now - last_publish >= dt_frame:
+                speed = speed * 0.5 + 0.5 * steps / (now - last_publish)
+                steps = 0
+                last_publish = now
+                frame.write(raster.update() if render else None, world.time, False, speed, paused)
+    finally:
+        raster.close()
+        frame.close()
+        conn.close()
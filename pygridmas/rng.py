@@ -0,0 +1,51 @@
+import math
+import random
+
+import numpy as np
+
+
+class RandomStream:
+    """
+    A seeded random number generator owned by a world.
+    Single draws are served from buffers which are refilled in bulk from a
+    numpy generator, avoiding a numpy call per random number.
+    The numpy generator itself is available as 'generator' for array draws.
+    """
+
+    def __init__(self, seed=None, buffer_size=4096):
+        if seed is None:
+            # follow the global rng, so random.seed(...) still makes runs reproducible
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.generator = np.random.default_rng(seed)
+        self.buffer_size = buffer_size
+        self.floats = iter(())
+
+    def get_state(self):
+        # the buffered numbers are part of the state
+        floats = list(self.floats)
+        self.floats = iter(floats)
+        return dict(seed=self.seed, bit_generator=self.generator.bit_generator.state, floats=floats)
+
+    def set_state(self, state):
+        self.seed = state['seed']
+        self.generator.bit_generator.state = state['bit_generator']
+        self.floats = iter(list(state['floats']))
+
+    def random(self):
+        """float in [0, 1)"""
+        try:
+            return next(self.floats)
+        except StopIteration:
+            self.floats = iter(self.generator.random(self.buffer_size).tolist())
+            return next(self.floats)
+
+    def randint(self, a, b):
+        """int in [a, b], like random.randint"""
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def angle(self):
+        return self.random() * math.pi * 2
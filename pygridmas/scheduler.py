@@ -0,0 +1,207 @@
+import heapq
+
+
+class Scheduler:
+    """
+    Keeps track of which agents are stepped. The awake agents are kept in a
+    dict in wake-up order, which the step sorts when few agents are awake and
+    otherwise replaces by a walk over the slots, skipping those not flagged
+    awake, so a step costs O(min(awake * log(awake), slots)) and an idle
+    world costs nothing however many agents sleep.
+    Sleeping agents wait in a timer heap for their wake-up time
+    and/or for an event if they sleep with 'wake_on_event'.
+    Agents woken during the agent steps are stepped from the next step on.
+    Agents with a step period > 1 go to sleep for the rest of the period
+    after each of their steps.
+    """
+
+    def __init__(self):
+        # awake flag per agent idx, False for sleeping agents and free slots,
+        # tested by the world's step before stepping an agent
+        self.awake = []
+        # idx of the awake agents, as dict keys.
+        # a dict is not shrunk by deletions, so it is compacted in 'due'
+        # once more keys have been deleted than are left
+        self.awake_ids = {}
+        self.n_deleted = 0
+        # while stepping, the flags of woken agents are set after the agent steps
+        self.stepping = False
+        self.woken = []
+        # heap of (wake time, idx), outdated entries are skipped when popped
+        self.timers = []
+        # idx -> wake time of the sleeping agents with a timer
+        self.wake_times = {}
+        # idx of the sleeping agents that wake up when receiving an event
+        self.on_event = set()
+        # idx -> step period of the agents with a step period > 1
+        self.periods = {}
+
+    @property
+    def n_awake(self):
+        return len(self.awake_ids)
+
+    def add(self, idx):
+        awake = self.awake
+        if idx >= len(awake):
+            awake += [False] * (idx + 1 - len(awake))
+        awake[idx] = True
+        self.awake_ids[idx] = None
+
+    def add_many(self, idx):
+        awake = self.awake
+        if idx and max(idx) >= len(awake):
+            awake += [False] * (max(idx) + 1 - len(awake))
+        for i in idx:
+            awake[i] = True
+        self.awake_ids.update(dict.fromkeys(idx))
+
+    def set_awake(self, flags):
+        """sets the awake flags of all agent idx"""
+        self.awake[:] = flags
+        self.awake_ids = dict.fromkeys(idx for idx, awake in enumerate(flags) if awake)
+        self.n_deleted = 0
+
+    def remove(self, idx):
+        self.awake[idx] = False
+        if idx in self.awake_ids:
+            del self.awake_ids[idx]
+            self.n_deleted += 1
+        self.wake_times.pop(idx, None)
+        self.on_event.discard(idx)
+        self.periods.pop(idx, None)
+
+    def clear(self):
+        self.awake.clear()
+        self.awake_ids = {}
+        self.n_deleted = 0
+        self.woken.clear()
+        self.timers.clear()
+        self.wake_times.clear()
+        self.on_event.clear()
+        self.periods.clear()
+
+    def copy(self):
+        scheduler = Scheduler()
+        scheduler.awake[:] = self.awake
+        scheduler.awake_ids.update(self.awake_ids)
+        for idx in self.woken:
+            if idx in self.awake_ids:
+                scheduler.awake[idx] = True
+        scheduler.timers[:] = self.timers
+        scheduler.wake_times.update(self.wake_times)
+        scheduler.on_event.update(self.on_event)
+        scheduler.periods.update(self.periods)
+        return scheduler
+
+    def set_period(self, idx, period):
+        if period > 1:
+            self.periods[idx] = period
+        else:
+            self.periods.pop(idx, None)
+
+    def is_awake(self, idx):
+        return idx in self.awake_ids
+
+    def awake_idx(self):
+        """the idx of the awake agents, in idx order"""
+        return sorted(self.awake_ids)
+
+    def due(self, n):
+        """
+        the idx to walk in a step over 'n' slots, in idx order: the sorted awake
+        idx if few agents are awake, otherwise all idx.
+        The awake flags of the walked idx are still to be tested.
+        """
+        if self.n_deleted > len(self.awake_ids) + 64:
+            self.awake_ids = dict(self.awake_ids)
+            self.n_deleted = 0
+        if len(self.awake_ids) * 4 < n:
+            return sorted(self.awake_ids)
+        return range(n)
+
+    def sleep(self, idx, wake_time=None, wake_on_event=True):
+        """
+        Puts an agent to sleep until 'wake_time' (forever if None)
+        and/or until it receives an event.
+        """
+        self.awake[idx] = False
+        if idx in self.awake_ids:
+            del self.awake_ids[idx]
+            self.n_deleted += 1
+        self.wake_times.pop(idx, None)
+        self.on_event.discard(idx)
+        if wake_time is not None:
+            self.wake_times[idx] = wake_time
+            heapq.heappush(self.timers, (wake_time, idx))
+        if wake_on_event:
+            self.on_event.add(idx)
+
+    def wake(self, idx):
+        self.wake_times.pop(idx, None)
+        self.on_event.discard(idx)
+        if idx not in self.awake_ids:
+            self.awake_ids[idx] = None
+            if self.stepping:
+                self.woken.append(idx)
+            else:
+                self.awake[idx] = True
+
+    def end_step(self):
+        """flags the agents woken during the agent steps as awake"""
+        self.stepping = False
+        awake, awake_ids = self.awake, self.awake_ids
+        for idx in self.woken:
+            if idx in awake_ids:
+                awake[idx] = True
+        self.woken.clear()
+
+    def wake_due(self, time):
+        """wakes the agents with a wake time up to 'time'"""
+        timers, wake_times = self.timers, self.wake_times
+        while timers and timers[0][0] <= time:
+            wake_time, idx = heapq.heappop(timers)
+            if wake_times.get(idx) == wake_time:
+                self.wake(idx)
+
+
+class ActiveView:
+    """dict like view of idx -> agent of the awake agents"""
+
+    def __init__(self, registry, scheduler: Scheduler):
+        self.registry = registry
+        self.scheduler = scheduler
+
+    def __getitem__(self, idx):
+        if idx not in self:
+            raise KeyError(idx)
+        return self.registry.slots[idx]
+
+    def __setitem__(self, idx, agent):
+        assert self.registry[idx] is agent
+        self.scheduler.wake(idx)
+
+    def pop(self, idx, *default):
+        if idx not in self:
+            if default:
+                return default[0]
+            raise KeyError(idx)
+        self.scheduler.sleep(idx, wake_on_event=False)
+        return self.registry.slots[idx]
+
+    def __contains__(self, idx):
+        return self.scheduler.is_awake(idx)
+
+    def __len__(self):
+        return self.scheduler.n_awake
+
+    def __iter__(self):
+        return iter(self.scheduler.awake_idx())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self.registry.slots[idx] for idx in self]
+
+    def items(self):
+        return [(idx, self.registry.slots[idx]) for idx in self]
@@ -0,0 +1,352 @@
+"""
+Snapshots of worlds in a single uncompressed .npz file.
+Per agent, the class, position, color, group ids, subscriptions, scheduling
+and the attributes named in the class' 'fields' are stored as arrays.
+Other agent attributes fall back to their class attributes on restore.
+The world's layers are stored as arrays too.
+Handlers are not called: 'initialize' is not called on restore.
+Restoring and forking rebuild the agent objects in bulk, which costs a few
+microseconds per agent (about 0.3 s per 100k agents), so it is cheaper than
+building the world again, but not free for large worlds.
+The small tables (classes, group ids, ...) are pickled,
+so only restore snapshots from trusted sources.
+"""
+import copy
+import gc
+import heapq
+import pickle
+from contextlib import contextmanager
+
+import numpy as np
+
+from pygridmas.vec2d import Vec2D
+from pygridmas.registry import AgentRegistry, PositionView
+from pygridmas.scheduler import Scheduler, ActiveView
+from pygridmas.events import EventBus
+from pygridmas.rng import RandomStream
+from pygridmas.groups import CellMasks, GroupSet, group_mask
+
+
+@contextmanager
+def no_gc():
+    # building many containers at once triggers many useless gc passes
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def slot_names(cls):
+    names = []
+    for c in cls.__mro__:
+        for name in c.__dict__.get('__slots__', ()):
+            if name not in ('__weakref__', '__dict__'):
+                names.append(name)
+    return names
+
+
+def copy_agent(agent, names):
+    # like copy.copy, for slotted agents. The slots are copied,
+    # so the defaults set by Agent.__new__ are skipped
+    clone = object.__new__(type(agent))
+    for name in names:
+        try:
+            setattr(clone, name, getattr(agent, name))
+        except AttributeError:
+            pass
+    d = getattr(agent, '__dict__', None)
+    if d:
+        clone.__dict__.update(d)
+    return clone
+
+
+def ragged(sets, table):
+    # sets of hashables as (offsets, values) with the values indexing 'table'
+    ids = {}
+    for i, value in enumerate(table):
+        ids[value] = i
+    ptr, val = [0], []
+    for s in sets:
+        for value in s:
+            i = ids.get(value)
+            if i is None:
+                i = ids[value] = len(table)
+                table.append(value)
+            val.append(i)
+        ptr.append(len(val))
+    return np.array(ptr, dtype=np.int64), np.array(val, dtype=np.int32)
+
+
+def unragged(ptr, val, table, kind=set):
+    values = [table[i] for i in val.tolist()]
+    ptr = ptr.tolist()
+    return [kind(values[ptr[i]:ptr[i + 1]]) for i in range(len(ptr) - 1)]
+
+
+def field_array(values):
+    a = np.asarray(values)
+    if a.dtype == object or a.ndim != 1:
+        return None
+    return a
+
+
+def save_world(world, file):
+    with no_gc():
+        _save_world(world, file)
+
+
+def _save_world(world, file):
+    if world.events.queue:
+        raise RuntimeError("snapshots are taken between steps")
+    registry, scheduler = world.agents, world.scheduler
+    n = len(registry.slots)
+    classes, class_ids = [], {}
+    agent_class = [-1] * n
+    xy = [(-1, -1)] * n
+    color = [(0, 0, 0)] * n
+    step_period = [1] * n
+    subs_none = [False] * n
+    group_ids, collision_ids, subscriptions = [()] * n, [()] * n, [()] * n
+    by_class = {}
+    positions = registry.positions
+    for idx, agent in enumerate(registry.slots):
+        if agent is None:
+            continue
+        cls = type(agent)
+        c = class_ids.get(cls)
+        if c is None:
+            c = class_ids[cls] = len(classes)
+            classes.append(cls)
+        agent_class[idx] = c
+        by_class.setdefault(c, []).append(agent)
+        pos = positions[idx]
+        if pos is not None:
+            xy[idx] = pos
+        color[idx] = agent.color
+        step_period[idx] = agent.step_period
+        group_ids[idx] = agent.group_ids
+        collision_ids[idx] = agent.group_collision_ids
+        if agent.subscriptions is None:
+            subs_none[idx] = True
+        else:
+            subscriptions[idx] = agent.subscriptions
+    wake_time = np.full(n, -1, dtype=np.int64)
+    for idx, t in scheduler.wake_times.items():
+        wake_time[idx] = t
+    awake = np.zeros(n, dtype=bool)
+    awake[[idx for idx in scheduler.awake_ids if idx < n]] = True
+    on_event = np.zeros(n, dtype=bool)
+    on_event[list(scheduler.on_event)] = True
+    arrays = dict(
+        agent_class=np.array(agent_class, dtype=np.int32), xy=np.array(xy, dtype=np.int64).reshape(n, 2),
+        color=np.array(color, dtype=float).reshape(n, 3), step_period=np.array(step_period, dtype=np.int64),
+        wake_time=wake_time, awake=awake, on_event=on_event, subs_none=np.array(subs_none, dtype=bool),
+    )
+    group_table, subs_table = [], []
+    arrays['group_ptr'], arrays['group_val'] = ragged(group_ids, group_table)
+    arrays['collision_ptr'], arrays['collision_val'] = ragged(collision_ids, group_table)
+    arrays['subs_ptr'], arrays['subs_val'] = ragged(subscriptions, subs_table)
+
+    # declared fields, per class in idx order
+    object_fields = {}
+    for c, agents in by_class.items():
+        for name in classes[c].fields:
+            values = [getattr(agent, name) for agent in agents]
+            a = field_array(values)
+            if a is None:
+                object_fields[(c, name)] = values
+            else:
+                arrays['field_{}_{}'.format(c, name)] = a
+
+    populations = []
+    for j, population in enumerate(world.populations):
+        populations.append(dict(
+            cls=type(population), n=population.n, group_ids=population.group_ids,
+            group_collision_ids=population.group_collision_ids, subscriptions=population.subscriptions,
+        ))
+        arrays['pop{}_xy'.format(j)] = population.xy
+        arrays['pop{}_colors'.format(j)] = population.colors
+        arrays['pop{}_alive'.format(j)] = population.alive
+        for name in population.fields:
+            arrays['pop{}_field_{}'.format(j, name)] = getattr(population, name)
+
+    layers = []
+    for j, layer in enumerate(world.layers.values()):
+        arrays['layer{}'.format(j)] = layer.data
+        layer = copy.copy(layer)
+        layer.data = None
+        layers.append(layer)
+
+    meta = dict(
+        cls=type(world), w=world.w, h=world.h, torus_enabled=world.torus_enabled,
+        max_steps=world.max_steps, storage=type(world.storage), time=world.time, ended=world.ended,
+        synchronous=world.synchronous, rng=world.rng.get_state(), classes=classes, group_table=group_table, subs_table=subs_table,
+        object_fields=object_fields, free=registry.free, populations=populations, layers=layers,
+    )
+    arrays['meta'] = np.frombuffer(pickle.dumps(meta), dtype=np.uint8)
+    np.savez(file, **arrays)
+
+
+def load_world(file):
+    with no_gc():
+        return _load_world(file)
+
+
+def _load_world(file):
+    data = np.load(file)
+    meta = pickle.loads(data['meta'].tobytes())
+    world = meta['cls'](meta['w'], meta['h'], meta['torus_enabled'], meta['max_steps'], meta['storage'], seed=0)
+    world.time = meta['time']
+    world.ended = meta['ended']
+    world.synchronous = meta.get('synchronous', False)
+    world.rng.set_state(meta['rng'])
+
+    agent_class = data['agent_class']
+    color = list(map(tuple, data['color'].tolist()))
+    step_period = data['step_period'].tolist()
+    group_table, subs_table = meta['group_table'], meta['subs_table']
+    # copied into the agents' GroupSets, with the masks of the distinct sets
+    group_ids = unragged(data['group_ptr'], data['group_val'], group_table, tuple)
+    collision_ids = unragged(data['collision_ptr'], data['collision_val'], group_table, tuple)
+    masks = {g: group_mask(g) for g in set(group_ids).union(collision_ids)}
+    subscriptions = unragged(data['subs_ptr'], data['subs_val'], subs_table)
+    subs_none = data['subs_none'].tolist()
+
+    classes = meta['classes']
+    ids = np.flatnonzero(agent_class >= 0).tolist()
+    # all slots are written directly, without the defaults set by Agent.__new__,
+    # the agents are not in a world yet
+    new = object.__new__
+    agents = [new(classes[c]) for c in agent_class[ids].tolist()]
+    for agent, idx in zip(agents, ids):
+        agent._color = color[idx]
+        g = group_ids[idx]
+        agent._group_ids = GroupSet(g, agent, masks[g])
+        g = collision_ids[idx]
+        agent._group_collision_ids = GroupSet(g, None, masks[g])
+        agent.subscriptions = None if subs_none[idx] else subscriptions[idx]
+        agent._step_period = step_period[idx]
+    xy = data['xy'][ids]
+    positions = Vec2D.many(*xy.T.tolist())
+    if (xy[:, 0] < 0).any():
+        positions = [None if x < 0 else pos for x, pos in zip(xy[:, 0].tolist(), positions)]
+    # all slots, the free ones after the last agent too
+    world.agents.grow(len(agent_class))
+    world.attach_agents(agents, positions, ids)
+    world.agents.free[:] = meta['free']
+    slots = world.agents.slots
+
+    for c, cls in enumerate(classes):
+        which = np.flatnonzero(agent_class == c).tolist()
+        for name in cls.fields:
+            values = meta['object_fields'].get((c, name))
+            if values is None:
+                values = data['field_{}_{}'.format(c, name)].tolist()
+            for idx, value in zip(which, values):
+                setattr(slots[idx], name, value)
+
+    # the step periods are registered by attach_agents
+    scheduler = world.scheduler
+    scheduler.set_awake(data['awake'].tolist())
+    wake_time = data['wake_time']
+    for idx in np.flatnonzero(wake_time >= 0).tolist():
+        scheduler.wake_times[idx] = int(wake_time[idx])
+    scheduler.timers[:] = [(t, idx) for idx, t in scheduler.wake_times.items()]
+    heapq.heapify(scheduler.timers)
+    scheduler.on_event.update(np.flatnonzero(data['on_event']).tolist())
+
+    for j, p in enumerate(meta['populations']):
+        cls = p['cls']
+        population = cls.__new__(cls)
+        population.n = p['n']
+        population.group_ids = p['group_ids']
+        population.group_collision_ids = p['group_collision_ids']
+        population.subscriptions = p['subscriptions']
+        population.xy = np.array(data['pop{}_xy'.format(j)])
+        population.colors = np.array(data['pop{}_colors'.format(j)])
+        population.alive = np.array(data['pop{}_alive'.format(j)])
+        for name in cls.fields:
+            setattr(population, name, np.array(data['pop{}_field_{}'.format(j, name)]))
+        population.members = [None] * population.n
+        population._index = None
+        population.world = world
+        world.populations.append(population)
+    for j, layer in enumerate(meta.get('layers', ())):
+        layer.data = np.array(data['layer{}'.format(j)])
+        world.layers[layer.name] = layer
+    return world
+
+
+def fork_world(world, seed=None):
+    """
+    An independent copy of 'world', sharing no mutable state with it.
+    Agents are shallow copies: their sets of group ids and subscriptions
+    are copied, other mutable attributes are shared.
+    Observers are not copied. The fork continues the random numbers of
+    'world' unless a seed is given.
+    """
+    with no_gc():
+        return _fork_world(world, seed)
+
+
+def _fork_world(world, seed):
+    if world.events.queue:
+        raise RuntimeError("worlds are forked between steps")
+    clone = copy.copy(world)
+    clone.storage = type(world.storage)(world.w, world.h)
+    clone.agents = registry = AgentRegistry()
+    clone.scheduler = Scheduler()
+    clone.agent_pos = PositionView(registry)
+    clone.positions = registry.positions
+    clone.group_masks = CellMasks()
+    clone.events = EventBus(clone)
+    clone.observers = []
+    clone.step_observers = []
+    clone.group_counts = None
+    clone.statistics = None
+    clone.navigation = None
+    clone.group_index = None
+    clone.profiler = None
+    clone.rng = RandomStream(seed)
+    if seed is None:
+        clone.rng.set_state(world.rng.get_state())
+
+    names = {}
+    agents, ids = [], []
+    for idx, agent in enumerate(world.agents.slots):
+        if agent is not None:
+            cls = type(agent)
+            if cls not in names:
+                names[cls] = slot_names(cls)
+            agent = copy_agent(agent, names[cls])
+            group_ids, collision_ids = agent._group_ids, agent._group_collision_ids
+            agent._group_ids = GroupSet(group_ids, agent, group_ids.mask)
+            agent._group_collision_ids = GroupSet(collision_ids, None, collision_ids.mask)
+            if agent.subscriptions is not None:
+                agent.subscriptions = set(agent.subscriptions)
+            agents.append(agent)
+            ids.append(idx)
+    positions = world.agents.positions
+    registry.grow(len(world.agents.slots))
+    clone.attach_agents(agents, [positions[idx] for idx in ids], ids)
+    registry.free[:] = world.agents.free
+    clone.scheduler = world.scheduler.copy()
+    clone.active_agents = ActiveView(registry, clone.scheduler)
+
+    clone.populations = []
+    for population in world.populations:
+        population = copy.copy(population)
+        population.xy = population.xy.copy()
+        population.colors = population.colors.copy()
+        population.alive = population.alive.copy()
+        for name in population.fields:
+            setattr(population, name, getattr(population, name).copy())
+        population.members = [None] * population.n
+        population._index = None
+        population.world = clone
+        clone.populations.append(population)
+    clone.layers = {name: layer.copy() for name, layer in world.layers.items()}
+    return clone
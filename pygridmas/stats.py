@@ -0,0 +1,205 @@
+import numpy as np
+
+from pygridmas.observer import WorldObserver
+
+
+class RingBuffer:
+    """The last 'capacity' values of a time series, in a fixed size numpy array."""
+
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.data = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        # number of values appended in total
+        self.n = 0
+
+    def append(self, value):
+        self.data[self.n % len(self.data)] = value
+        self.n += 1
+
+    def __len__(self):
+        return min(self.n, len(self.data))
+
+    def values(self):
+        """the stored values, oldest first"""
+        capacity = len(self.data)
+        if self.n <= capacity:
+            return self.data[:self.n].copy()
+        i = self.n % capacity
+        return np.concatenate((self.data[i:], self.data[:i]))
+
+    def last(self):
+        return self.data[(self.n - 1) % len(self.data)]
+
+
+class Reducer(WorldObserver):
+    """
+    A statistic kept up to date by the observer calls, see 'Statistics.add_reducer'.
+    'reset' is called on registration, with the world's current agents.
+    """
+
+    def reset(self, world):
+        pass
+
+    def value(self):
+        raise NotImplementedError
+
+
+class Sum(Reducer):
+    """
+    Sum of 'fn(agent)' over the agents in the world. 'fn' is evaluated when
+    an agent is added and removed, so it should not change in between.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.total = 0
+
+    def reset(self, world):
+        self.total = sum(self.fn(agent) for agent in world.agents.values())
+
+    def on_add(self, agent, pos):
+        self.total += self.fn(agent)
+
+    def on_remove(self, agent, pos):
+        self.total -= self.fn(agent)
+
+    def value(self):
+        return self.total
+
+
+class OccupancyHistogram(Reducer):
+    """
+    Number of cells holding k = 0, 1, ..., max_k or more agents.
+    The mean density of the occupied cells is placed agents / cells with k > 0.
+    """
+
+    def __init__(self, max_k=8):
+        self.max_k = max_k
+        self.world = None
+        self.hist = np.zeros(max_k + 1, dtype=np.int64)
+
+    def reset(self, world):
+        self.world = world
+        self.hist[:] = 0
+        self.hist[0] = world.w * world.h
+        for _, _, agents in world.storage.occupied():
+            self.hist[0] -= 1
+            self.hist[min(len(agents), self.max_k)] += 1
+
+    def cell_changed(self, pos, d):
+        # the cell already holds k agents, it held k - d before
+        k = len(self.world.storage.get(pos.x, pos.y))
+        self.hist[min(k - d, self.max_k)] -= 1
+        self.hist[min(k, self.max_k)] += 1
+
+    def on_add(self, agent, pos):
+        if pos is not None:
+            self.cell_changed(pos, 1)
+
+    def on_remove(self, agent, pos):
+        if pos is not None:
+            self.cell_changed(pos, -1)
+
+    def on_move(self, agent, old_pos, new_pos):
+        if old_pos == new_pos:
+            return
+        self.cell_changed(old_pos, -1)
+        self.cell_changed(new_pos, 1)
+
+    def value(self):
+        return self.hist
+
+
+class Statistics(WorldObserver):
+    """
+    Counts of the agents in a world, in total ('n'), per class and per group,
+    kept up to date as agents are added, removed and change groups,
+    plus the values of registered reducers.
+    After each step all statistics are appended to ring buffers of the last
+    'capacity' steps: 'series' maps 'agents', 'class:<name>', 'group:<id>'
+    and the reducer names to RingBuffers, aligned with the 'times' buffer.
+    Population members are not counted.
+    """
+
+    def __init__(self, world, capacity=1024):
+        self.world = world
+        self.capacity = capacity
+        self.n = 0
+        self.by_class = {}
+        self.by_group = {}
+        self.reducers = {}
+        self.times = RingBuffer(capacity, dtype=np.int64)
+        self.series = {}
+        for agent in world.agents.values():
+            self.count(agent, 1)
+
+    def count(self, agent, d):
+        self.n += d
+        cls = type(agent)
+        self.by_class[cls] = self.by_class.get(cls, 0) + d
+        by_group = self.by_group
+        for group_id in agent.group_ids:
+            by_group[group_id] = by_group.get(group_id, 0) + d
+
+    def count_class(self, cls):
+        return self.by_class.get(cls, 0)
+
+    def count_group(self, group_id):
+        return self.by_group.get(group_id, 0)
+
+    def add_reducer(self, name, reducer: Reducer):
+        reducer.reset(self.world)
+        self.reducers[name] = reducer
+        return reducer
+
+    def remove_reducer(self, name):
+        self.reducers.pop(name)
+        self.series.pop(name, None)
+
+    def on_add(self, agent, pos):
+        self.count(agent, 1)
+        for reducer in self.reducers.values():
+            reducer.on_add(agent, pos)
+
+    def on_remove(self, agent, pos):
+        self.count(agent, -1)
+        for reducer in self.reducers.values():
+            reducer.on_remove(agent, pos)
+
+    def on_move(self, agent, old_pos, new_pos):
+        for reducer in self.reducers.values():
+            reducer.on_move(agent, old_pos, new_pos)
+
+    def on_group_change(self, agent, pos, added, removed):
+        by_group = self.by_group
+        for group_id in added:
+            by_group[group_id] = by_group.get(group_id, 0) + 1
+        for group_id in removed:
+            by_group[group_id] -= 1
+        for reducer in self.reducers.values():
+            reducer.on_group_change(agent, pos, added, removed)
+
+    def on_color(self, agent, pos):
+        for reducer in self.reducers.values():
+            reducer.on_color(agent, pos)
+
+    def on_step(self):
+        self.times.append(self.world.time)
+        self.record('agents', self.n)
+        for cls, n in self.by_class.items():
+            self.record('class:' + cls.__name__, n)
+        for group_id, n in self.by_group.items():
+            self.record('group:{}'.format(group_id), n)
+        for name, reducer in self.reducers.items():
+            self.record(name, reducer.value())
+
+    def record(self, name, value):
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = RingBuffer(self.capacity, np.shape(value))
+            # a new statistic was 0 so far
+            series.n = self.times.n - 1
+        series.append(value)
+
+    def history(self, name):
+        """(times, values) of a statistic over the last 'capacity' steps"""
+        return self.times.values(), self.series[name].values()
@@ -0,0 +1,442 @@
+import itertools
+
+
+def ring_key(dx, dy):
+    # Ordering of the cell at offset (dx, dy) in the sorted box scan:
+    # ring by ring, and within a ring: right column (top down), bottom row
+    # (right to left), left column (bottom up) and top row (left to right).
+    d = max(abs(dx), abs(dy))
+    if dx == d and abs(dy) < d:
+        return d, 0, d - 1 - dy
+    if dy == -d:
+        return d, 1, d - dx
+    if dx == -d and abs(dy) < d:
+        return d, 2, dy + d
+    return d, 3, dx + d
+
+
+def wrapped_ranges(lo, hi, n):
+    """inclusive ranges covering [lo, hi] on a wrapped axis of length n, each index once"""
+    if hi - lo + 1 >= n:
+        return [(0, n - 1)]
+    lo, hi = lo % n, hi % n
+    if lo <= hi:
+        return [(lo, hi)]
+    return [(lo, n - 1), (0, hi)]
+
+
+def offset_bounds(cx, cy, w, h, torus):
+    """
+    (xlo, xhi, ylo, yhi), the inclusive range of offsets from (cx, cy) to the cells of the world.
+    On a torus, every cell has a single offset, the shortest way to it.
+    """
+    if torus:
+        return -((w - 1) // 2), w // 2, -((h - 1) // 2), h // 2
+    return -cx, w - 1 - cx, -cy, h - 1 - cy
+
+
+def ring_offsets(d, bounds):
+    """yields the offsets (dx, dy) of ring 'd' within 'bounds', in the order of 'ring_key'"""
+    if d == 0:
+        yield 0, 0
+        return
+    xlo, xhi, ylo, yhi = bounds
+    _xlo, _xhi = max(-d, xlo), min(d, xhi)
+    _ylo, _yhi = max(-d + 1, ylo), min(d - 1, yhi)
+    if d <= xhi:
+        for dy in range(_yhi, _ylo - 1, -1):
+            yield d, dy
+    if -d >= ylo:
+        for dx in range(_xhi, _xlo - 1, -1):
+            yield dx, -d
+    if -d >= xlo:
+        for dy in range(_ylo, _yhi + 1):
+            yield -d, dy
+    if d <= yhi:
+        for dx in range(_xlo, _xhi + 1):
+            yield dx, d
+
+
+class Storage:
+    """
+    Cell storage of a world.
+    Cells are addressed by integer coordinates and hold lists of agents.
+    The lists returned by 'get' must not be modified by the caller.
+    """
+    name = None
+
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+
+    def get(self, x, y):
+        raise NotImplementedError
+
+    def add(self, x, y, agent):
+        raise NotImplementedError
+
+    def remove(self, x, y, agent):
+        raise NotImplementedError
+
+    def add_many(self, xs, ys, agents):
+        for x, y, agent in zip(xs, ys, agents):
+            self.add(x, y, agent)
+
+    def remove_many(self, cells):
+        """removes the agents of cells, a dict of (x, y) -> ids of the agents"""
+        for (x, y), ids in cells.items():
+            for agent in [agent for agent in self.get(x, y) if id(agent) in ids]:
+                self.remove(x, y, agent)
+
+    def clear(self):
+        raise NotImplementedError
+
+    def occupied(self):
+        """yields (x, y, agents) for all non-empty cells"""
+        raise NotImplementedError
+
+    def box_scan_no_torus(self, cx, cy, rng):
+        agents, get = [], self.get
+        xlo, xhi = max(cx - rng, 0), min(cx + rng, self.w - 1)
+        ylo, yhi = max(cy - rng, 0), min(cy + rng, self.h - 1)
+        for y in range(ylo, yhi + 1):
+            for x in range(xlo, xhi + 1):
+                agents += get(x, y)
+        return agents
+
+    def box_scan_torus(self, cx, cy, rng):
+        agents, get = [], self.get
+        for y_range, x_range in self.torus_ranges(cx, cy, rng):
+            for y in range(y_range[0], y_range[1] + 1):
+                for x in range(x_range[0], x_range[1] + 1):
+                    agents += get(x, y)
+        return agents
+
+    def box_scan_sorted_no_torus(self, cx, cy, rng):
+        agents, get = [], self.get
+        agents += get(cx, cy)
+        for d in range(1, rng + 1):
+            xlo, xhi = cx - d, cx + d
+            ylo, yhi = cy - d, cy + d
+            _xlo, _xhi = max(0, xlo), min(self.w - 1, xhi)
+            _yrange = range(max(0, ylo + 1), min(self.h, yhi))
+            if xhi < self.w:
+                for y in reversed(_yrange):
+                    agents += get(xhi, y)
+            if ylo >= 0:
+                for x in reversed(range(_xlo, _xhi + 1)):
+                    agents += get(x, ylo)
+            if xlo >= 0:
+                for y in _yrange:
+                    agents += get(xlo, y)
+            if yhi < self.h:
+                for x in range(_xlo, _xhi + 1):
+                    agents += get(x, yhi)
+        return agents
+
+    def box_scan_sorted_torus(self, cx, cy, rng):
+        size = rng * 2 + 1
+        assert (size <= self.w and size <= self.h)
+        agents, get = [], self.get
+        agents += get(cx, cy)
+        for d in range(1, rng + 1):
+            _xlo, _xhi, xrange, yrange = self.torus_ring(cx, cy, d)
+            _ylo, _yhi = (cy - d) % self.h, (cy + d) % self.h
+            for y in reversed(yrange):
+                agents += get(_xhi, y)
+            for x in reversed(xrange):
+                agents += get(x, _ylo)
+            for y in yrange:
+                agents += get(_xlo, y)
+            for x in xrange:
+                agents += get(x, _yhi)
+        return agents
+
+    def iter_rings(self, cx, cy, rng, torus):
+        """
+        Lazy sorted box scan: yields (d, cells) for the rings d = 0..rng,
+        with cells the list of non-empty (dx, dy, agents) of the ring,
+        in the order of the sorted box scan. On a torus, the rings stop
+        before wrapping around, so every cell is visited once.
+        """
+        w, h, get = self.w, self.h, self.get
+        bounds = offset_bounds(cx, cy, w, h, torus)
+        for d in range(min(rng, max(-bounds[0], bounds[1], -bounds[2], bounds[3])) + 1):
+            cells = []
+            for dx, dy in ring_offsets(d, bounds):
+                agents = get((cx + dx) % w, (cy + dy) % h)
+                if agents:
+                    cells.append((dx, dy, agents))
+            yield d, cells
+
+    def torus_ranges(self, cx, cy, rng):
+        """
+        inclusive (y_range, x_range) rectangles covering the box on the torus,
+        each cell once, also if the box is larger than the world
+        """
+        x_ranges = wrapped_ranges(cx - rng, cx + rng, self.w)
+        y_ranges = wrapped_ranges(cy - rng, cy + rng, self.h)
+        return [(y_range, x_range) for y_range in y_ranges for x_range in x_ranges]
+
+    def torus_ring(self, cx, cy, d):
+        w, h = self.w, self.h
+        xlo, xhi = cx - d, cx + d
+        ylo, yhi = cy - d, cy + d
+        _xlo, _xhi = xlo % w, xhi % w
+        _ylo, _yhi = ylo % h, yhi % h
+        xrange = range(xlo, xhi + 1)
+        if xlo != _xlo:
+            xrange = itertools.chain(range(_xlo, w), range(xhi + 1))
+        elif xhi != _xhi:
+            xrange = itertools.chain(range(xlo, w), range(_xhi + 1))
+        yrange = range(ylo + 1, yhi)
+        if ylo != _ylo:
+            yrange = itertools.chain(range(_ylo + 1, h), range(yhi))
+        elif yhi != _yhi:
+            yrange = itertools.chain(range(ylo + 1, h), range(_yhi))
+        return _xlo, _xhi, list(xrange), list(yrange)
+
+
+class DenseStorage(Storage):
+    """A h x w list of lists. Fast lookups, memory scales with the grid area."""
+    name = 'dense'
+
+    def __init__(self, w, h):
+        super().__init__(w, h)
+        self.m = [[[] for _ in range(w)] for _ in range(h)]
+
+    def get(self, x, y):
+        return self.m[y][x]
+
+    def add(self, x, y, agent):
+        self.m[y][x].append(agent)
+
+    def remove(self, x, y, agent):
+        self.m[y][x].remove(agent)
+
+    def add_many(self, xs, ys, agents):
+        m = self.m
+        for x, y, agent in zip(xs, ys, agents):
+            m[y][x].append(agent)
+
+    def remove_many(self, cells):
+        # a pass over each cell instead of a list.remove per agent
+        m = self.m
+        for (x, y), ids in cells.items():
+            cell = m[y][x]
+            cell[:] = [agent for agent in cell if id(agent) not in ids]
+
+    def clear(self):
+        for row in self.m:
+            for cell in row:
+                if cell:
+                    cell.clear()
+
+    def occupied(self):
+        for y, row in enumerate(self.m):
+            for x, agents in enumerate(row):
+                if agents:
+                    yield x, y, agents
+
+    # The scans below are the generic ones with direct indexing,
+    # avoiding a method call per cell.
+
+    def box_scan_no_torus(self, cx, cy, rng):
+        agents, m = [], self.m
+        xlo, xhi = max(cx - rng, 0), min(cx + rng, self.w - 1)
+        ylo, yhi = max(cy - rng, 0), min(cy + rng, self.h - 1)
+        for y in range(ylo, yhi + 1):
+            for cell in m[y][xlo:xhi + 1]:
+                agents += cell
+        return agents
+
+    def box_scan_torus(self, cx, cy, rng):
+        agents, m = [], self.m
+        for y_range, x_range in self.torus_ranges(cx, cy, rng):
+            for y in range(y_range[0], y_range[1] + 1):
+                for cell in m[y][x_range[0]:x_range[1] + 1]:
+                    agents += cell
+        return agents
+
+    def box_scan_sorted_no_torus(self, cx, cy, rng):
+        agents, m = [], self.m
+        agents += m[cy][cx]
+        for d in range(1, rng + 1):
+            xlo, xhi = cx - d, cx + d
+            ylo, yhi = cy - d, cy + d
+            _xlo, _xhi = max(0, xlo), min(self.w - 1, xhi)
+            _yrange = range(max(0, ylo + 1), min(self.h, yhi))
+            if xhi < self.w:
+                for y in reversed(_yrange):
+                    agents += m[y][xhi]
+            if ylo >= 0:
+                for x in reversed(range(_xlo, _xhi + 1)):
+                    agents += m[ylo][x]
+            if xlo >= 0:
+                for y in _yrange:
+                    agents += m[y][xlo]
+            if yhi < self.h:
+                for x in range(_xlo, _xhi + 1):
+                    agents += m[yhi][x]
+        return agents
+
+    def box_scan_sorted_torus(self, cx, cy, rng):
+        size = rng * 2 + 1
+        assert (size <= self.w and size <= self.h)
+        agents, m = [], self.m
+        agents += m[cy][cx]
+        for d in range(1, rng + 1):
+            _xlo, _xhi, xrange, yrange = self.torus_ring(cx, cy, d)
+            _ylo, _yhi = (cy - d) % self.h, (cy + d) % self.h
+            for y in reversed(yrange):
+                agents += m[y][_xhi]
+            for x in reversed(xrange):
+                agents += m[_ylo][x]
+            for y in yrange:
+                agents += m[y][_xlo]
+            for x in xrange:
+                agents += m[_yhi][x]
+        return agents
+
+
+class SparseStorage(Storage):
+    """
+    A dict of the occupied cells only.
+    Memory and startup scale with the number of agents, not the grid area.
+    Scans visit the occupied cells instead of the box when that is cheaper.
+    """
+    name = 'sparse'
+    empty = ()
+
+    def __init__(self, w, h):
+        super().__init__(w, h)
+        self.cells = {}
+
+    def get(self, x, y):
+        return self.cells.get((x, y), self.empty)
+
+    def add(self, x, y, agent):
+        cell = self.cells.get((x, y))
+        if cell is None:
+            self.cells[(x, y)] = [agent]
+        else:
+            cell.append(agent)
+
+    def remove(self, x, y, agent):
+        cell = self.cells[(x, y)]
+        cell.remove(agent)
+        if not cell:
+            del self.cells[(x, y)]
+
+    def add_many(self, xs, ys, agents):
+        cells = self.cells
+        for xy, agent in zip(zip(xs, ys), agents):
+            cell = cells.get(xy)
+            if cell is None:
+                cells[xy] = [agent]
+            else:
+                cell.append(agent)
+
+    def remove_many(self, cells):
+        for xy, ids in cells.items():
+            cell = [agent for agent in self.cells[xy] if id(agent) not in ids]
+            if cell:
+                self.cells[xy] = cell
+            else:
+                del self.cells[xy]
+
+    def clear(self):
+        self.cells.clear()
+
+    def occupied(self):
+        for (x, y), agents in self.cells.items():
+            yield x, y, agents
+
+    def scan_occupied(self, rng):
+        # cheaper to look at every occupied cell than at every cell in the box
+        return len(self.cells) < (rng * 2 + 1) ** 2
+
+    def offsets_in_box(self, cx, cy, rng, torus):
+        """yields (dx, dy, agents) for occupied cells within the box"""
+        w, h = self.w, self.h
+        for (x, y), agents in self.cells.items():
+            dx, dy = x - cx, y - cy
+            if torus:
+                dx, dy = dx % w, dy % h
+                if dx > rng:
+                    dx -= w
+                if dy > rng:
+                    dy -= h
+            if -rng <= dx <= rng and -rng <= dy <= rng:
+                yield dx, dy, agents
+
+    def box_scan_no_torus(self, cx, cy, rng):
+        if not self.scan_occupied(rng):
+            return super().box_scan_no_torus(cx, cy, rng)
+        agents = []
+        for _, _, cell in self.offsets_in_box(cx, cy, rng, False):
+            agents += cell
+        return agents
+
+    def box_scan_torus(self, cx, cy, rng):
+        if not self.scan_occupied(rng):
+            return super().box_scan_torus(cx, cy, rng)
+        agents = []
+        for _, _, cell in self.offsets_in_box(cx, cy, rng, True):
+            agents += cell
+        return agents
+
+    def box_scan_sorted_no_torus(self, cx, cy, rng):
+        if not self.scan_occupied(rng):
+            return super().box_scan_sorted_no_torus(cx, cy, rng)
+        return self.sorted_occupied(cx, cy, rng, False)
+
+    def box_scan_sorted_torus(self, cx, cy, rng):
+        size = rng * 2 + 1
+        assert (size <= self.w and size <= self.h)
+        if not self.scan_occupied(rng):
+            return super().box_scan_sorted_torus(cx, cy, rng)
+        return self.sorted_occupied(cx, cy, rng, True)
+
+    def iter_rings(self, cx, cy, rng, torus):
+        # walk the rings while they are small, and switch to sorting the
+        # occupied cells once the rings walked add up to more cells than that
+        rings = super().iter_rings(cx, cy, rng, torus)
+        visited = 0
+        for d, cells in rings:
+            yield d, cells
+            visited += 8 * d or 1
+            if visited > len(self.cells):
+                break
+        else:
+            return
+        w, h = self.w, self.h
+        xlo, xhi, ylo, yhi = offset_bounds(cx, cy, w, h, torus)
+        rest = []
+        for (x, y), agents in self.cells.items():
+            dx, dy = x - cx, y - cy
+            if torus:
+                dx, dy = (dx - xlo) % w + xlo, (dy - ylo) % h + ylo
+            key = ring_key(dx, dy)
+            if d < key[0] <= rng:
+                rest.append((key, dx, dy, agents))
+        rest.sort(key=lambda c: c[0])
+        i = 0
+        for d in range(d + 1, min(rng, max(-xlo, xhi, -ylo, yhi)) + 1):
+            cells = []
+            while i < len(rest) and rest[i][0][0] == d:
+                _, dx, dy, agents = rest[i]
+                cells.append((dx, dy, agents))
+                i += 1
+            yield d, cells
+
+    def sorted_occupied(self, cx, cy, rng, torus):
+        cells = [(ring_key(dx, dy), cell) for dx, dy, cell in self.offsets_in_box(cx, cy, rng, torus)]
+        cells.sort(key=lambda c: c[0])
+        agents = []
+        for _, cell in cells:
+            agents += cell
+        return agents
+
+
+STORAGES = {storage.name: storage for storage in (DenseStorage, SparseStorage)}
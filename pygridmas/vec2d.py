@@ -1,5 +1,7 @@
 import math
 import random
+from itertools import repeat
+from operator import itemgetter
 
 
 def clamp(val, mi, ma):
@@ -10,10 +12,19 @@ def clamp(val, mi, ma):
     return val
 
 
-class Vec2D:
-    def __init__(self, x: float = 0, y: float = 0):
-        self.x = x
-        self.y = y
+class Vec2D(tuple):
+    # An immutable (x, y) tuple. No per-instance __dict__,
+    # and it unpacks like a tuple: x, y = vec
+    __slots__ = ()
+
+    def __new__(cls, x: float = 0, y: float = 0):
+        return tuple.__new__(cls, (x, y))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    x = property(itemgetter(0))
+    y = property(itemgetter(1))
 
     def __neg__(self):
         return Vec2D(-self.x, -self.y)
@@ -27,6 +38,8 @@ class Vec2D:
     def __mul__(self, scalar):
         return Vec2D(self.x * scalar, self.y * scalar)
 
+    __rmul__ = __mul__
+
     def __truediv__(self, scalar):
         return Vec2D(self.x / scalar, self.y / scalar)
 
@@ -34,10 +47,12 @@ class Vec2D:
         return Vec2D(self.x // i, self.y // i)
 
     def __eq__(self, other):
-        return type(other) == Vec2D and self.x == other.x and self.y == other.y
+        return type(other) == Vec2D and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
 
-    def __hash__(self):
-        return hash((self.x, self.y))
+    __hash__ = tuple.__hash__
 
     def __str__(self):
         return "Vec2D({}, {})".format(self.x, self.y)
@@ -73,10 +88,30 @@ class Vec2D:
         return self / self.inf_magnitude()
 
     @staticmethod
-    def random_grid_dir():
-        return Vec2D(random.randint(-1, 1), random.randint(-1, 1))
+    def many(xs, ys):
+        """a list of vectors from lists of coordinates, without a python call per vector"""
+        return list(map(tuple.__new__, repeat(Vec2D), zip(xs, ys)))
 
     @staticmethod
-    def random_dir():
-        angle = random.random() * math.pi * 2
+    def grid_dir(dx, dy):
+        """the shared instance of the unit grid direction (dx, dy)"""
+        return GRID_DIRS[dy * 3 + dx + 4]
+
+    @staticmethod
+    def random_grid_dir(rng=None):
+        # rng: a world's RandomStream (world.rng), else the global random module is used
+        if rng is None:
+            return GRID_DIRS[random.randint(0, 8)]
+        return GRID_DIRS[int(rng.random() * 9)]
+
+    @staticmethod
+    def random_dir(rng=None):
+        if rng is None:
+            angle = random.random() * math.pi * 2
+        else:
+            angle = rng.angle()
         return Vec2D(math.cos(angle), math.sin(angle))
+
+
+# the nine unit grid directions (including zero), indexed by dy * 3 + dx + 4
+GRID_DIRS = tuple(Vec2D(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1))
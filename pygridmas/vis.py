@@ -1,13 +1,16 @@
 import pyglet
+from pyglet import gl
 from pyglet.window import key
 import time
 import itertools
-import math
+import multiprocessing
 from pygridmas import World
+from pygridmas.raster import Raster
+from pygridmas.remote import SharedFrame, run_simulation, TIME, ENDED, SPEED, PAUSED
 
 
 class VisualizerBase(pyglet.window.Window):
-    def __init__(self, world, scale=3, performance=True, render_labels=True):
+    def __init__(self, world, scale=3, performance=True, render_labels=True, layer=None):
         super(VisualizerBase, self).__init__()
         self.scale = scale
         self.width, self.height = world.w * scale, world.h * scale
@@ -16,6 +19,10 @@ class VisualizerBase(pyglet.window.Window):
         self.render_labels = render_labels
         self.do_render = True
         self.performance = performance
+        self.raster = None
+        self.texture = None
+        # the name of a world layer drawn behind the agents
+        self.layer = layer
         self.no_render_label = pyglet.text.Label(
             'no render',
             font_size=10,
@@ -30,6 +37,15 @@ class VisualizerBase(pyglet.window.Window):
         # force draw first draw
         self.force_draw()
 
+    def get_image(self):
+        # performance mode: a pixel per cell, otherwise the agents of a cell are laid out within it
+        sub = 1 if self.performance else self.scale
+        if self.raster is None or self.raster.sub != sub:
+            if self.raster is not None:
+                self.raster.close()
+            self.raster = Raster(self.world, sub, layer=self.layer)
+        return self.raster.update()
+
     def start(self):
         pyglet.app.run()
 
@@ -41,39 +57,16 @@ class VisualizerBase(pyglet.window.Window):
 
     def on_draw(self):
         self.clear()
-        positions = []
-        colors = []
         if self.do_render:
-            s = self.scale
-            if self.performance:
-                for yy, row in enumerate(self.world.m):
-                    yy *= s
-                    for xx, agents in enumerate(row):
-                        xx *= s
-                        if agents:
-                            positions += [xx, yy, xx + s, yy, xx + s, yy + s, xx, yy + s]
-                            colors += list(agents[-1].color) * 4
-            else:
-                for y, row in enumerate(self.world.m):
-                    yy = y * self.scale
-                    for x, agents in enumerate(row):
-                        xx = x * self.scale
-                        n = math.ceil(math.sqrt(len(agents)))
-                        if n == 0: continue
-                        d = self.scale / n
-                        for i, agent in enumerate(agents):
-                            row = i // n
-                            col = i - row * n
-                            xlo, ylo = xx + d * col, yy + d * row
-                            xhi, yhi = xlo + d, ylo + d
-                            positions += [xlo, ylo, xhi, ylo, xhi, yhi, xlo, yhi]
-                            colors += list(agent.color) * 4
-            pyglet.graphics.draw(
-                len(positions) // 2,
-                pyglet.gl.GL_QUADS,
-                ('v2f', positions),
-                ('c3f', colors)
-            )
+            # the world is drawn as a single texture, only the changed cells are repainted
+            image = self.get_image()
+            h, w, _ = image.shape
+            if self.texture is None or (self.texture.width, self.texture.height) != (w, h):
+                self.texture = pyglet.image.Texture.create(
+                    w, h, gl.GL_RGB, min_filter=gl.GL_NEAREST, mag_filter=gl.GL_NEAREST,
+                )
+            self.texture.blit_into(pyglet.image.ImageData(w, h, 'RGB', image.tobytes()), 0, 0, 0)
+            self.texture.blit(0, 0, width=self.world.w * self.scale, height=self.world.h * self.scale)
         self.time_label.text = 'time: {}'.format(self.world.time)
         if self.render_labels:
             for label in self.labels:
@@ -86,8 +79,8 @@ class VisualizerBase(pyglet.window.Window):
 
 class Visualizer(VisualizerBase):
     def __init__(self, world, scale=3, start_paused=False, target_speed=40, target_fps=30, render_labels=True,
-                 performance=True):
-        super(Visualizer, self).__init__(world, scale, performance, render_labels)
+                 performance=True, layer=None):
+        super(Visualizer, self).__init__(world, scale, performance, render_labels, layer)
         self.pause = start_paused
         self.target_speed = target_speed
         self.target_fps = target_fps
@@ -108,7 +101,12 @@ class Visualizer(VisualizerBase):
             '', font_size=10, x=2, y=28,
             anchor_x='left', anchor_y='bottom'
         )
-        self.labels += [self.speed_label, self.performance_label]
+        # the most expensive agent classes, if the world is profiled
+        self.profile_label = pyglet.text.Label(
+            '', font_size=10, x=2, y=42,
+            anchor_x='left', anchor_y='bottom'
+        )
+        self.labels += [self.speed_label, self.performance_label, self.profile_label]
 
     def get_target_dt_step(self):
         return 1 / self.target_speed
@@ -130,6 +128,8 @@ class Visualizer(VisualizerBase):
 
         if t - self.last_label_update > 0.5:
             self.speed_label.text = 'speed: {:5.2f}, target: {:.2f}'.format(self.speed, self.target_speed)
+            profiler = getattr(self.world, 'profiler', None)
+            self.profile_label.text = '' if profiler is None else profiler.summary()
             self.last_label_update = t
 
         if self.pause:
@@ -145,6 +145,13 @@ class Visualizer(VisualizerBase):
         if symbol == key.RIGHT:
             self.pause = True
             self.world.step()
+        # seeking in replays
+        seek = getattr(self.world, 'seek', None)
+        if seek is not None and symbol == key.LEFT:
+            self.pause = True
+            seek(self.world.i - 1)
+        if seek is not None and symbol == key.HOME:
+            seek(0)
         if symbol == key.UP:
             self.pause = False
             self.target_speed *= 2.0
@@ -159,3 +166,119 @@ class Visualizer(VisualizerBase):
             self.render_labels = not self.render_labels
         if symbol == key.ESCAPE:
             self.world.end()
+
+
+class RemoteWorld:
+    """what the window knows about a world running in another process"""
+
+    def __init__(self, w, h):
+        self.w, self.h = w, h
+        self.time = 0
+        self.ended = False
+
+
+class RemoteVisualizer(VisualizerBase):
+    """
+    Runs the world in a worker process, as fast as possible unless a
+    'target_speed' is given, independent of the window's frame rate.
+    The worker publishes frames to shared memory about 'target_fps' times per
+    second, and the window shows the latest one. The hot keys are sent to the worker.
+    The world is passed to the worker process, so with the 'spawn'
+    start method it must be picklable.
+    """
+
+    def __init__(self, world, scale=3, start_paused=False, target_speed=None, target_fps=30, render_labels=True,
+                 performance=True, layer=None):
+        self.frame = SharedFrame(world.w, world.h, scale)
+        self.conn, conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_simulation, daemon=True,
+            args=(world, self.frame.name, conn, scale, target_speed, start_paused, performance, True, target_fps, layer),
+        )
+        self.process.start()
+        conn.close()
+        self.pause = start_paused
+        self.target_speed = target_speed
+        self.speed = 0
+        super(RemoteVisualizer, self).__init__(RemoteWorld(world.w, world.h), scale, performance, render_labels)
+        pyglet.clock.schedule_interval(self.update, 1 / target_fps)
+        self.speed_label = pyglet.text.Label(
+            '', font_size=10, x=2, y=1,
+            anchor_x='left', anchor_y='bottom'
+        )
+        self.performance_label = pyglet.text.Label(
+            '', font_size=10, x=2, y=28,
+            anchor_x='left', anchor_y='bottom'
+        )
+        self.labels += [self.speed_label, self.performance_label]
+
+    def start(self):
+        try:
+            super(RemoteVisualizer, self).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.process.is_alive():
+            self.send('end')
+            self.process.join(5)
+        self.conn.close()
+        self.frame.close()
+        self.frame.unlink()
+
+    def send(self, *command):
+        try:
+            self.conn.send(command)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def read_header(self, header):
+        self.world.time = int(header[TIME])
+        self.world.ended = bool(header[ENDED]) or not self.process.is_alive()
+        self.speed = header[SPEED]
+        self.pause = bool(header[PAUSED])
+
+    def get_image(self):
+        image, header = self.frame.read()
+        self.read_header(header)
+        return image
+
+    def update(self, dt):
+        self.read_header(self.frame.read_header())
+        if self.pause:
+            self.speed_label.text = 'paused'
+        else:
+            target = 'max' if self.target_speed is None else '{:.2f}'.format(self.target_speed)
+            self.speed_label.text = 'speed: {:5.2f}, target: {}'.format(self.speed, target)
+        self.no_render_label.text = '' if self.do_render else 'no render'
+        self.performance_label.text = 'P' if self.performance else ''
+
+    def on_key_press(self, symbol, _):
+        if symbol == key.SPACE:
+            self.pause = not self.pause
+            self.send('pause', self.pause)
+        if symbol == key.RIGHT:
+            self.pause = True
+            self.send('pause', True)
+            self.send('step')
+        if symbol in (key.UP, key.DOWN):
+            self.pause = False
+            self.send('pause', False)
+            if symbol == key.DOWN:
+                self.target_speed = (self.target_speed or max(self.speed, 1)) * 0.5
+            elif self.target_speed is not None:
+                self.target_speed *= 2.0
+            self.send('speed', self.target_speed)
+        if symbol == key.M:
+            self.target_speed = None
+            self.send('speed', None)
+        if symbol == key.R:
+            self.do_render = not self.do_render
+            self.send('render', self.do_render)
+        if symbol == key.P:
+            self.performance = not self.performance
+            self.send('performance', self.performance)
+        if symbol == key.L:
+            self.render_labels = not self.render_labels
+        if symbol == key.ESCAPE:
+            self.send('end')
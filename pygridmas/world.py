@@ -1,230 +1,800 @@
 import itertools
-import random
+import time
 from typing import Union
 
+import numpy as np
+
 from pygridmas.vec2d import Vec2D
+from pygridmas.storage import Storage, STORAGES, ring_key, offset_bounds
+from pygridmas.counts import GroupCounts
+from pygridmas.stats import Statistics
+from pygridmas.events import EventBus
+from pygridmas.rng import RandomStream
+from pygridmas.registry import AgentRegistry, PositionView
+from pygridmas.scheduler import Scheduler, ActiveView
+from pygridmas.snapshot import save_world, load_world, fork_world, no_gc
+from pygridmas.profiler import Profiler
+from pygridmas.navigation import Navigation
+from pygridmas.layers import Layer
+from pygridmas.groups import CellMasks, GroupIndex, group_mask, group_bit
+
+
+class Pending:
+    """
+    The result of a move recorded in a synchronous step. It is true, as the
+    move is inside the world, but may still fail when the moves are applied.
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return 'PENDING'
+
+
+PENDING = Pending()
 
 
 class World:
-    def __init__(self, w, h, torus_enabled=False, max_steps=None):
+    def __init__(self, w, h, torus_enabled=False, max_steps=None, storage='dense', seed=None, synchronous=False):
         self.w = w
         self.h = h
-        self.m = [[[] for _ in range(w)] for _ in range(h)]
+        # the world's own random numbers, seeded from the global rng if no seed is given
+        self.rng = RandomStream(seed)
+        # 'dense' (list of lists) or 'sparse' (dict of occupied cells),
+        # or a Storage subclass
+        if isinstance(storage, str):
+            storage = STORAGES[storage]
+        self.storage: Storage = storage(w, h)
         self.torus_enabled = torus_enabled
         self.time = 0
-        self.agents = {}
-        self.active_agents = {}
-        self.agent_pos = {}
-        self.agent_idx_cnt = itertools.count()
-        self.event_emit_queue = []
+        # agents by idx, and dict like views of their positions and awake agents
+        self.agents = AgentRegistry()
+        self.scheduler = Scheduler()
+        self.agent_pos = PositionView(self.agents)
+        self.active_agents = ActiveView(self.agents, self.scheduler)
+        # the registry's position list, indexed by agent idx
+        self.positions = self.agents.positions
+        # the OR of the group masks of the agents per cell, for collision checks
+        self.group_masks = CellMasks()
+        self.events = EventBus(self)
         self.ended = False
+        self.stepping = False
+        # the agents awake at the start of the last step, those stepped unless
+        # put to sleep or removed during it
+        self.n_stepped = 0
+        # In synchronous mode the agents decide on their moves against the
+        # positions at the start of the step, and all moves are applied after
+        # the agent steps, see 'apply_intents'. 'intents' is idx -> (x, y).
+        self.synchronous = synchronous
+        self.intents = None
         self.max_steps = max_steps
+        self.observers = []
+        # told only about steps and the end of the world, see add_step_observer
+        self.step_observers = []
+        self.group_counts = None
+        self.statistics = None
+        self.navigation = None
+        # group id -> agents, see agents_in_group
+        self.group_index = None
+        # see enable_profiling
+        self.profiler = None
+        self.populations = []
+        # named per-cell numpy layers, see add_layer
+        self.layers = {}
+
+    @property
+    def m(self):
+        # the h x w list of lists of the dense storage
+        return self.storage.m
 
     def at(self, pos: Vec2D):
-        return self.m[pos.y][pos.x]
+        return self.storage.get(pos.x, pos.y)
+
+    def occupied(self):
+        """yields (x, y, agents) for all non-empty cells, including population members"""
+        if not self.populations:
+            yield from self.storage.occupied()
+            return
+        members = {}
+        for population in self.populations:
+            for i in population.alive_idx():
+                x, y = population.xy[i]
+                members.setdefault((int(x), int(y)), []).append(population.member(i))
+        for x, y, agents in self.storage.occupied():
+            extra = members.pop((x, y), None)
+            yield x, y, agents + extra if extra else agents
+        for (x, y), agents in members.items():
+            yield x, y, agents
 
     def random_pos(self):
-        return Vec2D(random.randint(0, self.w - 1), random.randint(0, self.h - 1))
+        rng = self.rng
+        return Vec2D(rng.randint(0, self.w - 1), rng.randint(0, self.h - 1))
 
     def step(self):
         if self.ended:
             return
-        # call step on all active agents
-        # the loop should allow the list to change hence the awkward loop
-        for agent_id in list(self.active_agents.keys()):
-            if agent_id in self.active_agents:
-                self.agents[agent_id].step()
-        # emit events after agent steps
-        events = self.event_emit_queue
-        self.event_emit_queue = []
-        for agents, event_type, data in events:
-            for agent in agents:
-                if agent.idx in self.agents:
-                    agent.receive_event(event_type, data)
+        profiler = self.profiler
+        if profiler is not None:
+            t = time.perf_counter()
+        self.stepping = True
+        # call step on the awake agents in idx order, skipping agents put to sleep or removed during the loop.
+        # agents added during the loop get new slots at the end and are not stepped
+        registry, scheduler = self.agents, self.scheduler
+        slots, awake = registry.slots, scheduler.awake
+        scheduler.wake_due(self.time)
+        self.n_stepped = scheduler.n_awake
+        due = scheduler.due(len(slots))
+        registry.iterating += 1
+        scheduler.stepping = True
+        if self.synchronous:
+            self.intents = {}
+        try:
+            periods = scheduler.periods
+            if profiler is None and not periods:
+                for idx in due:
+                    if awake[idx]:
+                        slots[idx].step()
+            else:
+                for idx in due:
+                    if awake[idx]:
+                        agent = slots[idx]
+                        if profiler is None:
+                            agent.step()
+                        else:
+                            profiler.step_agent(agent)
+                        period = periods.get(idx)
+                        if period is not None and awake[idx]:
+                            scheduler.sleep(idx, self.time + period, wake_on_event=False)
+        finally:
+            registry.iterating -= 1
+            scheduler.end_step()
+        if self.intents is not None:
+            self.apply_intents()
+        if profiler is None:
+            for population in self.populations:
+                population.step_all()
+            # emit events after agent steps
+            self.events.flush()
+            for layer in self.layers.values():
+                layer.step()
+        else:
+            for population in self.populations:
+                profiler.section('populations', population.step_all)
+            profiler.section('events', self.events.flush)
+            for layer in self.layers.values():
+                profiler.section('layers', layer.step)
+        self.stepping = False
         self.time += 1
+        for observer in self.observers:
+            observer.on_step()
+        for observer in self.step_observers:
+            observer.on_step()
+        if profiler is not None:
+            profiler.steps += 1
+            profiler.time += time.perf_counter() - t
         if self.max_steps is not None and self.time >= self.max_steps:
             self.end()
 
     def end(self):
         self.ended = True
-        for agent_id in list(self.agents.keys()):
-            self.remove_agent(agent_id)
+        for observer in list(self.observers) + list(self.step_observers):
+            observer.on_end()
+        self.remove_agents(self.agents.keys())
+        for population in list(self.populations):
+            self.remove_population(population)
+
+    def enable_profiling(self):
+        """starts collecting the costs per agent class, see pygridmas/profiler.py"""
+        if self.profiler is None:
+            self.profiler = Profiler(self)
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def profile_report(self):
+        if self.profiler is None:
+            return 'profiling is not enabled, see World.enable_profiling'
+        return self.profiler.report()
+
+    def snapshot(self, file):
+        """
+        Writes the state of the world to 'file' (a path or file object, npz format),
+        to be resumed with 'World.restore(file)'. See pygridmas/snapshot.py for what is stored.
+        """
+        save_world(self, file)
+
+    @staticmethod
+    def restore(file):
+        return load_world(file)
+
+    def fork(self, seed=None):
+        """an independent copy of the world for what-if runs"""
+        return fork_world(self, seed)
+
+    def add_layer(self, name, **kwargs):
+        """adds a named per-cell layer, see pygridmas/layers.py for the arguments"""
+        if name in self.layers:
+            raise ValueError("the world already has a layer '{}'".format(name))
+        layer = self.layers[name] = Layer(name, self.w, self.h, self.torus_enabled, **kwargs)
+        return layer
+
+    def remove_layer(self, name):
+        return self.layers.pop(name)
 
     def add_agent(self, agent, pos: Union[Vec2D, bool] = None):
-        idx = agent.idx = next(self.agent_idx_cnt)
         if pos is None:
             pos = self.random_pos()
-        if pos is not False:
-            self.agent_pos[idx] = pos
-            self.at(pos).append(agent)
-        self.agents[idx] = agent
-        self.active_agents[idx] = agent
-        agent.world = self
+        if pos is False:
+            pos = None
+        self.attach_agent(agent, pos)
         agent.initialize()
 
+    def attach_agent(self, agent, pos):
+        # add_agent without calling 'initialize', e.g. for agents moving between worlds
+        idx = agent.idx = self.agents.add(agent, pos)
+        self.scheduler.add(idx)
+        if agent.step_period > 1:
+            self.scheduler.set_period(idx, agent.step_period)
+        if pos is not None:
+            self.storage.add(pos.x, pos.y, agent)
+            self.group_masks.add(pos.x, pos.y, agent.group_ids.mask)
+        agent.world = self
+        self.events.add(agent, agent.subscriptions)
+        for observer in self.observers:
+            observer.on_add(agent, pos)
+
+    def add_agents(self, agents, positions=None):
+        """
+        Adds many agents at once and returns their idx.
+        'positions' is an (n, 2) array or list of positions, None for random
+        positions, 'fill' to fill the grid row by row, one agent per cell,
+        or False for agents without a position.
+        """
+        with no_gc():
+            agents = list(agents)
+            n = len(agents)
+            if positions is False:
+                pos = [None] * n
+            else:
+                if positions is None:
+                    xy = self.rng.generator.integers(0, (self.w, self.h), (n, 2))
+                elif isinstance(positions, str):
+                    if positions != 'fill':
+                        raise ValueError("unknown layout '{}'".format(positions))
+                    if n > self.w * self.h:
+                        raise ValueError('{} agents do not fit in {} cells'.format(n, self.w * self.h))
+                    i = np.arange(n)
+                    xy = np.stack((i % self.w, i // self.w), axis=1)
+                else:
+                    xy = np.asarray(positions, dtype=np.int64).reshape(n, 2)
+                    if ((xy < 0) | (xy >= (self.w, self.h))).any():
+                        raise ValueError('positions outside of the world')
+                xs, ys = xy[:, 0].tolist(), xy[:, 1].tolist()
+                pos = Vec2D.many(xs, ys)
+            ids = self.attach_agents(agents, pos)
+            from pygridmas.agent import Agent
+            # the base Agent.initialize does nothing
+            skip = {}
+            for agent in agents:
+                cls = type(agent)
+                if cls not in skip:
+                    skip[cls] = cls.initialize is Agent.initialize
+                if not skip[cls]:
+                    agent.initialize()
+            return ids
+
+    def attach_agents(self, agents, pos, ids=None):
+        """
+        add_agents without calling 'initialize', at the positions 'pos'
+        (None for agents without a position), into the free slots 'ids'
+        if given, e.g. to restore a snapshot. Returns the idx of the agents.
+        """
+        with no_gc():
+            if ids is None:
+                ids = self.agents.add_many(agents, pos)
+            else:
+                self.agents.put_many(ids, agents, pos)
+            self.scheduler.add_many(ids)
+            set_period = self.scheduler.set_period
+            for agent, idx in zip(agents, ids):
+                agent.idx = idx
+                agent.world = self
+                if agent.step_period > 1:
+                    set_period(idx, agent.step_period)
+            self.events.add_many(agents)
+            if self.observers:
+                # observers see the agents added one by one
+                for agent, p in zip(agents, pos):
+                    if p is not None:
+                        self.storage.add(p.x, p.y, agent)
+                    for observer in self.observers:
+                        observer.on_add(agent, p)
+            placed = [(agent, p) for agent, p in zip(agents, pos) if p is not None]
+            if placed:
+                placed_agents, pos = zip(*placed)
+                xs, ys = [p.x for p in pos], [p.y for p in pos]
+                if not self.observers:
+                    self.storage.add_many(xs, ys, placed_agents)
+                self.group_masks.add_many(xs, ys, [agent.group_ids.mask for agent in placed_agents])
+            return ids
+
     def remove_agent(self, idx):
+        self.agents[idx].cleanup()
+        self.detach_agent(idx)
+
+    def remove_agents(self, ids):
+        """
+        Removes many agents at once. The 'cleanup' of all of them is called
+        before any is removed. Removing all agents clears the world as a whole.
+        """
+        ids = list(ids)
+        with no_gc():
+            registry = self.agents
+            agents = [registry.slots[idx] for idx in ids]
+            if None in agents:
+                raise KeyError(ids[agents.index(None)])
+            for agent in agents:
+                if agent.world is self:
+                    agent.cleanup()
+            # cleanup may have removed agents
+            agents = [agent for agent in agents if agent.world is self]
+            for agent in agents:
+                agent.world = None
+            if len(agents) == registry.n and not self.observers and not registry.iterating:
+                self.storage.clear()
+                self.group_masks.clear()
+                registry.clear()
+                self.scheduler.clear()
+                self.events.clear()
+                return
+            self.events.remove_many(agents)
+            cells = {}
+            for agent in agents:
+                idx = agent.idx
+                _, pos = registry.remove(idx)
+                self.scheduler.remove(idx)
+                if pos is not None:
+                    self.group_masks.remove(pos.x, pos.y, agent.group_ids.mask)
+                    if self.observers:
+                        # observers see the agents removed one by one
+                        self.storage.remove(pos.x, pos.y, agent)
+                    else:
+                        cells.setdefault((pos.x, pos.y), set()).add(id(agent))
+                for observer in self.observers:
+                    observer.on_remove(agent, pos)
+            self.storage.remove_many(cells)
+
+    def detach_agent(self, idx):
+        # remove_agent without calling 'cleanup'
         agent = self.agents[idx]
-        agent.cleanup()
         agent.world = None
-        self.agents.pop(idx)
-        self.active_agents.pop(idx, None)
-        pos = self.agent_pos.pop(idx, None)
-        if pos:
-            self.at(pos).remove(agent)
+        self.events.remove(agent)
+        _, pos = self.agents.remove(idx)
+        self.scheduler.remove(idx)
+        if pos is not None:
+            self.storage.remove(pos.x, pos.y, agent)
+            self.group_masks.remove(pos.x, pos.y, agent.group_ids.mask)
+        for observer in self.observers:
+            observer.on_remove(agent, pos)
+
+    def sleep_agent(self, idx, n_steps=None, wake_on_event=True):
+        """
+        The agent skips its next 'n_steps' steps (all if None),
+        or until it receives an event if 'wake_on_event'.
+        """
+        wake_time = None
+        if n_steps is not None:
+            wake_time = self.time + n_steps + (1 if self.stepping else 0)
+        self.scheduler.sleep(idx, wake_time, wake_on_event)
+
+    def wake_agent(self, idx):
+        self.scheduler.wake(idx)
+
+    def add_population(self, population, xy=None):
+        """
+        Adds a population at the positions 'xy' (n x 2),
+        or at random positions if None.
+        """
+        n = population.n
+        if xy is None:
+            xy = self.rng.generator.integers(0, (self.w, self.h), (n, 2))
+        population.xy[:] = np.asarray(xy, dtype=np.int64).reshape(n, 2)
+        population.world = self
+        self.populations.append(population)
+        population.changed()
+        population.initialize()
+
+    def remove_population(self, population):
+        population.cleanup()
+        self.populations.remove(population)
+        population.changed()
+        population.world = None
+        for member in population.members:
+            if member is not None:
+                member.world = None
+        if self.group_counts is not None:
+            self.group_counts.population_changed(population)
 
     def move_agent(self, idx, pos):
+        x, y = pos
+        return self.move_agent_xy(idx, x, y)
+
+    def move_agent_relative(self, idx, rel_pos):
+        x, y = self.positions[idx]
+        dx, dy = rel_pos
+        return self.move_agent_xy(idx, x + dx, y + dy)
+
+    def move_agent_xy(self, idx, x, y):
+        # integer fast path, a position is only allocated for a successful move
         # Boundary check
-        if not self.is_inside_world(pos):
+        if not (0 <= x < self.w and 0 <= y < self.h):
             if self.torus_enabled:
-                pos = self.torus(pos)
+                x, y = x % self.w, y % self.h
             else:
+                if self.profiler is not None:
+                    self.profiler.failed_move(self.agents.slots[idx])
                 return False
 
+        # In synchronous steps, the move is only recorded, the last one per agent
+        # and step counts. It may still fail, see 'apply_intents'.
+        if self.intents is not None:
+            self.intents[idx] = (x, y)
+            return PENDING
+
         # Collision check
-        agent = self.agents[idx]
-        if self.would_collide(pos, agent.group_collision_ids):
+        agent = self.agents.slots[idx]
+        collision_mask = agent.group_collision_ids.mask
+        if collision_mask and self.would_collide_mask(x, y, collision_mask):
+            if self.profiler is not None:
+                self.profiler.failed_move(agent)
             return False
 
-        # Do move
-        old_pos = self.agent_pos[idx]
-        self.at(old_pos).remove(agent)
-        self.at(pos).append(agent)
-        self.agent_pos[idx] = pos
+        self.place_agent_xy(idx, agent, x, y)
         return True
 
-    def move_agent_relative(self, idx, rel_pos):
-        return self.move_agent(idx, self.agent_pos[idx] + rel_pos)
+    def place_agent_xy(self, idx, agent, x, y):
+        old_pos = self.positions[idx]
+        pos = Vec2D(x, y)
+        self.storage.remove(old_pos.x, old_pos.y, agent)
+        self.storage.add(x, y, agent)
+        mask = agent.group_ids.mask
+        if mask:
+            self.group_masks.remove(old_pos.x, old_pos.y, mask)
+            self.group_masks.add(x, y, mask)
+        self.positions[idx] = pos
+        for observer in self.observers:
+            observer.on_move(agent, old_pos, pos)
+
+    def apply_intents(self):
+        """
+        Applies the moves recorded in a synchronous step. The moves are tried
+        in idx order, an agent blocked by a collision is tried again after the
+        other moves, as long as moves succeed, so it can follow an agent moving
+        out of its way. Of several agents moving into the same cell, the
+        lowest idx moves first. Agents cannot swap cells if they collide.
+        Afterwards, agents which implement 'move_resolved' are told whether
+        their move was applied.
+        """
+        from pygridmas.agent import Agent
+        intents, self.intents = self.intents, None
+        slots, positions = self.agents.slots, self.positions
+        pending = sorted(intents.items())
+        failed = ()
+        while pending:
+            blocked = []
+            for idx, (x, y) in pending:
+                agent, pos = slots[idx], positions[idx]
+                # removed, or removed from the grid, in the step
+                if agent is None or pos is None or pos.x == x and pos.y == y:
+                    continue
+                collision_mask = agent.group_collision_ids.mask
+                if collision_mask and self.would_collide_mask(x, y, collision_mask):
+                    blocked.append((idx, (x, y)))
+                else:
+                    self.place_agent_xy(idx, agent, x, y)
+            if len(blocked) == len(pending):
+                failed = {idx for idx, _ in blocked}
+                if self.profiler is not None:
+                    for idx in failed:
+                        self.profiler.failed_move(slots[idx])
+                break
+            pending = blocked
+        # the base Agent.move_resolved does nothing
+        skip = {}
+        for idx in sorted(intents):
+            agent = slots[idx]
+            if agent is None:
+                continue
+            cls = type(agent)
+            if cls not in skip:
+                skip[cls] = cls.move_resolved is Agent.move_resolved
+            if not skip[cls]:
+                agent.move_resolved(idx not in failed and positions[idx] is not None)
+
+    def group_changed(self, agent, added, removed, old_mask):
+        pos = self.positions[agent.idx]
+        if pos is not None:
+            self.group_masks.remove(pos.x, pos.y, old_mask)
+            self.group_masks.add(pos.x, pos.y, agent.group_ids.mask)
+        for observer in self.observers:
+            observer.on_group_change(agent, pos, added, removed)
+
+    def color_changed(self, agent):
+        pos = self.positions[agent.idx]
+        for observer in self.observers:
+            observer.on_color(agent, pos)
 
     def would_collide(self, pos: Vec2D, group_collision_ids):
-        # TODO: possibly increase performance
-        if len(group_collision_ids) == 0: return False
-        for other_agent in self.at(pos):
-            other_agent_group_ids = other_agent.group_ids
-            for coll_id in group_collision_ids:
-                if coll_id in other_agent_group_ids:
-                    return True
+        x, y = pos
+        return self.would_collide_xy(x, y, group_collision_ids)
+
+    def would_collide_xy(self, x, y, group_collision_ids):
+        mask = getattr(group_collision_ids, 'mask', None)
+        if mask is None:
+            mask = group_mask(group_collision_ids)
+        return mask != 0 and self.would_collide_mask(x, y, mask)
+
+    def would_collide_mask(self, x, y, mask):
+        # a single lookup of the cell's group mask, however many agents are in it
+        if self.group_masks.get(x, y) & mask:
+            return True
+        for population in self.populations:
+            if group_mask(population.group_ids) & mask and population.count_at(x, y):
+                return True
         return False
 
     def torus(self, pos: Vec2D):
         return Vec2D(pos.x % self.w, pos.y % self.h)
 
     def is_inside_world(self, vec: Vec2D):
-        return 0 < vec.x < self.w and 0 < vec.y < self.h
+        return 0 <= vec.x < self.w and 0 <= vec.y < self.h
 
     def box_scan_no_torus(self, cx, cy, rng):
-        agents, m = [], self.m
-        xlo, xhi = max(cx - rng, 0), min(cx + rng, self.w - 1)
-        ylo, yhi = max(cy - rng, 0), min(cy + rng, self.h - 1)
-        for y in range(ylo, yhi + 1):
-            for x in range(xlo, xhi + 1):
-                agents += m[y][x]
-        return agents
+        return self.storage.box_scan_no_torus(cx, cy, rng)
 
     def box_scan_torus(self, cx, cy, rng):
-        agents, m = [], self.m
-        xlo, xhi = cx - rng, cx + rng
-        ylo, yhi = cy - rng, cy + rng
-        x_ranges = [(xlo, xhi)]
-        y_ranges = [(ylo, yhi)]
-        if xlo < 0:
-            x_ranges = [(xlo % self.w, self.w - 1), (0, xhi)]
-        elif xhi >= self.w:
-            x_ranges = [(xlo, self.w - 1), (0, xhi % self.w)]
-        if ylo < 0:
-            y_ranges = [(ylo % self.h, self.h - 1), (0, yhi)]
-        elif yhi >= self.h:
-            y_ranges = [(ylo, self.h - 1), (0, yhi % self.h)]
-        for y_range in y_ranges:
-            for x_range in x_ranges:
-                for y in range(y_range[0], y_range[1] + 1):
-                    for x in range(x_range[0], x_range[1] + 1):
-                        agents += m[y][x]
-        return agents
+        return self.storage.box_scan_torus(cx, cy, rng)
 
     def box_scan_sorted_no_torus(self, cx, cy, rng):
-        agents, m = [], self.m
-        agents += m[cy][cx]
-        for d in range(1, rng + 1):
-            xlo, xhi = cx - d, cx + d
-            ylo, yhi = cy - d, cy + d
-            _xlo, _xhi = max(0, xlo), min(self.w - 1, xhi)
-            _ylo, _yhi = max(0, ylo), min(self.h - 1, yhi)
-            if xhi < self.w:
-                for y in reversed(range(_ylo + 1, _yhi)):
-                    agents += m[y][xhi]
-            if ylo >= 0:
-                for x in reversed(range(_xlo, _xhi + 1)):
-                    agents += m[ylo][x]
-            if xlo >= 0:
-                for y in range(_ylo + 1, _yhi):
-                    agents += m[y][xlo]
-            if yhi < self.h:
-                for x in range(_xlo, _xhi + 1):
-                    agents += m[yhi][x]
-
-        return agents
+        return self.storage.box_scan_sorted_no_torus(cx, cy, rng)
 
     def box_scan_sorted_torus(self, cx, cy, rng):
-        size = rng * 2 + 1
-        assert (size <= self.w and size <= self.h)
-        agents, m = [], self.m
-        agents += m[cy][cx]
-        for d in range(1, rng + 1):
-            xlo, xhi = cx - d, cx + d
-            ylo, yhi = cy - d, cy + d
-            _xlo, _xhi = xlo % self.w, xhi % self.w
-            _ylo, _yhi = ylo % self.h, yhi % self.h
-
-            xrange = range(xlo, xhi + 1)
-            if xlo != _xlo:
-                xrange = itertools.chain(range(_xlo, self.w), range(xhi + 1))
-            elif xhi != _xhi:
-                xrange = itertools.chain(range(xlo, self.w), range(_xhi + 1))
-            yrange = range(ylo + 1, yhi)
-            if ylo != _ylo:
-                yrange = itertools.chain(range(_ylo + 1, self.h), range(yhi))
-            elif yhi != _yhi:
-                yrange = itertools.chain(range(ylo + 1, self.h), range(_yhi))
-            for y in reversed(list(yrange)):
-                agents += m[y][_xhi]
-            for x in reversed(list(xrange)):
-                agents += m[_ylo][x]
-            for y in yrange:
-                agents += m[y][_xlo]
-            for x in xrange:
-                agents += m[_yhi][x]
-
-        return agents
+        return self.storage.box_scan_sorted_torus(cx, cy, rng)
 
     @staticmethod
     def filter_agents_by_group_id(agents, group_id=None):
         if group_id is None:
             return agents
-        return [agent for agent in agents if group_id in agent.group_ids]
+        bit = group_bit(group_id)
+        return [agent for agent in agents if agent.group_ids.mask & bit]
 
     def box_scan(self, center_pos: Vec2D, rng, sort=True, group_id=None):
+        storage = self.storage
         if sort:
             if self.torus_enabled:
-                f = self.box_scan_sorted_torus
+                f = storage.box_scan_sorted_torus
             else:
-                f = self.box_scan_sorted_no_torus
+                f = storage.box_scan_sorted_no_torus
         else:
             if self.torus_enabled:
-                f = self.box_scan_torus
+                f = storage.box_scan_torus
             else:
-                f = self.box_scan_no_torus
+                f = storage.box_scan_no_torus
         agents = f(center_pos.x, center_pos.y, rng)
+        if self.profiler is not None:
+            self.profiler.scan(center_pos.x, center_pos.y, rng)
+        if self.populations:
+            agents = self.add_population_members(agents, center_pos, rng, sort)
         return self.filter_agents_by_group_id(agents, group_id)
 
+    def add_population_members(self, agents, center_pos, rng, sort):
+        members = []
+        for population in self.populations:
+            members += [population.member(i) for i in population.in_box(center_pos.x, center_pos.y, rng)]
+        if not members:
+            return agents
+        agents += members
+        if sort:
+            # stable, so agents in the same cell keep their order
+            def key(agent):
+                d = self.shortest_way(center_pos, agent.pos())
+                return ring_key(d.x, d.y)
+
+            agents.sort(key=key)
+        return agents
+
+    def scan_rings(self, center_pos: Vec2D, rng):
+        """
+        Lazy sorted box scan: yields (d, agents) for the rings d = 0..rng around
+        'center_pos', with agents a list of (dx, dy, agent) in the order of
+        box_scan(sort=True), including population members.
+        """
+        cx, cy = center_pos.x, center_pos.y
+        bounds = offset_bounds(cx, cy, self.w, self.h, self.torus_enabled)
+        profiler = self.profiler
+        for d, cells in self.storage.iter_rings(cx, cy, rng, self.torus_enabled):
+            if profiler is not None:
+                profiler.ring(bounds, d, d == 0)
+            agents = [(dx, dy, agent) for dx, dy, cell in cells for agent in cell]
+            if self.populations:
+                members = []
+                for population in self.populations:
+                    idx, offsets = population.in_ring(cx, cy, d, bounds)
+                    for i, (dx, dy) in zip(idx.tolist(), offsets.tolist()):
+                        members.append((dx, dy, population.member(i)))
+                if members:
+                    # stable, so agents in the same cell keep their order
+                    agents += members
+                    agents.sort(key=lambda a: ring_key(a[0], a[1]))
+            yield d, agents
+
+    def iter_box_scan(self, center_pos: Vec2D, rng, group_id=None):
+        """like box_scan(sort=True), but yields the agents lazily"""
+        for _, agents in self.scan_rings(center_pos, rng):
+            for _, _, agent in agents:
+                if group_id is None or group_id in agent.group_ids:
+                    yield agent
+
+    def first_match(self, center_pos: Vec2D, rng, predicate):
+        """the first agent within 'rng' in the order of the sorted box scan for which 'predicate' is true"""
+        for agent in self.iter_box_scan(center_pos, rng):
+            if predicate(agent):
+                return agent
+        return None
+
+    def nearest(self, center_pos: Vec2D, rng, group_id=None, metric='chebyshev', predicate=None):
+        """the nearest agent (of a group) within 'rng', or None"""
+        agents = self.k_nearest(center_pos, 1, metric, rng, group_id, predicate)
+        return agents[0] if agents else None
+
+    def k_nearest(self, center_pos: Vec2D, k, metric='chebyshev', rng=None, group_id=None, predicate=None):
+        """
+        The k nearest agents (of a group) within 'rng' (the whole world if None).
+        'metric' is 'chebyshev' (ties in the order of the sorted box scan)
+        or 'euclidean' (ties by chebyshev distance).
+        The scan stops as soon as the k nearest agents are known.
+        """
+        if rng is None:
+            rng = max(self.w, self.h)
+        if metric == 'chebyshev':
+            agents = self.iter_box_scan(center_pos, rng, group_id)
+            if predicate is not None:
+                agents = filter(predicate, agents)
+            return list(itertools.islice(agents, k))
+        if metric != 'euclidean':
+            raise ValueError("unknown metric '{}'".format(metric))
+        # the agents on ring d are at least d away, so the scan can stop at
+        # the first ring that is further away than the k-th nearest agent
+        found, n = [], 0
+        for d, ring in self.scan_rings(center_pos, rng):
+            if len(found) >= k and found[k - 1][0] <= d * d:
+                break
+            for dx, dy, agent in ring:
+                if group_id is not None and group_id not in agent.group_ids:
+                    continue
+                if predicate is not None and not predicate(agent):
+                    continue
+                found.append((dx * dx + dy * dy, n, agent))
+                n += 1
+            found.sort(key=lambda f: f[:2])
+            del found[k:]
+        return [agent for _, _, agent in found]
+
+    def box_row_cells(self, cx, cy, rng):
+        """
+        The box around (cx, cy) as arrays of (first, last) cell ids
+        (y * w + x) of its row segments.
+        """
+        if self.torus_enabled:
+            rects = self.storage.torus_ranges(cx, cy, rng)
+        else:
+            rects = [((max(cy - rng, 0), min(cy + rng, self.h - 1)), (max(cx - rng, 0), min(cx + rng, self.w - 1)))]
+        lo, hi = [], []
+        for (ylo, yhi), (xlo, xhi) in rects:
+            if ylo > yhi or xlo > xhi:
+                continue
+            y = np.arange(ylo, yhi + 1) * self.w
+            lo.append(y + xlo)
+            hi.append(y + xhi)
+        if not lo:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(lo), np.concatenate(hi)
+
+    def count_in_box(self, center_pos: Vec2D, rng, group_id=None):
+        """
+        Number of agents of a group (all agents if None) within 'rng',
+        like len(box_scan(...)) but from the group's count grid: O(1) while
+        its summed-area table is up to date, about the box area while agents
+        move between counts (see GroupCounts).
+        """
+        return self.get_group_counts().count(center_pos.x, center_pos.y, rng, group_id)
+
+    def count_in_box_all(self, rng, group_id=None):
+        """
+        'count_in_box' around every placed agent in one vectorized call.
+        Returns the arrays (agent ids, counts).
+        """
+        placed = [(idx, pos.x, pos.y) for idx, _, pos in self.agents.placed()]
+        placed = np.array(placed, dtype=np.int64).reshape(-1, 3)
+        ids, xy = placed[:, 0], placed[:, 1:]
+        counts = self.get_group_counts().count_many(xy[:, 0], xy[:, 1], rng, group_id)
+        return ids, counts
+
+    def get_group_counts(self):
+        if self.group_counts is None:
+            self.group_counts = GroupCounts(self)
+            self.add_observer(self.group_counts)
+        return self.group_counts
+
+    def get_navigation(self, capacity=16):
+        """the shared, cached flow fields of the world, see pygridmas/navigation.py"""
+        if self.navigation is None:
+            self.navigation = Navigation(self, capacity)
+            self.add_observer(self.navigation)
+        return self.navigation
+
+    def get_group_index(self):
+        if self.group_index is None:
+            self.group_index = GroupIndex(self)
+            self.add_observer(self.group_index)
+        return self.group_index
+
+    def agents_in_group(self, group_id):
+        """the agents of a group, from an index kept from the first call on"""
+        return list(self.get_group_index().members(group_id).values())
+
+    def get_statistics(self, capacity=1024):
+        if self.statistics is None:
+            self.statistics = Statistics(self, capacity)
+            self.add_observer(self.statistics)
+        return self.statistics
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def add_step_observer(self, observer):
+        """
+        Adds an observer only told about steps ('on_step') and the end of the world.
+        Unlike 'add_observer', it keeps the bulk paths of adding and removing agents.
+        """
+        self.step_observers.append(observer)
+
+    def remove_step_observer(self, observer):
+        self.step_observers.remove(observer)
+
     def shortest_way(self, a: Vec2D, b: Vec2D):
         """shortest vector from a to b"""
-        dx, dy = b.x - a.x, b.y - a.y
+        return Vec2D(*self.shortest_way_xy(a.x, a.y, b.x, b.y))
+
+    def shortest_way_xy(self, ax, ay, bx, by):
+        dx, dy = bx - ax, by - ay
         if self.torus_enabled:
             if abs(dx) > self.w * 0.5:
                 dx = dx - self.w if dx > 0 else dx + self.w
             if abs(dy) > self.h * 0.5:
                 dy = dy - self.h if dy > 0 else dy + self.h
-        return Vec2D(dx, dy)
+        return dx, dy
 
     def emit_event(self, agents, event_type, data=None):
-        self.event_emit_queue.append((agents, event_type, data))
+        self.events.emit(agents, event_type, data)
+
+    def broadcast(self, group_id, event_type, data=None, sender=None):
+        """
+        Emits an event to the agents of a group subscribed to its type, except
+        'sender', without a spatial scan. The receivers are the group's members
+        at the time of the broadcast.
+        """
+        subscribes = self.events.subscribes
+        agents = [agent for agent in self.get_group_index().members(group_id).values()
+                  if agent is not sender and subscribes(agent, event_type)]
+        self.events.emit(agents, event_type, data)
+
+    def send_event(self, idx, event_type, data=None):
+        """emits an event to the agent 'idx' only"""
+        self.events.emit((self.agents[idx],), event_type, data)
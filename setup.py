@@ -6,5 +6,6 @@ setup(
     version='0.0.1',
     install_requires=[
         'pyglet',
+        'numpy',
     ]
 )
@@ -0,0 +1,52 @@
+from pygridmas import World, Agent, Vec2D, Colors
+
+
+class TeamAgent(Agent):
+    color = Colors.BLUE
+    subscriptions = {'ping'}
+
+    def __init__(self, team):
+        # set before calling Agent.__init__
+        self.group_ids = {team}
+        self.color = Colors.RED
+        super().__init__()
+
+
+def test_values_set_before_super_init_are_kept():
+    agent = TeamAgent('t')
+    assert agent.group_ids == {'t'}
+    assert agent.color == Colors.RED
+    assert agent.subscriptions == {'ping'}
+    world = World(10, 10, seed=0)
+    world.add_agent(agent, Vec2D(1, 1))
+    assert world.agents_in_group('t') == [agent]
+
+
+def test_instances_get_their_own_sets():
+    a, b = TeamAgent('t'), TeamAgent('t')
+    a.group_ids.add('x')
+    a.subscriptions.add('pong')
+    assert b.group_ids == {'t'} and b.subscriptions == {'ping'}
+    assert TeamAgent.subscriptions == {'ping'}
+
+
+def test_class_defaults_are_readable_and_settable():
+    class Plain(Agent):
+        color = Colors.BLUE
+        group_ids = {1}
+
+    class Child(Plain):
+        pass
+
+    assert Plain.color == Colors.BLUE and Plain.group_ids == {1}
+    assert Agent.color == Colors.GREY50
+    Plain.color = Colors.GREEN
+    assert Plain().color == Colors.GREEN and Child().color == Colors.GREEN
+    assert Agent().color == Colors.GREY50
+
+
+def test_vec2d_allocations_per_step_are_bounded():
+    from pygridmas.benchmarks.vec2d_alloc import MAX_ALLOCATIONS, run
+    for agent_class, bound in MAX_ALLOCATIONS.items():
+        allocations, _ = run(agent_class, n=100, steps=10)
+        assert allocations <= bound, agent_class.__name__
@@ -0,0 +1,27 @@
+import random
+
+from pygridmas import World, Agent, Population, Vec2D
+
+
+class Walker(Agent):
+    group_ids = {1}
+
+
+class Walkers(Population):
+    group_ids = {1}
+
+
+def test_counts_match_box_scan_while_agents_move():
+    random.seed(0)
+    for torus in (False, True):
+        world = World(23, 17, torus_enabled=torus, seed=1)
+        world.add_agents([Walker() for _ in range(200)])
+        world.add_agents([Agent() for _ in range(50)])
+        world.add_population(Walkers(50))
+        ids = world.agents.keys()
+        for _ in range(300):
+            world.agents[random.choice(ids)].move_rel(Vec2D.random_grid_dir(world.rng))
+            pos = world.random_pos()
+            rng = random.randint(0, 8 if torus else 15)
+            for group_id in (None, 1):
+                assert world.count_in_box(pos, rng, group_id) == len(world.box_scan(pos, rng, group_id=group_id))
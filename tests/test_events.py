@@ -0,0 +1,94 @@
+from pygridmas import World, Agent, Vec2D
+
+
+class Listener(Agent):
+    subscriptions = {'ping'}
+
+    def initialize(self):
+        self.received = []
+
+    def receive_event(self, event_type, data):
+        self.received.append((event_type, data))
+
+
+class Member(Listener):
+    group_ids = {1}
+
+
+def test_agents_in_group_follow_group_changes():
+    world = World(10, 10, seed=0)
+    a, b, c = Member(), Member(), Listener()
+    world.add_agents([a, b, c])
+    assert world.agents_in_group(1) == [a, b]
+    c.group_ids.add(1)
+    a.group_ids.discard(1)
+    world.remove_agent(b.idx)
+    assert world.agents_in_group(1) == [c]
+    assert world.agents_in_group(2) == []
+
+
+def test_broadcast_and_send_event():
+    world = World(10, 10, seed=0)
+    sender, member, deaf, other = Member(), Member(), Member(), Listener()
+    deaf.subscriptions = {'pong'}
+    world.add_agents([sender, member, deaf, other])
+    # far away and asleep, broadcasts need no range and wake the receivers
+    member.move_to(Vec2D(9, 9))
+    member.sleep()
+    sender.broadcast(1, 'ping', 'hello')
+    sender.send_event(other.idx, 'ping', 'direct')
+    # delivered at the end of the step
+    assert member.received == other.received == []
+    world.events.flush()
+    assert member.received == [('ping', 'hello')]
+    assert member.is_awake()
+    assert other.received == [('ping', 'direct')]
+    assert sender.received == deaf.received == []
+
+
+class Shouter(Listener):
+    def step(self):
+        self.emit_event(self.world.w, 'ping', self.idx)
+
+
+def expected_receivers(world, x, y, rng, group_id, sender):
+    found = []
+    for idx, agent, pos in world.agents.placed():
+        dx, dy = abs(pos.x - x), abs(pos.y - y)
+        if world.torus_enabled:
+            dx, dy = min(dx, world.w - dx), min(dy, world.h - dy)
+        if dx <= rng and dy <= rng and agent is not sender and (group_id is None or group_id in agent.group_ids):
+            found.append(idx)
+    return found
+
+
+def test_both_resolutions_deliver_by_range_and_group_once():
+    for torus in False, True:
+        world = World(12, 9, torus_enabled=torus, seed=0)
+        agents = [Member() if i % 2 else Listener() for i in range(60)]
+        world.add_agents(agents)
+        events, rng = world.events, world.rng
+        emissions = []
+        for rng_ in (0, 1, 3, 5, 8, 20):
+            for group_id in None, 1:
+                sender = rng.choice(agents)
+                emissions.append((sender.pos().x, sender.pos().y, rng_, group_id, sender))
+        expected = [expected_receivers(world, *emission) for emission in emissions]
+        subscribers = events.subscribers['ping']
+        by_grid = [([], []) for _ in emissions]
+        events.resolve_by_grid(subscribers, emissions, by_grid)
+        by_candidates = [([], []) for _ in emissions]
+        events.resolve_by_candidates(list(subscribers), emissions, by_candidates)
+        for receivers in by_grid, by_candidates:
+            assert [sorted(agent.idx for agent in agents) for agents, _ in receivers] == expected
+
+
+def test_torus_ranges_larger_than_the_world_deliver_once():
+    world = World(4, 3, torus_enabled=True, seed=0)
+    # enough subscribers for the grid resolution of a 9 x 9 box, and one shouter
+    listeners = [Listener() for _ in range(9 * 9 * 32)]
+    shouter = Shouter()
+    world.add_agents(listeners + [shouter])
+    world.step()
+    for listener in listeners:
+        assert listener.received == [('ping', shouter.idx)]
@@ -0,0 +1,81 @@
+import struct
+
+import numpy as np
+
+from pygridmas import World, Agent, Vec2D, Colors
+from pygridmas.export import GifWriter, lzw_encode, render_world
+
+
+def lzw_decode(data, min_code_size):
+    """a plain GIF LZW decoder"""
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little').tolist()
+    clear = 1 << min_code_size
+    pos, out, prev = 0, [], None
+    table, size = None, None
+    while True:
+        code = sum(bits[pos + i] << i for i in range(size or min_code_size + 1))
+        pos += size or min_code_size + 1
+        if code == clear:
+            table, size, prev = [[i] for i in range(clear + 2)], min_code_size + 1, None
+            continue
+        if code == clear + 1:
+            return out
+        entry = table[code] if code < len(table) else prev + prev[:1]
+        if prev is not None and len(table) < 4096:
+            table.append(prev + entry[:1])
+        out += entry
+        prev = entry
+        if len(table) == 1 << size and size < 12:
+            size += 1
+
+
+def read_gif(path):
+    """the frames of a GIF written by GifWriter, as RGB images"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    w, h = struct.unpack('<HH', data[6:10])
+    pos = 13 + 19
+    frames = []
+    while data[pos] != 0x3b:
+        pos += 8
+        flags = data[pos + 9]
+        table = np.frombuffer(data[pos + 10:pos + 10 + 3 * (2 << (flags & 7))], dtype=np.uint8).reshape(-1, 3)
+        pos += 10 + len(table) * 3
+        min_code_size = data[pos]
+        pos += 1
+        blocks = bytearray()
+        while data[pos]:
+            blocks += data[pos + 1:pos + 1 + data[pos]]
+            pos += 1 + data[pos]
+        pos += 1
+        frames.append(table[lzw_decode(bytes(blocks), min_code_size)].reshape(h, w, 3))
+    return frames
+
+
+def test_lzw_codes_decode_to_the_indices():
+    rng = np.random.default_rng(0)
+    for indices in (rng.integers(0, 4, 5000), rng.integers(0, 256, 20000), np.zeros(100000, dtype=int),
+                    np.repeat(rng.integers(0, 4, 3000), rng.integers(1, 40, 3000)), np.array([3]), np.array([], dtype=int)):
+        min_code_size = max(2, int(indices.max(initial=0)).bit_length())
+        assert lzw_decode(lzw_encode(indices, min_code_size), min_code_size) == indices.tolist()
+
+
+def test_gif_frames_decode_to_the_images(tmp_path):
+    world = World(40, 30, seed=0)
+    agents = [Agent() for _ in range(300)]
+    world.add_agents(agents)
+    for agent in agents[::3]:
+        agent.color = Colors.RED
+    images = [render_world(world, scale=2)]
+    path = str(tmp_path / 'frames.gif')
+    with GifWriter(path) as gif:
+        gif.write(images[0])
+        agents[0].move_to(Vec2D(0, 0))
+        cells = render_world(world, scale=1, performance=True)
+        images.append(render_world(world, scale=2, performance=True))
+        # a performance mode frame written at cell resolution
+        gif.write(cells, 2)
+    frames = read_gif(path)
+    assert len(frames) == 2
+    for frame, image in zip(frames, images):
+        assert (frame == image).all()
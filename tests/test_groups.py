@@ -0,0 +1,42 @@
+import copy
+import pickle
+
+from pygridmas import World, Agent, Vec2D
+
+
+class Member(Agent):
+    group_ids = {1}
+
+
+class Mover(Agent):
+    group_collision_ids = {2}
+
+
+def test_pickled_agents_report_group_changes():
+    world = World(5, 5, seed=0)
+    for clone in (pickle.loads(pickle.dumps(Member())), copy.deepcopy(Member())):
+        assert clone.group_ids.agent is clone
+        world.add_agent(clone, Vec2D(1, 1))
+        mover = Mover()
+        world.add_agent(mover, Vec2D(0, 1))
+        clone.group_ids.add(2)
+        assert not mover.move_to(Vec2D(1, 1))
+        clone.group_ids.discard(2)
+        assert mover.move_to(Vec2D(1, 1))
+        world.remove_agents(world.agents.keys())
+
+
+def test_forks_have_their_own_group_sets():
+    world = World(5, 5, seed=0)
+    agent = Member()
+    world.add_agent(agent, Vec2D(2, 2))
+    fork = world.fork()
+    clone = fork.agents[agent.idx]
+    clone.group_ids.add(2)
+    assert agent.group_ids == {1} and clone.group_ids == {1, 2}
+    assert fork.would_collide(Vec2D(2, 2), {2})
+    assert not world.would_collide(Vec2D(2, 2), {2})
+    agent.group_ids.clear()
+    assert not world.would_collide(Vec2D(2, 2), {1})
+    assert fork.would_collide(Vec2D(2, 2), {1})
+    assert fork.agents_in_group(1) == [clone] and world.agents_in_group(1) == []
@@ -0,0 +1,71 @@
+import numpy as np
+
+from pygridmas import World, Agent, Vec2D
+
+
+class Target(Agent):
+    group_ids = {2}
+
+
+def test_fields_are_recomputed_once_per_step():
+    world = World(20, 1, seed=0)
+    target = Target()
+    world.add_agent(target, Vec2D(10, 0))
+    navigation = world.get_navigation()
+    field = navigation.field(group_id=2)
+    assert field.move_at(0, 0) == Vec2D(1, 0)
+    target.move_to(Vec2D(0, 0))
+    # reused within the step it was computed in
+    assert navigation.field(group_id=2) is field
+    world.step()
+    field = navigation.field(group_id=2)
+    assert field.move_at(5, 0) == Vec2D(-1, 0)
+    assert field.distance[0, 5] == 5
+
+
+class Wall(Agent):
+    group_ids = {3}
+
+
+def test_fields_go_around_obstacles():
+    # a wall at x = 5 from y = 0 to 3, the way around it is below, through y = 4
+    world = World(10, 5, seed=0)
+    for y in range(4):
+        world.add_agent(Wall(), Vec2D(5, y))
+    field = world.get_navigation().field(targets=Vec2D(9, 0), obstacles={3})
+    assert field.distance[0, 4] == 8
+    assert np.isinf(field.distance[0, 5])
+    assert field.move_at(4, 0) == Vec2D(0, 1)
+    assert field.move_at(5, 4) == Vec2D(1, -1)
+    x, y, n = 0, 0, 0
+    while (x, y) != (9, 0):
+        move = field.move_at(x, y)
+        x, y, n = x + move.x, y + move.y, n + 1
+        assert (x, y) not in [(5, y) for y in range(4)]
+    assert n == field.distance[0, 0] == 9
+    # with diagonal moves costing more, the distances are weighted
+    weighted = world.get_navigation().field(targets=Vec2D(9, 0), obstacles={3}, diagonal=1.5)
+    assert weighted.distance[0, 4] == 3 + 5 * 1.5
+
+
+def test_fields_wrap_around_the_torus():
+    world = World(10, 6, torus_enabled=True, seed=0)
+    field = world.get_navigation().field(targets=Vec2D(0, 0))
+    assert field.move_at(8, 0) == Vec2D(1, 0)
+    assert field.move_at(9, 5) == Vec2D(1, 1)
+    assert field.distance[3, 5] == 5
+    assert field.distance.max() == 5
+
+
+def test_least_recently_used_fields_are_evicted():
+    world = World(10, 10, seed=0)
+    navigation = world.get_navigation()
+    navigation.capacity = 2
+    a = navigation.field(targets=Vec2D(0, 0))
+    b = navigation.field(targets=Vec2D(9, 9))
+    assert navigation.field(targets=Vec2D(0, 0)) is a
+    navigation.field(targets=Vec2D(5, 5))
+    # b was used least recently
+    assert len(navigation.fields) == 2
+    assert navigation.field(targets=Vec2D(0, 0)) is a
+    assert navigation.field(targets=Vec2D(9, 9)) is not b
@@ -0,0 +1,32 @@
+from pygridmas import PartitionedWorld, Agent, Vec2D
+
+
+class Regrouping(Agent):
+    group_ids = {1}
+    group_collision_ids = {3}
+
+    def step(self):
+        # changes groups in its tile, then moves into the next one
+        t = self.world.time
+        if t == 0:
+            self.group_ids.add(5)
+        elif t == 1:
+            self.group_ids.discard(1)
+        self.move_rel(Vec2D(1, 0))
+
+
+def test_agents_changing_groups_migrate():
+    world = PartitionedWorld(8, 4, tiles=(2, 1), halo=2)
+    try:
+        for y in range(4):
+            world.add_agent(Regrouping(), Vec2D(2, y))
+        for _ in range(4):
+            world.step()
+        snapshot = world.gather()
+    finally:
+        world.end()
+    agents = snapshot.agents.values()
+    assert len(agents) == 4
+    assert sorted(agent.pos() for agent in agents) == [Vec2D(6, y) for y in range(4)]
+    assert all(agent.group_ids == {5} for agent in agents)
+    assert [agent.pos() for agent in snapshot.agents_in_group(5)] == [Vec2D(6, y) for y in range(4)]
@@ -0,0 +1,46 @@
+from pygridmas import World, Agent, Vec2D, Recorder, Recording, ReplayWorld
+
+
+class Walker(Agent):
+    def step(self):
+        self.move_rel(Vec2D(1, 0))
+
+
+def test_record_and_replay_with_default_arguments(tmp_path):
+    world = World(10, 10, seed=0)
+    recorder = Recorder(world, str(tmp_path))
+    assert recorder not in world.observers
+    world.step()
+    walker = Walker()
+    world.add_agent(walker, Vec2D(0, 0))
+    world.step()
+    world.step()
+    world.end()
+    recording = Recording(str(tmp_path))
+    assert len(recording) == 4
+    assert [frame['time'] for frame in recording] == [0, 1, 2, 3]
+    assert len(recording.frame(0)['id']) == 0
+    assert recording.frame(3)['id'].tolist() == [walker.idx]
+    assert recording.frame(3)['xy'].tolist() == [[2, 0]]
+    replay = ReplayWorld(recording)
+    replay.seek(2)
+    assert replay.time == 2
+    assert [agent.idx for agent in replay.get(1, 0)] == [walker.idx]
+    replay.step()
+    replay.step()
+    assert replay.time == 3 and len(replay.get(2, 0)) == 1
+
+
+def test_recorded_fields(tmp_path):
+    world = World(5, 5, seed=0)
+    agent = Walker()
+    agent.energy = 2.5
+    world.add_agent(agent, Vec2D(1, 1))
+    world.add_agent(Walker(), Vec2D(2, 2))
+    with Recorder(world, str(tmp_path), fields=('energy',), every=2):
+        for _ in range(4):
+            world.step()
+    recording = Recording(str(tmp_path))
+    assert [frame['time'] for frame in recording] == [0, 2, 4]
+    energy = recording.frame(0)['energy']
+    assert energy[0] == 2.5 and energy[1] != energy[1]
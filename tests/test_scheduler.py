@@ -0,0 +1,67 @@
+from pygridmas import World, Agent
+
+
+class Counter(Agent):
+    def initialize(self):
+        self.n = 0
+
+    def step(self):
+        self.n += 1
+
+
+class Slow(Counter):
+    step_period = 3
+
+
+def test_sleep_and_step_periods():
+    world = World(10, 10, seed=0)
+    slow, sleeper, plain = Slow(), Counter(), Counter()
+    world.add_agent(slow)
+    world.add_agent(sleeper)
+    world.add_agents([plain])
+    world.sleep_agent(sleeper.idx, 2)
+    for _ in range(9):
+        world.step()
+    assert (slow.n, sleeper.n, plain.n) == (3, 7, 9)
+    plain.step_period = 2
+    for _ in range(4):
+        world.step()
+    assert (slow.n, sleeper.n, plain.n) == (5, 11, 11)
+    assert list(world.active_agents) == [sleeper.idx]
+    assert list(world.fork().active_agents) == [sleeper.idx]
+
+
+class Waker(Counter):
+    def step(self):
+        super().step()
+        for idx in self.world.agents:
+            self.world.wake_agent(idx)
+
+
+def test_idle_agents_are_not_walked():
+    world = World(100, 100, seed=0)
+    agents = [Counter() for _ in range(10000)]
+    world.add_agents(agents)
+    for agent in agents:
+        world.sleep_agent(agent.idx)
+    world.step()
+    scheduler = world.scheduler
+    # the emptied dict of awake idx is compacted instead of being walked
+    assert len(scheduler.awake_ids) == 0 and scheduler.n_deleted == 0
+    assert list(scheduler.due(len(world.agents.slots))) == []
+    world.wake_agent(agents[7].idx)
+    world.wake_agent(agents[3].idx)
+    assert list(scheduler.due(len(world.agents.slots))) == [agents[3].idx, agents[7].idx]
+    world.step()
+    assert sum(agent.n for agent in agents) == 2
+
+
+def test_agents_woken_during_the_step_are_stepped_next_step():
+    world = World(10, 10, seed=0)
+    waker, sleeper = Waker(), Counter()
+    world.add_agents([waker, sleeper])
+    world.sleep_agent(sleeper.idx)
+    world.step()
+    assert sleeper.n == 0 and sleeper.is_awake()
+    world.step()
+    assert sleeper.n == 1
@@ -0,0 +1,73 @@
+import io
+
+from pygridmas import World, Agent, Vec2D
+
+
+class Walker(Agent):
+    group_ids = {1}
+    group_collision_ids = {1}
+    subscriptions = {'ping'}
+    fields = ('energy',)
+
+    def initialize(self):
+        self.energy = 1.0
+
+
+class Slow(Agent):
+    step_period = 3
+
+
+def state(world):
+    return [(idx, type(agent), world.positions[idx], set(agent.group_ids), agent.group_ids.mask,
+             agent.subscriptions, agent.step_period, getattr(agent, 'energy', None))
+            for idx, agent in world.agents.items()]
+
+
+def check(world, copy):
+    assert state(copy) == state(world)
+    assert copy.agents.free == world.agents.free
+    assert list(copy.active_agents) == list(world.active_agents)
+    assert copy.scheduler.periods == world.scheduler.periods
+    assert copy.group_masks.masks == world.group_masks.masks
+    for idx, agent in copy.agents.items():
+        assert agent.world is copy and agent.idx == idx
+        pos = copy.positions[idx]
+        if pos is not None:
+            assert agent in copy.at(pos)
+
+
+def test_restore_and_fork_rebuild_the_world():
+    world = World(20, 20, seed=0)
+    world.add_agents([Walker() for _ in range(100)])
+    world.add_agents([Slow() for _ in range(10)], False)
+    world.remove_agents(range(0, 100, 7))
+    world.agents[1].energy = 0.5
+    world.sleep_agent(2, 5)
+    world.step()
+    f = io.BytesIO()
+    world.snapshot(f)
+    f.seek(0)
+    restored = World.restore(f)
+    check(world, restored)
+    fork = world.fork()
+    check(world, fork)
+    fork.agents[1].group_ids.add(2)
+    assert world.agents[1].group_ids == {1}
+    assert fork.would_collide(fork.positions[1], {2})
+    assert not world.would_collide(world.positions[1], {2})
+
+
+def test_free_slots_at_the_end_are_kept():
+    world = World(10, 10, seed=0)
+    world.add_agents([Walker() for _ in range(10)])
+    world.remove_agents([8, 9])
+    f = io.BytesIO()
+    world.snapshot(f)
+    f.seek(0)
+    for copy in (World.restore(f), world.fork()):
+        check(world, copy)
+        assert len(copy.agents.slots) == 10
+        agent = Walker()
+        copy.add_agent(agent)
+        assert agent.idx in (8, 9) and copy.agents[agent.idx] is agent
+        copy.step()
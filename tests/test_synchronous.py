@@ -0,0 +1,26 @@
+from pygridmas import World, Agent, Vec2D, PENDING
+
+
+class Mover(Agent):
+    group_ids = {1}
+    group_collision_ids = {1}
+
+    def initialize(self):
+        self.results = []
+
+    def step(self):
+        self.results.append(self.move_to(Vec2D(1, 0)))
+
+    def move_resolved(self, moved):
+        self.results.append(moved)
+
+
+def test_recorded_moves_are_pending_until_resolved():
+    world = World(3, 1, synchronous=True, seed=0)
+    left, right = Mover(), Mover()
+    world.add_agent(left, Vec2D(0, 0))
+    world.add_agent(right, Vec2D(2, 0))
+    world.step()
+    assert left.results == [PENDING, True]
+    assert right.results == [PENDING, False]
+    assert left.pos() == Vec2D(1, 0) and right.pos() == Vec2D(2, 0)